@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+"""Compares the json backends used by ``toxicintegrations.codec``
+decoding the payloads recorded in testdata/.
+
+Usage: python scripts/bench_codec.py [number]
+"""
+
+import glob
+import json
+import os
+import sys
+import timeit
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'testdata')
+
+
+def stdlib_loads(data):
+    # what we did before: decode to str and parse.
+    return json.loads(data.decode())
+
+
+def bench(fn, data, number):
+    return min(timeit.repeat(lambda: fn(data), number=number, repeat=5))
+
+
+def main(number):
+    if orjson is None:
+        print('orjson is not installed. pip install orjson')
+        sys.exit(1)
+
+    fmt = '{:<32} {:>12} {:>12} {:>8}'
+    print(fmt.format('payload', 'stdlib (us)', 'orjson (us)', 'speedup'))
+    for fname in sorted(glob.glob(os.path.join(DATA_DIR, '*.json'))):
+        with open(fname, 'rb') as fd:
+            data = fd.read()
+
+        std = bench(stdlib_loads, data, number) / number * 1e6
+        fast = bench(orjson.loads, data, number) / number * 1e6
+        print(fmt.format(os.path.basename(fname), '{:.1f}'.format(std),
+                         '{:.1f}'.format(fast),
+                         '{:.1f}x'.format(std / fast)))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -19,6 +19,7 @@
 from unittest import TestCase
 from unittest.mock import patch, Mock, AsyncMock
 
+from toxicintegrations import requests
 from toxicintegrations.notifications import bitbucket
 
 from tests import async_test
@@ -36,8 +37,7 @@ class BitbucketCommitStatusNotificationTest(TestCase):
     @patch.object(bitbucket.BitbucketIntegration, 'get_headers',
                   AsyncMock(
                       spec=bitbucket.BitbucketIntegration.get_headers))
-    @patch.object(bitbucket.requests, 'post', AsyncMock(
-        spec=bitbucket.requests.post))
+    @patch.object(requests, 'post', AsyncMock(spec=requests.post))
     @async_test
     async def test_run(self):
         build_info = {
@@ -53,7 +53,36 @@ class BitbucketCommitStatusNotificationTest(TestCase):
             'named_tree': 'the-sha',
         }
 
-        await self.notification.run(build_info)
+        requests.post.return_value = Mock(status=201, headers={})
 
+        r = await self.notification.run(build_info)
+
+        self.assertTrue(r)
         self.assertTrue(bitbucket.BitbucketIntegration.get_headers.called)
-        self.assertTrue(bitbucket.requests.post.called)
+        self.assertTrue(requests.post.called)
+
+    @patch.object(bitbucket.BitbucketIntegration, 'get_headers',
+                  AsyncMock(
+                      spec=bitbucket.BitbucketIntegration.get_headers))
+    @patch.object(requests, 'post', AsyncMock(spec=requests.post))
+    @patch.object(bitbucket.BitbucketCommitStatusNotification, 'log', Mock())
+    @async_test
+    async def test_run_bad_request(self):
+        build_info = {
+            'repository': {
+                'external_full_name': 'user/repo'
+            },
+            'builder': {
+                'name': 'the-builder'
+            },
+            'number': 1,
+            'uuid': 'the-uuid',
+            'status': 'running',
+            'named_tree': 'the-sha',
+        }
+        requests.post.return_value = Mock(status=400, headers={},
+                                          text='error')
+
+        r = await self.notification.run(build_info)
+
+        self.assertFalse(r)
@@ -22,6 +22,7 @@ from uuid import uuid4
 
 from toxiccore.utils import localtime2utc, datetime2string, now
 
+from toxicintegrations import requests
 from toxicintegrations.github import GithubIntegration
 from toxicintegrations.notifications import github
 
@@ -95,8 +96,7 @@ class GithubCheckRunNotificationTest(TestCase):
                                               conclusion)
         self.assertEqual(payload, expected)
 
-    @patch.object(github.requests, 'post', AsyncMock(
-        spec=github.requests.post))
+    @patch.object(requests, 'post', AsyncMock(spec=requests.post))
     @patch.object(GithubIntegration, 'get_header', AsyncMock(
         spec=GithubIntegration.get_header))
     @async_test
@@ -116,8 +116,32 @@ class GithubCheckRunNotificationTest(TestCase):
         ret = MagicMock()
         ret.text = ''
         ret.status = 201
-        github.requests.post.return_value = ret
+        requests.post.return_value = ret
 
         await self.check_run._send_message(buildset_info, run_status,
                                            conclusion)
-        self.assertTrue(github.requests.post.called)
+        self.assertTrue(requests.post.called)
+
+    @patch.object(requests, 'post', AsyncMock(spec=requests.post))
+    @patch.object(GithubIntegration, 'get_header', AsyncMock(
+        spec=GithubIntegration.get_header))
+    @async_test
+    async def test_send_message_bad_request(self):
+        self.check_run.sender = {'id': 'some-id',
+                                 'full_name': 'bla/ble',
+                                 'external_full_name': 'ble/ble'}
+        buildset_info = {'branch': 'master', 'commit': '123adf',
+                         'started': None, 'finished': None,
+                         'id': 'some-id'}
+        ret = MagicMock()
+        ret.text = 'error'
+        ret.status = 422
+        ret.headers = {}
+        requests.post.return_value = ret
+        self.check_run.log = MagicMock()
+
+        await self.check_run._send_message(buildset_info, 'in_progress',
+                                           None)
+        levels = [c[1].get('level') for c in
+                  self.check_run.log.call_args_list]
+        self.assertIn('error', levels)
@@ -21,6 +21,7 @@ from unittest.mock import patch, MagicMock, AsyncMock
 from uuid import uuid4
 
 from toxicintegrations.gitlab import GitlabIntegration
+from toxicintegrations import requests
 from toxicintegrations.notifications import gitlab
 
 from tests import async_test
@@ -55,8 +56,7 @@ class GitlabCommitStatusNotificationTest(TestCase):
 
     @patch.object(GitlabIntegration, 'get_headers', AsyncMock(
         spec=GitlabIntegration.get_headers))
-    @patch.object(gitlab.requests, 'post', AsyncMock(
-        spec=gitlab.requests.post))
+    @patch.object(requests, 'post', AsyncMock(spec=requests.post))
     @async_test
     async def test_send_message(self):
         self.notif.sender = {'id': 'some-id',
@@ -69,7 +69,30 @@ class GitlabCommitStatusNotificationTest(TestCase):
         ret = MagicMock()
         ret.text = ''
         ret.status = 201
-        gitlab.requests.post.return_value = ret
+        requests.post.return_value = ret
 
         await self.notif._send_message(buildset_info)
-        self.assertTrue(gitlab.requests.post.called)
+        self.assertTrue(requests.post.called)
+
+    @patch.object(GitlabIntegration, 'get_headers', AsyncMock(
+        spec=GitlabIntegration.get_headers))
+    @patch.object(requests, 'post', AsyncMock(spec=requests.post))
+    @async_test
+    async def test_send_message_bad_request(self):
+        self.notif.sender = {'id': 'some-id',
+                             'full_name': 'bla/ble',
+                             'external_full_name': 'ble/ble'}
+        buildset_info = {'branch': 'master', 'commit': '123adf',
+                         'status': 'exception',
+                         'id': 'some-id'}
+
+        ret = MagicMock()
+        ret.text = 'error'
+        ret.status = 400
+        ret.headers = {}
+        requests.post.return_value = ret
+        self.notif.log = MagicMock()
+
+        await self.notif._send_message(buildset_info)
+        levels = [c[1].get('level') for c in self.notif.log.call_args_list]
+        self.assertIn('error', levels)
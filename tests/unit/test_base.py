@@ -16,6 +16,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import datetime
 from unittest import TestCase
 from unittest.mock import patch, Mock, MagicMock, AsyncMock
@@ -27,10 +28,31 @@ from toxicintegrations import base
 from tests import async_test, create_autospec
 
 
+class MatchBranchesTest(TestCase):
+
+    def test_match_branches(self):
+        branches = {'main': 'sha0', 'release-1': 'sha1', 'other': 'sha2'}
+        configured = [{'name': 'main'}, {'name': 'release-*'}]
+
+        r = base.match_branches(branches, configured)
+
+        self.assertEqual(r, {'main': 'sha0', 'release-1': 'sha1'})
+
+    def test_match_branches_not_configured(self):
+        r = base.match_branches({'master-old': 'sha'},
+                                base.DEFAULT_BRANCHES)
+
+        self.assertEqual(r, {})
+
+
 class BaseIntegrationApp(TestCase):
 
     def setUp(self):
         self.app = base.BaseIntegrationApp(webhook_token='token')
+        base.BaseIntegrationApp.invalidate_cache()
+
+    def tearDown(self):
+        base.BaseIntegrationApp.invalidate_cache()
 
     @async_test
     async def test_create_app(self):
@@ -70,6 +92,87 @@ class BaseIntegrationApp(TestCase):
         self.assertTrue(r)
         self.assertTrue(base.BaseIntegrationApp.create_app.called)
 
+    @patch.object(base.BaseIntegrationApp, 'objects', Mock())
+    @async_test
+    async def test_get_app_cached(self):
+        base.BaseIntegrationApp.objects.first = AsyncMock(
+            return_value=Mock())
+        app = await base.BaseIntegrationApp.get_app()
+        rapp = await base.BaseIntegrationApp.get_app()
+
+        self.assertIs(app, rapp)
+        self.assertEqual(
+            len(base.BaseIntegrationApp.objects.first.call_args_list), 1)
+
+    @patch.object(base.BaseIntegrationApp, 'objects', Mock())
+    @async_test
+    async def test_invalidate_cache(self):
+        base.BaseIntegrationApp.objects.first = AsyncMock(
+            return_value=Mock())
+        await base.BaseIntegrationApp.get_app()
+        base.BaseIntegrationApp.invalidate_cache()
+        await base.BaseIntegrationApp.get_app()
+
+        self.assertEqual(
+            len(base.BaseIntegrationApp.objects.first.call_args_list), 2)
+
+
+class ExternalInstallationRepositoryTest(TestCase):
+
+    @async_test
+    async def setUp(self):
+        self.integration = base.BaseIntegration(user_id='some-id',
+                                                user_name='zé')
+        await self.integration.save()
+
+    @async_test
+    async def tearDown(self):
+        await base.BaseIntegration.drop_collection()
+        await base.ExternalInstallationRepository.drop_collection()
+        base.BaseIntegration.clear_cache()
+
+    @async_test
+    async def test_add_concurrent(self):
+        await asyncio.gather(*[
+            base.ExternalInstallationRepository.add(
+                self.integration, i, 'repo-{}'.format(i), 'a/{}'.format(i))
+            for i in range(5)])
+
+        repos = await self.integration.get_repositories()
+        self.assertEqual(len(repos), 5)
+
+    @async_test
+    async def test_add_existing(self):
+        await base.ExternalInstallationRepository.add(
+            self.integration, '{A-UUID}', 'repo-id', 'a/b')
+        await base.ExternalInstallationRepository.add(
+            self.integration, 'a-uuid', 'other-id', 'a/c')
+
+        repos = await self.integration.get_repositories()
+        self.assertEqual(len(repos), 1)
+        self.assertEqual(repos[0].repository_id, 'other-id')
+
+    @async_test
+    async def test_bulk_add(self):
+        repos = [{'external_id': 1, 'repository_id': 'repo-1',
+                  'full_name': 'a/b'},
+                 {'external_id': 2, 'repository_id': 'repo-2',
+                  'full_name': 'a/c'}]
+
+        count = await base.ExternalInstallationRepository.bulk_add(
+            self.integration.id, repos)
+
+        self.assertEqual(count, 2)
+        install_repo = await self.integration._get_install_repo(2)
+        self.assertEqual(install_repo.repository_id, 'repo-2')
+
+    @async_test
+    async def test_bulk_add_no_repos(self):
+        count = await base.ExternalInstallationRepository.bulk_add(
+            self.integration.id, [])
+
+        self.assertEqual(count, 0)
+
 
 @patch('toxiccommon.client.HoleClient.connect',
        AsyncMock())
@@ -101,7 +204,20 @@ class BaseIntegrationTest(TestCase):
     async def tearDown(self):
         await base.BaseIntegrationApp.drop_collection()
         await base.BaseIntegration.drop_collection()
+        await base.ExternalInstallationRepository.drop_collection()
         await base.Notification.drop_collection()
+        base.BaseIntegration.clear_cache()
+
+    async def _create_install_repo(self, external_id, repository_id='repo-id',
+                                   full_name='a/b'):
+        if not self.integration.id:
+            await self.integration.save()
+        install_repo = base.ExternalInstallationRepository(
+            installation=self.integration,
+            external_id=base.normalize_external_id(external_id),
+            repository_id=repository_id, full_name=full_name)
+        await install_repo.save()
+        return install_repo
 
     @patch.object(base.BaseIntegration, 'import_repositories',
                   AsyncMock())
@@ -135,18 +251,45 @@ class BaseIntegrationTest(TestCase):
         install = await base.BaseIntegration.create(self.user)
         self.assertFalse(install.save.called)
 
+    @async_test
+    async def test_get_cached(self):
+        await self.integration.save()
+        base.BaseIntegration.clear_cache()
+        stats = base.BaseIntegration.get_cache_stats()
+
+        install = await base.BaseIntegration.get_cached(
+            id=self.integration.id)
+        rinstall = await base.BaseIntegration.get_cached(
+            id=str(self.integration.id))
+
+        self.assertIs(install, rinstall)
+        new_stats = base.BaseIntegration.get_cache_stats()
+        self.assertEqual(new_stats['misses'], stats['misses'] + 1)
+        self.assertEqual(new_stats['hits'], stats['hits'] + 1)
+
+    @async_test
+    async def test_save_writes_to_cache(self):
+        await self.integration.save()
+
+        install = await base.BaseIntegration.get_cached(
+            id=self.integration.id)
+
+        self.assertIs(install, self.integration)
+
+    @patch.object(base.RepositoryInterface, 'get', AsyncMock())
+    @async_test
+    async def test_delete_removes_from_cache(self):
+        await self.integration.save()
+        await self.integration.delete(MagicMock())
+
+        with self.assertRaises(base.BaseIntegration.DoesNotExist):
+            await base.BaseIntegration.get_cached(id=self.integration.id)
+
     @async_test
     async def test_list_repos(self):
         with self.assertRaises(NotImplementedError):
             await self.integration.list_repos()
 
-    @patch.object(base, 'settings', Mock())
-    def test_get_import_chunks(self):
-        base.settings.PARALLEL_IMPORTS = 1
-        repos = [Mock(), Mock()]
-        chunks = self.integration._get_import_chunks(repos)
-        self.assertEqual(len(list(chunks)), 2)
-
     @async_test
     async def test_request_access_token(self):
         with self.assertRaises(NotImplementedError):
@@ -204,38 +347,47 @@ class BaseIntegrationTest(TestCase):
         self.assertEqual(len(base.RepositoryInterface.get.call_args_list), 2)
         self.assertTrue(base.sleep.called)
 
-    @patch.object(base.BaseIntegration, '_wait_clone',
-                  AsyncMock(
-                      spec=base.BaseIntegration._wait_clone))
+    @patch.object(base.ImportPipeline, 'run', AsyncMock(
+        spec=base.ImportPipeline.run))
     @async_test
     async def test_import_repositories(self):
-        self.integration.list_repos = AsyncMock(return_value=[
-            Mock(), Mock()])
-
-        repo = Mock(spec=base.RepositoryInterface(None, {}))
-        repo.request_code_update = AsyncMock()
-        self.integration.import_repository = AsyncMock(return_value=repo)
         await self.integration.import_repositories()
-        self.assertEqual(
-            len(self.integration.import_repository.call_args_list), 2)
+
+        self.assertTrue(base.ImportPipeline.run.called)
 
     @patch.object(base.BaseIntegration, '_wait_clone',
                   AsyncMock(
                       spec=base.BaseIntegration._wait_clone))
-    @patch.object(base.BaseIntegration, 'log', Mock())
     @async_test
-    async def test_import_repositories_error(self):
-        self.integration.list_repos = AsyncMock(return_value=[
-            {'name': 'bla'}, {'name': 'ble'}])
-        repo = Mock()
+    async def test_clone_repository(self):
+        repo = Mock(spec=base.RepositoryInterface(None, {}))
         repo.request_code_update = AsyncMock()
-        repo._wait_update = AsyncMock()
-        self.integration.import_repository = AsyncMock(
-            side_effect=[repo, Exception, False, Exception])
-        repos = await self.integration.import_repositories()
-        self.assertEqual(
-            len(self.integration.import_repository.call_args_list), 2)
-        self.assertEqual(len(repos), 1)
+
+        await self.integration.clone_repository(repo)
+
+        self.assertTrue(repo.request_code_update.called)
+        self.assertTrue(self.integration._wait_clone.called)
+
+    @patch.object(base.SlaveInterface, 'list', AsyncMock(
+        spec=base.SlaveInterface.list))
+    @patch.object(base.RepositoryInterface, 'add', AsyncMock(
+        spec=base.RepositoryInterface.add,
+        return_value=base.RepositoryInterface(None, {'id': 'repo-id'})))
+    @async_test
+    async def test_add_repository_slaves_names(self):
+        repo_info = {'name': 'my-repo', 'clone_url': 'git@github.com/bla',
+                     'id': 1234, 'full_name': 'ze/my-repo'}
+        self.integration.get_auth_url = AsyncMock(
+            return_value='https://some-url')
+        await self.integration.save()
+
+        repo = await self.integration.add_repository(
+            repo_info, slaves_names=['some-slave'])
+
+        self.assertEqual(repo.id, 'repo-id')
+        self.assertFalse(base.SlaveInterface.list.called)
+        kw = base.RepositoryInterface.add.call_args[1]
+        self.assertEqual(kw['slaves'], ['some-slave'])
 
     @patch.object(base.RepositoryInterface, 'request_code_update',
                   AsyncMock(
@@ -246,10 +398,14 @@ class BaseIntegrationTest(TestCase):
                       return_value=[]))
     @patch.object(base.BaseIntegration, 'post_import_hooks',
                   AsyncMock(spec=base.BaseIntegration.post_import_hooks))
+    @patch.object(base.BaseIntegration, '_wait_clone',
+                  AsyncMock(spec=base.BaseIntegration._wait_clone))
+    @patch.object(base, 'clone_semaphore', base.clone_semaphore.__class__(1))
     @async_test
     async def test_import_repository(self):
         repo_info = {'name': 'my-repo', 'clone_url': 'git@github.com/bla',
                      'id': 1234, 'full_name': 'ze/my-repo'}
+        await self.integration.save()
         self.integration.get_auth_url = AsyncMock(
             return_value='https://some-url')
 
@@ -257,10 +413,11 @@ class BaseIntegrationTest(TestCase):
         repo = await self.integration.import_repository(repo_info)
         self.assertTrue(repo.id)
         self.assertTrue(repo.request_code_update.called)
-        install = await type(self.integration).objects.get(
-            id=self.integration.id)
-        self.assertTrue(install.repositories)
-        self.assertTrue(install.post_import_hooks)
+        self.assertTrue(self.integration._wait_clone.called)
+        self.assertEqual(base.clone_semaphore.stats()['running'], 0)
+        install_repo = await self.integration._get_install_repo('1234')
+        self.assertEqual(install_repo.repository_id, str(repo.id))
+        self.assertTrue(self.integration.post_import_hooks.called)
 
     @patch.object(base.SlaveInterface, 'list',
                   AsyncMock(
@@ -275,6 +432,7 @@ class BaseIntegrationTest(TestCase):
     async def test_import_repository_no_clone(self):
         repo_info = {'name': 'my-repo', 'clone_url': 'git@github.com/bla',
                      'id': 1234, 'full_name': 'ze/my-repo'}
+        await self.integration.save()
         self.integration.get_auth_url = AsyncMock(
             return_value='https://some-url')
         self.integration.enable_notification = AsyncMock()
@@ -283,9 +441,8 @@ class BaseIntegrationTest(TestCase):
                                                         clone=False)
         self.assertTrue(repo.id)
         self.assertFalse(repo.request_code_update.called)
-        install = await type(self.integration).objects.get(
-            id=self.integration.id)
-        self.assertTrue(install.repositories)
+        repos = await self.integration.get_repositories()
+        self.assertEqual(len(repos), 1)
 
     @patch.object(base.RepositoryInterface, 'add', AsyncMock(
         side_effect=base.AlreadyExists, spec=base.RepositoryInterface.add))
@@ -316,6 +473,7 @@ class BaseIntegrationTest(TestCase):
     async def test_import_repository_bad_notification(self):
         repo_info = {'name': 'my-repo', 'clone_url': 'git@github.com/bla',
                      'id': 1234, 'full_name': 'ze/my-repo'}
+        await self.integration.save()
         self.integration.get_auth_url = AsyncMock(
             return_value='https://some-url')
 
@@ -326,9 +484,36 @@ class BaseIntegrationTest(TestCase):
 
     @async_test
     async def test_get_repo_by_exernal_id_bad_repo(self):
+        await self.integration.save()
         with self.assertRaises(base.BadRepository):
             await self.integration._get_repo_by_external_id(123)
 
+    @patch.object(base.RepositoryInterface, 'get', AsyncMock(
+        spec=base.RepositoryInterface.get))
+    @async_test
+    async def test_get_repo_by_external_id(self):
+        await self._create_install_repo(1234)
+
+        repo = await self.integration._get_repo_by_external_id('1234')
+        cached = await self.integration._get_repo_by_external_id(1234)
+
+        self.assertIs(repo, cached)
+        self.assertEqual(base.RepositoryInterface.get.call_count, 1)
+        self.assertEqual(base.RepositoryInterface.get.call_args[1]['id'],
+                         'repo-id')
+
+    @async_test
+    async def test_get_install_repo_uuid(self):
+        install_repo = await self._create_install_repo('{A-UUID}')
+
+        r = await self.integration._get_install_repo('a-uuid')
+
+        self.assertEqual(r, install_repo)
+
+    def test_normalize_external_id(self):
+        self.assertEqual(base.normalize_external_id(1234), '1234')
+        self.assertEqual(base.normalize_external_id('{AB-CD}'), 'ab-cd')
+
     @patch.object(base.RepositoryInterface, 'request_code_update',
                   AsyncMock(
                       spec=base.RepositoryInterface.request_code_update))
@@ -348,9 +533,6 @@ class BaseIntegrationTest(TestCase):
                   AsyncMock(spec=base.RepositoryInterface.update))
     @async_test
     async def test_update_repository(self):
-        install_repo = base.ExternalInstallationRepository(
-            external_id=1234, repository_id='repo-id', full_name='a/b')
-        self.integration.repositories.append(install_repo)
         await self.integration.update_repository(1234)
         self.assertTrue(base.RepositoryInterface.request_code_update.called)
 
@@ -371,12 +553,43 @@ class BaseIntegrationTest(TestCase):
     )
     @async_test
     async def test_update_repository_same_url(self):
-        install_repo = base.ExternalInstallationRepository(
-            external_id=12345, repository_id='repo-id', full_name='a/b')
-        self.integration.repositories.append(install_repo)
         await self.integration.update_repository(1234)
         self.assertTrue(base.RepositoryInterface.request_code_update.called)
 
+    @patch.object(
+        base.BaseIntegration, '_get_repo_by_external_id',
+        AsyncMock(
+            spec=base.BaseIntegration._get_repo_by_external_id,
+            return_value=base.RepositoryInterface(
+                None, {'branches': [{'name': 'develop'}]}))
+    )
+    @async_test
+    async def test_get_wanted_branches(self):
+        r = await self.integration.get_wanted_branches(
+            1234, {'develop': 'sha0', 'master': 'sha1'})
+
+        self.assertEqual(r, {'develop': 'sha0'})
+
+    @patch.object(
+        base.BaseIntegration, '_get_repo_by_external_id',
+        AsyncMock(
+            spec=base.BaseIntegration._get_repo_by_external_id,
+            return_value=base.RepositoryInterface(None, {'branches': []}))
+    )
+    @async_test
+    async def test_get_wanted_branches_no_branches_configured(self):
+        r = await self.integration.get_wanted_branches(
+            1234, {'develop': 'sha0'})
+
+        self.assertEqual(r, {'develop': 'sha0'})
+
+    @patch.object(base.update_coalescer, 'request_update', Mock(
+        spec=base.update_coalescer.request_update))
+    def test_schedule_update(self):
+        self.integration.schedule_update(1234)
+
+        self.assertTrue(base.update_coalescer.request_update.called)
+
     @patch.object(
         base.BaseIntegration, '_get_repo_by_external_id',
         AsyncMock(
@@ -407,47 +620,62 @@ class BaseIntegrationTest(TestCase):
         repo = create_autospec(spec=base.RepositoryInterface,
                                mock_cls=AsyncMock)
         repo.id = 'asdf'
-        gh_repo = base.ExternalInstallationRepository(
-            external_id=123,
-            repository_id=repo.id,
-            full_name='some/name')
-
-        self.integration.repositories.append(gh_repo)
-
-        gh_repo = base.ExternalInstallationRepository(
-            external_id=1234,
-            repository_id=repo.id,
-            full_name='other/name')
-
-        self.integration.repositories.append(gh_repo)
+        await self._create_install_repo(123, repository_id=repo.id,
+                                        full_name='some/name')
+        await self._create_install_repo(1234, repository_id=repo.id,
+                                        full_name='other/name')
 
         base.RepositoryInterface.get.side_effect = [
             base.ToxicClientException, repo]
         await self.integration.delete(MagicMock())
         self.assertTrue(repo.delete.called)
+        count = await base.ExternalInstallationRepository.objects.count()
+        self.assertEqual(count, 0)
 
+    @patch.object(base.RepositoryInterface, 'get', AsyncMock(
+        spec=base.RepositoryInterface.get,
+        return_value=base.RepositoryInterface(None, {'id': 'repo-id'})))
     @patch.object(base.RepositoryInterface, 'delete', AsyncMock(
         spec=base.RepositoryInterface.delete))
     @async_test
     async def test_remove_repository(self):
-        install_repo = base.ExternalInstallationRepository(
-            external_id=1234, repository_id='repo-id', full_name='a/b')
-        self.integration.repositories.append(install_repo)
+        await self._create_install_repo(1234)
         await self.integration.remove_repository(1234)
         self.assertTrue(base.RepositoryInterface.delete.called)
+        with self.assertRaises(base.BadRepository):
+            await self.integration._get_install_repo(1234)
 
+    @patch.object(base.RepositoryInterface, 'get', AsyncMock(
+        spec=base.RepositoryInterface.get,
+        return_value=base.RepositoryInterface(None, {'id': 'repo-id'})))
     @patch.object(base.RepositoryInterface, 'delete', AsyncMock(
         spec=base.RepositoryInterface.delete,
         side_effect=base.RepositoryDoesNotExist))
     @patch.object(base.BaseIntegration, 'log', Mock(spec=base.BaseIntegration))
     @async_test
     async def test_remove_repository_does_not_exist(self):
-        install_repo = base.ExternalInstallationRepository(
-            external_id=1234, repository_id='repo-id', full_name='a/b')
-        self.integration.repositories.append(install_repo)
+        await self._create_install_repo(1234)
         await self.integration.remove_repository(1234)
         self.assertTrue(base.BaseIntegration.log.called)
 
+    @async_test
+    async def test_migrate_repositories(self):
+        await self.integration.save()
+        collection = base.BaseIntegration._get_collection()
+        await collection.update_one(
+            {'_id': self.integration.id},
+            {'$set': {'repositories': [
+                {'external_id': 1234, 'repository_id': 'repo-id',
+                 'full_name': 'a/b'}]}})
+
+        count = await base.BaseIntegration.migrate_repositories()
+
+        self.assertEqual(count, 1)
+        install_repo = await self.integration._get_install_repo(1234)
+        self.assertEqual(install_repo.repository_id, 'repo-id')
+        doc = await collection.find_one({'_id': self.integration.id})
+        self.assertNotIn('repositories', doc)
+
     def test_get_notif_config(self):
         c = self.integration.get_notif_config()
 
@@ -494,6 +722,134 @@ class BaseIntegrationTest(TestCase):
         r = await self.integration.request2api(meth, url, bla)
         self.assertTrue(r)
 
+    @async_test
+    async def test_request2api_limit(self):
+        limit = asyncio.Semaphore(1)
+        locked = []
+
+        async def wait(key, priority):
+            locked.append(('wait', limit.locked()))
+
+        async def post(url, **kwargs):
+            locked.append(('post', limit.locked()))
+            return MagicMock(status=200)
+
+        with patch.object(base.rate_limiter, 'wait', wait), \
+                patch.object(base.requests, 'post', post):
+            await self.integration.request2api(
+                'post', 'http://some.url', limit=limit)
+
+        self.assertEqual(locked, [('wait', False), ('post', True)])
+        self.assertFalse(limit.locked())
+
+    @patch.object(base, 'sleep', AsyncMock())
+    @patch.object(base, 'rate_limiter', base.rate_limiter.__class__(
+        reserve=10, max_wait=300))
+    @patch.object(base.requests, 'get', AsyncMock(side_effect=[
+        MagicMock(status=429, headers={'Retry-After': '2'}),
+        MagicMock(status=200, headers={})]))
+    @async_test
+    async def test_request2api_rate_limited(self):
+        url = 'http://some.url'
+
+        r = await self.integration.request2api('get', url)
+
+        self.assertEqual(r.status, 200)
+        self.assertEqual(base.requests.get.call_count, 2)
+        base.sleep.assert_called_with(2)
+
+    @patch.object(base, '_response_cache', base.ResponseCache(10))
+    @patch.object(base.requests, 'get', AsyncMock())
+    @async_test
+    async def test_request2api_not_modified(self):
+        url = 'http://some.url'
+        base.requests.get.side_effect = [
+            MagicMock(status=200, headers={'ETag': '"abc"'}),
+            MagicMock(status=304, headers={})]
+
+        first = await self.integration.request2api(
+            'get', url, headers={'Accept': 'some/thing'})
+        second = await self.integration.request2api(
+            'get', url, headers={'Accept': 'some/thing'})
+
+        self.assertIs(second, first)
+        headers = base.requests.get.call_args[1]['headers']
+        self.assertEqual(headers, {'Accept': 'some/thing',
+                                   'If-None-Match': '"abc"'})
+        stats = base._response_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    @patch.object(base, '_response_cache', base.ResponseCache(10))
+    @patch.object(base.requests, 'get', AsyncMock())
+    @async_test
+    async def test_request2api_not_modified_cache_replaced(self):
+        url = 'http://some.url'
+        first = MagicMock(status=200, headers={'ETag': '"abc"'})
+        other = MagicMock(status=200, headers={'ETag': '"def"'})
+
+        async def get(url, **kwargs):
+            # a concurrent request replaces the cached response while
+            # this one is in flight.
+            base._response_cache.set(cache_key, other)
+            return MagicMock(status=304, headers={})
+
+        base.requests.get.return_value = first
+        await self.integration.request2api('get', url)
+        cache_key = self.integration._get_response_cache_key(url, {})
+        base.requests.get.side_effect = get
+
+        r = await self.integration.request2api('get', url)
+
+        self.assertIs(r, first)
+
+    @patch.object(base, '_response_cache', base.ResponseCache(10))
+    @patch.object(base.requests, 'get', AsyncMock())
+    @async_test
+    async def test_request2api_not_modified_not_cached(self):
+        url = 'http://some.url'
+        ok = MagicMock(status=200, headers={})
+        base.requests.get.side_effect = [
+            MagicMock(status=304, headers={}), ok]
+
+        r = await self.integration.request2api(
+            'get', url, headers={'If-None-Match': '"abc"',
+                                 'Accept': 'some/thing'})
+
+        self.assertIs(r, ok)
+        headers = base.requests.get.call_args[1]['headers']
+        self.assertEqual(headers, {'Accept': 'some/thing'})
+
+    @patch.object(base, '_response_cache', base.ResponseCache(10))
+    @patch.object(base.requests, 'get', AsyncMock(return_value=MagicMock(
+        status=304, headers={})))
+    @async_test
+    async def test_request2api_not_modified_not_cached_again(self):
+        url = 'http://some.url'
+
+        with self.assertRaises(base.BadRequestToExternalAPI):
+            await self.integration.request2api('get', url)
+
+        self.assertEqual(base.requests.get.call_count, 2)
+
+    @async_test
+    async def test_get_response_cache_stats(self):
+        stats = self.integration.get_response_cache_stats()
+
+        self.assertIn('hits', stats)
+
+    @patch.object(base, 'sleep', AsyncMock())
+    @patch.object(base.requests, 'get', AsyncMock(return_value=MagicMock(
+        status=429, headers={'Retry-After': '2'})))
+    @patch.object(base.settings, 'RATE_LIMIT_MAX_RETRIES', 1, create=True)
+    @async_test
+    async def test_request2api_rate_limited_too_many_retries(self):
+        url = 'http://some.url'
+
+        with self.assertRaises(base.BadRequestToExternalAPI):
+            await self.integration.request2api('get', url)
+
+        self.assertEqual(base.requests.get.call_count, 2)
+
     @async_test
     async def test_create_access_token(self):
         self.integration.get_user_id = AsyncMock()
@@ -579,6 +935,151 @@ class BaseIntegrationTest(TestCase):
         self.assertFalse(self.integration.refresh_access_token.called)
         self.assertFalse(self.integration.refresh_access_token.called)
 
+    @async_test
+    async def test_ensure_token_single_flight(self):
+        await self.integration.save()
+        other = await base.BaseIntegration.objects.get(id=self.integration.id)
+        self.integration.access_token = 'old-token'
+        self.integration.expires = base.localtime2utc(
+            base.now()) - datetime.timedelta(hours=1)
+        other.access_token = 'old-token'
+        other.expires = self.integration.expires
+        expires = base.localtime2utc(
+            base.now()) + datetime.timedelta(hours=1)
+
+        async def refresh():
+            await base.sleep(0)
+            self.integration.access_token = 'new-token'
+            self.integration.expires = expires
+
+        self.integration.refresh_access_token = AsyncMock(side_effect=refresh)
+        other.refresh_access_token = AsyncMock(side_effect=refresh)
+
+        await base.gather(self.integration.ensure_token(),
+                          other.ensure_token())
+
+        calls = (self.integration.refresh_access_token.call_count +
+                 other.refresh_access_token.call_count)
+        self.assertEqual(calls, 1)
+        self.assertEqual(other.access_token, 'new-token')
+        await self.integration.reload()
+        self.assertIsNone(self.integration.token_refresh_lock)
+
+    @async_test
+    async def test_ensure_token_lease_taken_by_other_process(self):
+        await self.integration.save()
+        self.integration.access_token = 'old-token'
+        self.integration.expires = base.localtime2utc(
+            base.now()) - datetime.timedelta(hours=1)
+        lock = base.localtime2utc(base.now()) + datetime.timedelta(
+            seconds=30)
+
+        async def refresh():
+            # our lease expired and other process took it.
+            await base.BaseIntegration.objects.filter(
+                id=self.integration.id).update_one(
+                    set__token_refresh_lock=lock,
+                    set__token_refresh_owner='other')
+
+        self.integration.refresh_access_token = AsyncMock(side_effect=refresh)
+
+        await self.integration.ensure_token()
+
+        await self.integration.reload()
+        self.assertEqual(self.integration.token_refresh_owner, 'other')
+        self.assertIsNotNone(self.integration.token_refresh_lock)
+
+    @patch.object(base, 'sleep', AsyncMock(
+        side_effect=[None, asyncio.CancelledError]))
+    @async_test
+    async def test_renew_token_lease(self):
+        self.integration.token_refresh_lock = base.localtime2utc(
+            base.now()) - datetime.timedelta(seconds=10)
+        self.integration.token_refresh_owner = 'me'
+        await self.integration.save()
+        await self.integration.reload()
+        lock = self.integration.token_refresh_lock
+
+        with self.assertRaises(asyncio.CancelledError):
+            await self.integration._renew_token_lease(30, 'me')
+
+        await self.integration.reload()
+        self.assertGreater(self.integration.token_refresh_lock, lock)
+
+    @async_test
+    async def test_ensure_token_refreshed_by_other_process(self):
+        self.integration.access_token = 'new-token'
+        self.integration.expires = base.localtime2utc(
+            base.now()) + datetime.timedelta(hours=1)
+        await self.integration.save()
+        self.integration.access_token = 'old-token'
+        self.integration.expires = base.localtime2utc(
+            base.now()) - datetime.timedelta(hours=1)
+        self.integration.refresh_access_token = AsyncMock()
+
+        await self.integration.ensure_token()
+
+        self.assertFalse(self.integration.refresh_access_token.called)
+        self.assertEqual(self.integration.access_token, 'new-token')
+
+    @patch.object(base, 'sleep', AsyncMock())
+    @async_test
+    async def test_ensure_token_wait_other_process(self):
+        self.integration.token_refresh_lock = base.localtime2utc(
+            base.now()) + datetime.timedelta(seconds=30)
+        await self.integration.save()
+        self.integration.refresh_access_token = AsyncMock()
+        self.integration.create_access_token = AsyncMock()
+
+        async def refresh(interval):
+            await base.BaseIntegration.objects.filter(
+                id=self.integration.id).update_one(
+                    set__access_token='new-token',
+                    set__expires=base.localtime2utc(
+                        base.now()) + datetime.timedelta(hours=1))
+
+        base.sleep.side_effect = refresh
+
+        await self.integration.ensure_token()
+
+        self.assertFalse(self.integration.create_access_token.called)
+        self.assertEqual(self.integration.access_token, 'new-token')
+
+    @async_test
+    async def test_ensure_token_valid(self):
+        self.integration.access_token = 'token'
+        self.integration.expires = base.localtime2utc(
+            base.now()) + datetime.timedelta(hours=1)
+        self.integration.refresh_access_token = AsyncMock()
+
+        await self.integration.ensure_token()
+
+        self.assertFalse(self.integration.refresh_access_token.called)
+
+    def test_token_expires_in(self):
+        self.integration.expires = base.localtime2utc(
+            base.now()) + datetime.timedelta(seconds=100)
+
+        self.assertTrue(self.integration.token_expires_in(200))
+        self.assertFalse(self.integration.token_expires_in(10))
+
+    def test_token_expires_in_no_expires(self):
+        self.integration.expires = None
+
+        self.assertFalse(self.integration.token_expires_in(200))
+
+    @async_test
+    async def test_refresh_expiring_token(self):
+        self.integration.access_token = 'token'
+        self.integration.expires = base.localtime2utc(
+            base.now()) + datetime.timedelta(seconds=100)
+        await self.integration.save()
+        self.integration.refresh_access_token = AsyncMock()
+
+        await self.integration.refresh_expiring_token(200)
+
+        self.assertTrue(self.integration.refresh_access_token.called)
+
     def test_get_expire_dt(self):
         secs = 20
         dt = self.integration.get_expire_dt(secs)
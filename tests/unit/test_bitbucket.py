@@ -50,6 +50,7 @@ class BitbucketAppTest(TestCase):
     @async_test
     async def tearDown(self):
         await bitbucket.BitbucketApp.drop_collection()
+        bitbucket.BitbucketApp.invalidate_cache()
 
     @async_test
     async def test_create_app(self):
@@ -77,6 +78,7 @@ class BitbucketIntegrationTest(TestCase):
     @async_test
     async def tearDown(self):
         await bitbucket.BitbucketApp.drop_collection()
+        bitbucket.BitbucketApp.invalidate_cache()
         await bitbucket.BitbucketIntegration.drop_collection()
 
     @async_test
@@ -201,7 +203,9 @@ class BitbucketIntegrationTest(TestCase):
             'name': 'repo',
             'full_name': 'me/repo',
             'slug': 'repo',
+            'updated_on': '2026-01-02T10:00:00+00:00',
         }
         r = self.integration._get_repo_dict(repo_info)
 
         self.assertEqual(r['clone_url'], 'https://bb.com/repo.git')
+        self.assertEqual(r['pushed_at'], '2026-01-02T10:00:00+00:00')
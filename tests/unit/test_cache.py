@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import patch, Mock
+
+from toxicintegrations import cache
+
+
+class TTLCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache = cache.TTLCache(10, maxsize=2)
+
+    def test_get(self):
+        self.cache.set('a', 1)
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_get_miss(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.misses, 1)
+
+    @patch.object(cache, 'monotonic', Mock(return_value=0))
+    def test_get_expired(self):
+        self.cache.set('a', 1)
+        cache.monotonic.return_value = 11
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertNotIn('a', self.cache)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_set_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertIn('c', self.cache)
+
+    def test_pop(self):
+        self.cache.set('a', 1)
+        self.cache.pop('a')
+        self.cache.pop('a')
+
+        self.assertNotIn('a', self.cache)
+
+    def test_clear(self):
+        self.cache.set('a', 1)
+        self.cache.clear()
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_stats(self):
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        self.cache.get('b')
+
+        expected = {'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1}
+        self.assertEqual(self.cache.stats(), expected)
+
+
+class ResponseCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache = cache.ResponseCache(2)
+
+    def test_set(self):
+        response = Mock(headers={'ETag': '"abc"'})
+
+        self.cache.set('a', response)
+
+        self.assertIs(self.cache.get_conditional('a')[0], response)
+
+    def test_set_not_cacheable(self):
+        self.cache.set('a', Mock(headers={'ETag': '"abc"'}))
+        self.cache.set('a', Mock(headers={}))
+        self.cache.set('b', Mock(headers=None))
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_set_evict(self):
+        self.cache.set('a', Mock(headers={'ETag': '"a"'}))
+        self.cache.set('b', Mock(headers={'ETag': '"b"'}))
+        self.cache.get_conditional('a')
+        self.cache.set('c', Mock(headers={'ETag': '"c"'}))
+
+        self.assertIsNotNone(self.cache.get_conditional('a')[0])
+        self.assertIsNone(self.cache.get_conditional('b')[0])
+
+    def test_get_conditional(self):
+        response = Mock(headers={
+            'ETag': '"abc"',
+            'Last-Modified': 'Thu, 01 Oct 2026 00:00:00 GMT'})
+        self.cache.set('a', response)
+
+        cached, headers = self.cache.get_conditional('a')
+
+        expected = {'If-None-Match': '"abc"',
+                    'If-Modified-Since': 'Thu, 01 Oct 2026 00:00:00 GMT'}
+        self.assertIs(cached, response)
+        self.assertEqual(headers, expected)
+
+    def test_get_conditional_not_cached(self):
+        self.assertEqual(self.cache.get_conditional('a'), (None, {}))
+
+    def test_clear(self):
+        self.cache.set('a', Mock(headers={'ETag': '"abc"'}))
+        self.cache.clear()
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_stats(self):
+        self.cache.set('a', Mock(headers={'ETag': '"abc"'}))
+        # looking up a response doesn't count, it may not be used.
+        self.cache.get_conditional('a')
+        self.cache.record(hit=True)
+        self.cache.record(hit=False)
+
+        expected = {'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1}
+        self.assertEqual(self.cache.stats(), expected)
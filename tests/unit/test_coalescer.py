@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import Mock, AsyncMock, patch
+
+from toxicintegrations import coalescer
+from tests import async_test
+
+
+class PendingUpdateTest(TestCase):
+
+    def setUp(self):
+        self.pending = coalescer.PendingUpdate(Mock(), 1234)
+
+    def test_merge(self):
+        self.pending.merge({'master': {}})
+        self.pending.merge({'feature-x': {}})
+
+        self.assertEqual(self.pending.get_repo_branches(),
+                         {'master': {}, 'feature-x': {}})
+
+    def test_merge_all_branches(self):
+        self.pending.merge({'master': {}})
+        self.pending.merge(None)
+
+        self.assertIsNone(self.pending.get_repo_branches())
+
+
+@patch.object(coalescer, 'settings', Mock(PUSH_DEBOUNCE_SECONDS=0))
+class UpdateCoalescerTest(TestCase):
+
+    def setUp(self):
+        self.coalescer = coalescer.UpdateCoalescer()
+        self.install = Mock(id='install-id')
+        self.install.update_repository = AsyncMock()
+
+    @async_test
+    async def test_request_update(self):
+        f0 = self.coalescer.request_update(self.install, 1234,
+                                           {'master': {}})
+        f1 = self.coalescer.request_update(self.install, 1234,
+                                           {'bug-1': {}})
+        task = self.coalescer._tasks[('install-id', '1234')]
+        await f0
+
+        self.assertIs(f0, f1)
+        self.assertEqual(
+            len(self.install.update_repository.call_args_list), 1)
+        called = self.install.update_repository.call_args[1]
+        self.assertEqual(called['repo_branches'],
+                         {'master': {}, 'bug-1': {}})
+        await task
+        self.assertFalse(self.coalescer._tasks)
+
+    @async_test
+    async def test_request_update_in_flight(self):
+        futures = []
+
+        async def update_repository(external_id, repo_branches=None):
+            if len(self.install.update_repository.call_args_list) == 1:
+                futures.append(self.coalescer.request_update(
+                    self.install, external_id, {'bug-1': {}}))
+
+        self.install.update_repository.side_effect = update_repository
+        f = self.coalescer.request_update(self.install, 1234, {'master': {}})
+        await f
+        await futures[0]
+
+        self.assertIsNot(f, futures[0])
+        self.assertEqual(
+            len(self.install.update_repository.call_args_list), 2)
+
+    @async_test
+    async def test_request_update_other_repo(self):
+        t0 = self.coalescer.request_update(self.install, 1234)
+        t1 = self.coalescer.request_update(self.install, 4321)
+        await t0
+        await t1
+
+        self.assertEqual(
+            len(self.install.update_repository.call_args_list), 2)
+
+    @patch.object(coalescer.UpdateCoalescer, 'log', Mock())
+    @async_test
+    async def test_request_update_error(self):
+        self.install.update_repository.side_effect = Exception
+        f0 = self.coalescer.request_update(self.install, 1234)
+        f1 = self.coalescer.request_update(self.install, 1234)
+        task = self.coalescer._tasks[('install-id', '1234')]
+
+        # every one waiting for the update gets the error.
+        with self.assertRaises(Exception):
+            await f0
+        with self.assertRaises(Exception):
+            await f1
+
+        await task
+        self.assertTrue(self.coalescer.log.called)
+        self.assertFalse(self.coalescer._tasks)
+
+    @async_test
+    async def test_request_update_future_cancelled(self):
+        f = self.coalescer.request_update(self.install, 1234)
+        task = self.coalescer._tasks[('install-id', '1234')]
+        f.cancel()
+
+        # the update still runs and the task doesn't crash.
+        await task
+
+        self.assertTrue(self.install.update_repository.called)
+        self.assertFalse(self.coalescer._tasks)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from toxicintegrations import codec
+
+
+class CodecTest(TestCase):
+
+    def test_loads_bytes(self):
+        r = codec.loads(b'{"some": "thing"}')
+
+        self.assertEqual(r, {'some': 'thing'})
+
+    def test_loads_str(self):
+        r = codec.loads('{"some": "thing"}')
+
+        self.assertEqual(r, {'some': 'thing'})
+
+    def test_loads_bad_json(self):
+        with self.assertRaises(ValueError):
+            codec.loads(b'{bad')
+
+    def test_dumps(self):
+        r = codec.dumps({'some': 'thing'})
+
+        self.assertEqual(codec.loads(r), {'some': 'thing'})
+        self.assertIsInstance(r, bytes)
+
+    @patch.object(codec, 'orjson', None)
+    def test_loads_stdlib(self):
+        r = codec.loads(b'{"some": "thing"}')
+
+        self.assertEqual(r, {'some': 'thing'})
+
+    @patch.object(codec, 'orjson', None)
+    def test_dumps_stdlib(self):
+        r = codec.dumps({'some': 'thing'})
+
+        self.assertEqual(r, b'{"some": "thing"}')
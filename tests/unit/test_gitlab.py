@@ -40,6 +40,7 @@ class GitlabAppTest(TestCase):
     @async_test
     async def tearDown(self):
         await gitlab.GitlabApp.drop_collection()
+        gitlab.GitlabApp.invalidate_cache()
 
     @async_test
     async def test_create_app(self):
@@ -63,6 +64,7 @@ class GitlabIntegrationTest(TestCase):
     async def tearDown(self):
         gitlab.GitlabApp.drop_collection()
         gitlab.GitlabIntegration.drop_collection()
+        gitlab.GitlabApp.invalidate_cache()
 
     @patch.object(gitlab.GitlabIntegration, 'get_headers', AsyncMock(
         return_value={}))
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from unittest import TestCase
+from unittest.mock import Mock, AsyncMock, patch
+
+from toxicintegrations import importer
+from tests import async_test
+
+
+class GetImportOrderTest(TestCase):
+
+    def test_get_import_order(self):
+        repos_info = [
+            {'name': 'no-info'},
+            {'name': 'old', 'pushed_at': '2026-01-01T00:00:00Z',
+             'size': 100},
+            {'name': 'new-small', 'pushed_at': '2026-02-01T00:00:00Z',
+             'size': 1},
+            {'name': 'new-big', 'pushed_at': '2026-02-01T00:00:00Z',
+             'size': 10}]
+
+        r = importer.get_import_order(repos_info)
+
+        self.assertEqual([i['name'] for i in r],
+                         ['new-big', 'new-small', 'old', 'no-info'])
+
+    def test_get_import_order_same_day(self):
+        repos_info = [
+            {'name': 'small', 'pushed_at': '2026-02-01T10:00:00Z',
+             'size': 1},
+            {'name': 'big', 'pushed_at': '2026-02-01T09:00:00Z',
+             'size': 10}]
+
+        r = importer.get_import_order(repos_info)
+
+        self.assertEqual([i['name'] for i in r], ['big', 'small'])
+
+
+class PrioritySemaphoreTest(TestCase):
+
+    def setUp(self):
+        self.sem = importer.PrioritySemaphore(1)
+
+    @async_test
+    async def test_acquire_priority(self):
+        order = []
+
+        async def run(name, priority):
+            async with self.sem.acquire(priority):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        async with self.sem.acquire():
+            tasks = [asyncio.ensure_future(run('low', 2)),
+                     asyncio.ensure_future(run('high', 1))]
+            await asyncio.sleep(0)
+
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(order, ['high', 'low'])
+        self.assertEqual(self.sem.stats()['running'], 0)
+
+    @async_test
+    async def test_acquire_cancelled(self):
+        async def run():
+            async with self.sem.acquire():
+                await asyncio.sleep(0)
+
+        async with self.sem.acquire():
+            t = asyncio.ensure_future(run())
+            await asyncio.sleep(0)
+            self.assertEqual(self.sem.stats()['waiting'], 1)
+            t.cancel()
+            await asyncio.sleep(0)
+
+        self.assertEqual(self.sem.stats()['waiting'], 0)
+        async with self.sem.acquire():
+            self.assertEqual(self.sem.stats()['running'], 1)
+
+        self.assertEqual(self.sem.stats()['running'], 0)
+
+    @async_test
+    async def test_acquire_cancelled_after_release(self):
+        async def run():
+            async with self.sem.acquire():
+                await asyncio.sleep(0)
+
+        async with self.sem.acquire():
+            t = asyncio.ensure_future(run())
+            await asyncio.sleep(0)
+
+        # the slot was handed to the waiter but it is cancelled before
+        # it runs.
+        t.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await t
+
+        self.assertEqual(self.sem.stats()['running'], 0)
+
+
+class ImportReportTest(TestCase):
+
+    def test_add_timing(self):
+        report = importer.ImportReport()
+
+        report.add_timing('clone', 2)
+        report.add_timing('clone', 1)
+
+        self.assertEqual(report.stages['clone'],
+                         {'count': 2, 'total': 3, 'max': 2})
+
+    def test_as_dict(self):
+        report = importer.ImportReport()
+        report.repos.append(Mock())
+        report.failed.append('some-repo')
+
+        d = report.as_dict()
+
+        self.assertEqual(d['imported'], 1)
+        self.assertEqual(d['skipped'], 0)
+        self.assertEqual(d['failed'], 1)
+
+
+@patch.object(importer.SlaveInterface, 'list', AsyncMock(
+    return_value=[Mock()]))
+@patch.object(importer.ImportPipeline, 'log', Mock())
+class ImportPipelineTest(TestCase):
+
+    def setUp(self):
+        self.install = Mock()
+        self.install.list_repos = AsyncMock(return_value=[
+            {'name': 'repo-1'}, {'name': 'repo-2'}])
+        self.install.add_repository = AsyncMock(return_value=Mock())
+        self.install.post_import_hooks = AsyncMock()
+        self.install.enable_notification = AsyncMock()
+        self.install.clone_repository = AsyncMock()
+        self.pipeline = importer.ImportPipeline(self.install)
+
+    @async_test
+    async def test_run(self):
+        report = await self.pipeline.run()
+
+        self.assertEqual(len(report.repos), 2)
+        self.assertEqual(len(self.install.clone_repository.call_args_list),
+                         2)
+        self.assertEqual(report.stages['list']['count'], 1)
+        self.assertEqual(report.stages['create']['count'], 2)
+        self.assertEqual(report.stages['clone']['count'], 2)
+
+    @async_test
+    async def test_run_already_exists(self):
+        self.install.add_repository.return_value = False
+
+        report = await self.pipeline.run()
+
+        self.assertEqual(report.skipped, ['repo-1', 'repo-2'])
+        self.assertFalse(self.install.clone_repository.called)
+
+    @async_test
+    async def test_run_create_error(self):
+        self.install.add_repository.side_effect = [Exception, Mock()]
+
+        report = await self.pipeline.run()
+
+        self.assertEqual(report.failed, ['repo-1'])
+        self.assertEqual(len(report.repos), 1)
+
+    @async_test
+    async def test_run_webhook_error(self):
+        self.install.post_import_hooks.side_effect = [Exception, None]
+
+        report = await self.pipeline.run()
+
+        self.assertEqual(report.failed, ['repo-1'])
+        self.assertEqual(len(self.install.clone_repository.call_args_list),
+                         1)
+
+    @async_test
+    async def test_run_notification_error(self):
+        self.install.enable_notification.side_effect = Exception
+
+        report = await self.pipeline.run()
+
+        self.assertEqual(len(report.repos), 2)
+        self.assertFalse(report.failed)
+
+    @async_test
+    async def test_run_concurrency(self):
+        self.install.list_repos.return_value = [
+            {'name': 'repo-{}'.format(i)} for i in range(5)]
+        running = []
+        max_running = []
+
+        async def clone(repo):
+            running.append(repo)
+            max_running.append(len(running))
+            await asyncio.sleep(0)
+            running.remove(repo)
+
+        self.install.clone_repository = clone
+        self.pipeline = importer.ImportPipeline(self.install,
+                                                concurrency={'clone': 2})
+
+        report = await self.pipeline.run()
+
+        self.assertEqual(len(report.repos), 5)
+        self.assertEqual(max(max_running), 2)
+
+    @async_test
+    async def test_run_priority(self):
+        self.install.list_repos.return_value = [
+            {'name': 'old', 'pushed_at': '2026-01-01T00:00:00Z'},
+            {'name': 'new', 'pushed_at': '2026-02-01T00:00:00Z'}]
+        self.install.add_repository = AsyncMock(
+            side_effect=lambda repo_info, **kw: repo_info['name'])
+        cloned = []
+
+        async def clone(repo):
+            cloned.append(repo)
+
+        self.install.clone_repository = clone
+        self.pipeline = importer.ImportPipeline(self.install,
+                                                concurrency={'clone': 1})
+
+        await self.pipeline.run()
+
+        self.assertEqual(cloned, ['new', 'old'])
+
+    @async_test
+    async def test_clone_arrival_order(self):
+        # a clone of other import that arrived first is not passed by one
+        # with a lower index in this import.
+        order = []
+
+        async def clone(repo):
+            order.append(repo)
+
+        self.install.clone_repository = clone
+        other = importer.ImportPipeline(self.install)
+        for pipeline in (self.pipeline, other):
+            pipeline._sems['clone'] = importer.PrioritySemaphore(10)
+        sem = importer.PrioritySemaphore(1)
+
+        with patch.object(importer, 'clone_semaphore', sem):
+            async with sem.acquire():
+                tasks = [asyncio.ensure_future(other._clone('other', 5))]
+                await asyncio.sleep(0)
+                tasks.append(asyncio.ensure_future(
+                    self.pipeline._clone('mine', 0)))
+                await asyncio.sleep(0)
+
+            await asyncio.gather(*tasks)
+
+        self.assertEqual(order, ['other', 'mine'])
+
+    @async_test
+    async def test_run_no_repos(self):
+        self.install.list_repos.return_value = []
+
+        report = await self.pipeline.run()
+
+        self.assertFalse(report.repos)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from toxicintegrations import metrics
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_incr(self):
+        metrics.incr('bla')
+        metrics.incr('bla', 2)
+
+        self.assertEqual(metrics.get_counters(), {'bla': 3})
+
+    def test_reset(self):
+        metrics.incr('bla')
+        metrics.reset()
+
+        self.assertEqual(metrics.get_counters(), {})
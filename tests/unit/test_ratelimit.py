@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from email.utils import formatdate
+from time import time
+from unittest import TestCase
+from unittest.mock import Mock, AsyncMock, patch
+
+from toxicintegrations import ratelimit
+from tests import async_test
+
+
+class RateLimiterTest(TestCase):
+
+    def setUp(self):
+        self.limiter = ratelimit.RateLimiter(reserve=10, max_wait=300)
+        self.key = ('some-id', 'api.github.com')
+
+    def test_update(self):
+        reset = int(time()) + 100
+        headers = {'X-RateLimit-Remaining': '50',
+                   'X-RateLimit-Reset': str(reset)}
+
+        self.limiter.update(self.key, headers)
+
+        budget = self.limiter._budgets[self.key]
+        self.assertEqual(budget.remaining, 50)
+        self.assertEqual(budget.reset_at, reset)
+
+    def test_update_reset_seconds(self):
+        headers = {'RateLimit-Remaining': '50', 'RateLimit-Reset': '100'}
+
+        self.limiter.update(self.key, headers)
+
+        budget = self.limiter._budgets[self.key]
+        self.assertGreater(budget.reset_at, time() + 90)
+
+    def test_update_no_reset(self):
+        headers = {'RateLimit-Remaining': '50'}
+
+        self.limiter.update(self.key, headers)
+
+        budget = self.limiter._budgets[self.key]
+        self.assertGreater(budget.reset_at, time())
+
+    def test_update_no_headers(self):
+        self.limiter.update(self.key, {})
+        self.limiter.update(self.key, {'X-RateLimit-Remaining': 'bad'})
+        self.limiter.update(self.key, None)
+
+        self.assertNotIn(self.key, self.limiter._budgets)
+
+    def test_get_retry_delay_ok(self):
+        response = Mock(status=200, headers={})
+
+        self.assertIsNone(self.limiter.get_retry_delay(response))
+
+    def test_get_retry_delay_bad_headers(self):
+        response = Mock(status=429, headers=None)
+
+        self.assertIsNone(self.limiter.get_retry_delay(response))
+
+    def test_get_retry_delay_retry_after(self):
+        response = Mock(status=429, headers={'Retry-After': '10'})
+
+        self.assertEqual(self.limiter.get_retry_delay(response), 10)
+
+    def test_get_retry_delay_retry_after_date(self):
+        date = formatdate(time() + 100, usegmt=True)
+        response = Mock(status=429, headers={'Retry-After': date})
+
+        delay = self.limiter.get_retry_delay(response)
+
+        self.assertGreater(delay, 90)
+
+    def test_get_retry_delay_retry_after_bad(self):
+        response = Mock(status=429, headers={'Retry-After': 'bad'})
+
+        self.assertEqual(self.limiter.get_retry_delay(response), 60)
+
+    def test_get_retry_delay_forbidden(self):
+        response = Mock(status=403, headers={'X-RateLimit-Remaining': '10'})
+
+        self.assertIsNone(self.limiter.get_retry_delay(response))
+
+    def test_get_retry_delay_rate_limited(self):
+        reset = int(time()) + 100
+        response = Mock(status=403, headers={
+            'X-RateLimit-Remaining': '0',
+            'X-RateLimit-Reset': str(reset)})
+
+        delay = self.limiter.get_retry_delay(response)
+
+        self.assertGreater(delay, 90)
+
+    @patch.object(ratelimit, 'sleep', AsyncMock())
+    @async_test
+    async def test_wait_no_budget(self):
+        await self.limiter.wait(self.key)
+
+        self.assertFalse(ratelimit.sleep.called)
+
+    @patch.object(ratelimit, 'sleep', AsyncMock())
+    @async_test
+    async def test_wait_reset(self):
+        self.limiter._budgets[self.key] = ratelimit.RateLimitBudget(
+            0, time() - 1)
+
+        await self.limiter.wait(self.key)
+
+        self.assertFalse(ratelimit.sleep.called)
+        self.assertNotIn(self.key, self.limiter._budgets)
+
+    @patch.object(ratelimit, 'sleep', AsyncMock())
+    @async_test
+    async def test_wait_budget_left(self):
+        self.limiter._budgets[self.key] = ratelimit.RateLimitBudget(
+            15, time() + 100)
+
+        await self.limiter.wait(self.key, ratelimit.PRIORITY_NORMAL)
+
+        self.assertFalse(ratelimit.sleep.called)
+        self.assertEqual(self.limiter._budgets[self.key].remaining, 14)
+
+    @patch.object(ratelimit, 'sleep', AsyncMock())
+    @patch.object(ratelimit.RateLimiter, 'log', Mock())
+    @async_test
+    async def test_wait_low_priority(self):
+        self.limiter._budgets[self.key] = ratelimit.RateLimitBudget(
+            15, time() + 100)
+
+        async def reset(delay):
+            self.limiter._budgets[self.key].reset_at = time() - 1
+
+        ratelimit.sleep.side_effect = reset
+
+        await self.limiter.wait(self.key, ratelimit.PRIORITY_LOW)
+
+        self.assertTrue(ratelimit.sleep.called)
+        self.assertLessEqual(ratelimit.sleep.call_args[0][0], 100)
+        self.assertFalse(self.limiter._wakers)
+
+    @patch.object(ratelimit, 'sleep', AsyncMock())
+    @patch.object(ratelimit.RateLimiter, 'log', Mock())
+    @async_test
+    async def test_wait_low_priority_max_wait(self):
+        # after max_wait the budget is checked again and the request
+        # keeps waiting while it is low.
+        self.limiter.max_wait = 10
+        self.limiter._budgets[self.key] = ratelimit.RateLimitBudget(
+            15, time() + 3600)
+        calls = []
+
+        async def sleep(delay):
+            calls.append(delay)
+            if len(calls) == 2:
+                self.limiter._budgets[self.key].reset_at = time() - 1
+            await asyncio.sleep(0)
+
+        ratelimit.sleep.side_effect = sleep
+
+        await self.limiter.wait(self.key, ratelimit.PRIORITY_LOW)
+
+        self.assertEqual(calls, [10, 10])
+
+    @patch.object(ratelimit, 'sleep', AsyncMock())
+    @patch.object(ratelimit.RateLimiter, 'log', Mock())
+    @async_test
+    async def test_wait_priority_order(self):
+        self.limiter._budgets[self.key] = ratelimit.RateLimitBudget(
+            0, time() + 100)
+
+        async def sleep(delay):
+            await asyncio.sleep(0)
+
+        ratelimit.sleep.side_effect = sleep
+        order = []
+
+        async def request(priority):
+            await self.limiter.wait(self.key, priority)
+            order.append(priority)
+
+        tasks = [asyncio.ensure_future(request(p)) for p in (
+            ratelimit.PRIORITY_LOW, ratelimit.PRIORITY_NORMAL,
+            ratelimit.PRIORITY_HIGH)]
+        await asyncio.sleep(0)
+
+        self.limiter.update(self.key, {'X-RateLimit-Remaining': '100',
+                                       'X-RateLimit-Reset': '100'})
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(order, [ratelimit.PRIORITY_HIGH,
+                                 ratelimit.PRIORITY_NORMAL,
+                                 ratelimit.PRIORITY_LOW])
+        self.assertEqual(self.limiter._budgets[self.key].remaining, 97)
+
+    @patch.object(ratelimit, 'sleep', AsyncMock())
+    @patch.object(ratelimit.RateLimiter, 'log', Mock())
+    @async_test
+    async def test_wait_behind_waiters(self):
+        # a new request doesn't pass the ones with the same priority
+        # already waiting.
+        self.limiter._budgets[self.key] = ratelimit.RateLimitBudget(
+            0, time() + 100)
+
+        async def sleep(delay):
+            await asyncio.sleep(0)
+
+        ratelimit.sleep.side_effect = sleep
+        t = asyncio.ensure_future(self.limiter.wait(
+            self.key, ratelimit.PRIORITY_HIGH))
+        await asyncio.sleep(0)
+        self.limiter._budgets[self.key].remaining = 2
+
+        await self.limiter.wait(self.key, ratelimit.PRIORITY_HIGH)
+
+        self.assertTrue(t.done())
+        self.assertEqual(self.limiter._budgets[self.key].remaining, 0)
+
+    @patch.object(ratelimit, 'sleep', AsyncMock())
+    @async_test
+    async def test_wait_high_priority(self):
+        self.limiter._budgets[self.key] = ratelimit.RateLimitBudget(
+            1, time() + 100)
+
+        await self.limiter.wait(self.key, ratelimit.PRIORITY_HIGH)
+
+        self.assertFalse(ratelimit.sleep.called)
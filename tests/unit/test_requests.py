@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import Mock, MagicMock, AsyncMock, patch
+
+from toxicintegrations import requests
+from tests import async_test
+
+
+class ResponseTest(TestCase):
+
+    def test_text(self):
+        r = requests.Response(200, 'zé'.encode())
+
+        self.assertEqual(r.text, 'zé')
+
+    def test_json(self):
+        r = requests.Response(200, b'{"some": "thing"}')
+
+        self.assertEqual(r.json(), {'some': 'thing'})
+
+
+class ClientManagerTest(TestCase):
+
+    def setUp(self):
+        self.manager = requests.ClientManager()
+
+    @async_test
+    async def tearDown(self):
+        await self.manager.close()
+
+    @async_test
+    async def test_get_session(self):
+        session = self.manager.get_session()
+
+        self.assertIs(self.manager.get_session(), session)
+
+    @async_test
+    async def test_get_session_closed(self):
+        session = self.manager.get_session()
+        await self.manager.close()
+
+        self.assertIsNot(self.manager.get_session(), session)
+
+    @async_test
+    async def test_request(self):
+        response = Mock(status=201, headers={})
+        response.read = AsyncMock(return_value=b'{"id": 1}')
+        ctx = MagicMock()
+        ctx.__aenter__ = AsyncMock(return_value=response)
+        ctx.__aexit__ = AsyncMock(return_value=False)
+        session = Mock()
+        session.request = Mock(return_value=ctx)
+        self.manager.get_session = Mock(return_value=session)
+
+        r = await self.manager.request('post', 'http://bla.nada',
+                                       sesskw={'auth': 'the-auth'},
+                                       json={'some': 'thing'})
+
+        self.assertEqual(r.status, 201)
+        self.assertEqual(r.json(), {'id': 1})
+        called = session.request.call_args[1]
+        self.assertEqual(called['auth'], 'the-auth')
+        self.assertEqual(called['json'], {'some': 'thing'})
+
+    @async_test
+    async def test_close_without_session(self):
+        await self.manager.close()
+
+        self.assertIsNone(self.manager._session)
+
+
+class RequestFunctionsTest(TestCase):
+
+    @patch.object(requests.client_manager, 'request', AsyncMock())
+    @async_test
+    async def test_methods(self):
+        for method in ('get', 'post', 'put', 'delete'):
+            await getattr(requests, method)('http://bla.nada')
+            called = requests.client_manager.request.call_args[0]
+            self.assertEqual(called, (method, 'http://bla.nada'))
+
+    @patch.object(requests.client_manager, 'close', AsyncMock())
+    @async_test
+    async def test_close(self):
+        await requests.close()
+
+        self.assertTrue(requests.client_manager.close.called)
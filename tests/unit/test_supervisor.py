@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from toxicintegrations import supervisor
+
+
+@patch.object(supervisor.ProcessSupervisor, 'log', Mock())
+@patch.object(supervisor, 'signal', Mock(SIGTERM=15, SIGINT=2))
+class ProcessSupervisorTest(TestCase):
+
+    def setUp(self):
+        self.supervisor = supervisor.ProcessSupervisor(2, max_restarts=1)
+        self.supervisor.STOP_SIGNALS = (15, 2)
+
+    @patch.object(supervisor.os, 'fork', Mock(return_value=0))
+    def test_start_worker(self):
+        worker_id = self.supervisor.start()
+
+        self.assertEqual(worker_id, 0)
+        self.assertEqual(self.supervisor._children, {})
+
+    @patch.object(supervisor.os, 'fork', Mock(side_effect=[10, 0]))
+    def test_start_second_worker(self):
+        worker_id = self.supervisor.start()
+
+        self.assertEqual(worker_id, 1)
+
+    @patch.object(supervisor.os, 'fork', Mock(side_effect=[10, 11]))
+    @patch.object(supervisor.os, 'wait', Mock(side_effect=[(10, 0),
+                                                           (11, 0)]))
+    @patch.object(supervisor.sys, 'exit', Mock())
+    def test_start_supervisor(self):
+        self.supervisor.start()
+
+        self.assertTrue(supervisor.sys.exit.called)
+        self.assertEqual(self.supervisor.restarts, 0)
+
+    @patch.object(supervisor.os, 'fork', Mock(side_effect=[10, 11, 0]))
+    @patch.object(supervisor.os, 'wait', Mock(return_value=(10, 256)))
+    def test_start_restart_crashed(self):
+        worker_id = self.supervisor.start()
+
+        self.assertEqual(worker_id, 0)
+        self.assertEqual(self.supervisor.restarts, 1)
+
+    @patch.object(supervisor.os, 'fork', Mock(side_effect=[10, 11, 12]))
+    @patch.object(supervisor.os, 'wait', Mock(side_effect=[
+        (10, 256), (12, 256), (11, 0)]))
+    @patch.object(supervisor.os, 'kill', Mock())
+    @patch.object(supervisor.sys, 'exit', Mock())
+    def test_start_too_many_restarts(self):
+        self.supervisor.start()
+
+        self.assertEqual(self.supervisor.restarts, 1)
+        self.assertTrue(self.supervisor._stopping)
+        supervisor.os.kill.assert_called_with(11, 15)
+
+    @patch.object(supervisor.os, 'fork', Mock(side_effect=[10, 11]))
+    @patch.object(supervisor.os, 'wait', Mock(side_effect=ChildProcessError))
+    @patch.object(supervisor.sys, 'exit', Mock())
+    def test_start_no_children(self):
+        self.supervisor.start()
+
+        self.assertTrue(supervisor.sys.exit.called)
+
+    @patch.object(supervisor.os, 'kill', Mock())
+    def test_handle_stop_signal(self):
+        self.supervisor._children = {10: 0, 11: 1}
+
+        self.supervisor._handle_stop_signal(2, None)
+
+        self.assertTrue(self.supervisor._stopping)
+        self.assertEqual(len(supervisor.os.kill.call_args_list), 2)
+        supervisor.os.kill.assert_called_with(11, 2)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from toxicintegrations import tasks
+from tests import async_test
+
+
+class TaskSupervisorTest(TestCase):
+
+    def setUp(self):
+        self.supervisor = tasks.TaskSupervisor(concurrency=1, max_queue=1)
+
+    @async_test
+    async def test_submit(self):
+        async def coro():
+            return 'ok'
+
+        r = await self.supervisor.submit(coro())
+
+        self.assertEqual(r, 'ok')
+        self.assertEqual(len(self.supervisor), 0)
+
+    @async_test
+    async def test_submit_full(self):
+        wait = asyncio.Event()
+        t0 = self.supervisor.submit(wait.wait())
+        t1 = self.supervisor.submit(wait.wait())
+
+        coro = wait.wait()
+        with self.assertRaises(tasks.TooManyTasks):
+            self.supervisor.submit(coro)
+
+        wait.set()
+        await asyncio.gather(t0, t1)
+        self.assertFalse(self.supervisor.is_full())
+
+    @async_test
+    async def test_submit_batch(self):
+        async def coro():
+            return 'ok'
+
+        # a batch bigger than the queue takes only one slot.
+        t = self.supervisor.submit_batch([coro() for i in range(5)])
+        self.assertEqual(len(self.supervisor), 1)
+
+        r = await t
+
+        self.assertEqual(r, ['ok'] * 5)
+
+    @patch.object(tasks.TaskSupervisor, 'log', Mock())
+    @async_test
+    async def test_submit_batch_error(self):
+        async def coro():
+            return 'ok'
+
+        async def bad():
+            raise Exception
+
+        r = await self.supervisor.submit_batch([bad(), coro()])
+
+        self.assertEqual(r, [None, 'ok'])
+        self.assertTrue(tasks.TaskSupervisor.log.called)
+
+    @async_test
+    async def test_submit_batch_concurrency(self):
+        running = []
+        max_running = []
+
+        async def coro():
+            running.append(1)
+            max_running.append(len(running))
+            await asyncio.sleep(0)
+            running.pop()
+
+        await self.supervisor.submit_batch([coro() for i in range(5)],
+                                           concurrency=2)
+
+        self.assertEqual(max(max_running), 2)
+
+    @async_test
+    async def test_submit_batch_full(self):
+        wait = asyncio.Event()
+        t0 = self.supervisor.submit(wait.wait())
+        t1 = self.supervisor.submit(wait.wait())
+
+        with self.assertRaises(tasks.TooManyTasks):
+            self.supervisor.submit_batch([wait.wait(), wait.wait()])
+
+        # nothing from the batch was scheduled
+        self.assertEqual(len(self.supervisor), 2)
+        wait.set()
+        await asyncio.gather(t0, t1)
+
+    @async_test
+    async def test_stats(self):
+        wait = asyncio.Event()
+        t0 = self.supervisor.submit(wait.wait())
+        t1 = self.supervisor.submit(wait.wait())
+        await asyncio.sleep(0)
+
+        stats = self.supervisor.stats()
+        wait.set()
+        await asyncio.gather(t0, t1)
+
+        self.assertEqual(stats['running'], 1)
+        self.assertEqual(stats['queued'], 1)
+        self.assertGreaterEqual(stats['oldest_task_age'], 0)
+
+    def test_stats_no_tasks(self):
+        stats = self.supervisor.stats()
+
+        self.assertEqual(stats['oldest_task_age'], 0)
+
+    @patch.object(tasks.TaskSupervisor, 'log', Mock())
+    @async_test
+    async def test_submit_error(self):
+        async def coro():
+            raise Exception
+
+        await self.supervisor.submit(coro())
+
+        self.assertTrue(self.supervisor.log.called)
+        self.assertEqual(self.supervisor.stats()['running'], 0)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import Mock, AsyncMock, patch
+
+from toxicintegrations import tokens
+from tests import async_test
+
+
+class TokenRefresherTest(TestCase):
+
+    def setUp(self):
+        self.refresher = tokens.TokenRefresher(
+            margin=300, interval=60, idle_time=3600, jitter=0)
+
+    def _get_install(self, expires_soon=True):
+        install = Mock(id='some-id')
+        install.token_expires_in.return_value = expires_soon
+        install.refresh_expiring_token = AsyncMock()
+        return install
+
+    def test_touch(self):
+        self.refresher.touch(self._get_install())
+
+        self.assertEqual(len(self.refresher), 1)
+
+    @async_test
+    async def test_schedule_refreshes(self):
+        install = self._get_install()
+        self.refresher.touch(install)
+
+        tasks = self.refresher.schedule_refreshes()
+        self.assertEqual(self.refresher.stats()['scheduled'], 1)
+        for t in tasks:
+            await t
+
+        install.refresh_expiring_token.assert_called_with(360)
+        self.assertEqual(self.refresher.stats()['scheduled'], 0)
+
+    @async_test
+    async def test_schedule_refreshes_already_scheduled(self):
+        install = self._get_install()
+        self.refresher.touch(install)
+
+        tasks = self.refresher.schedule_refreshes()
+        tasks += self.refresher.schedule_refreshes()
+        for t in tasks:
+            await t
+
+        self.assertEqual(install.refresh_expiring_token.call_count, 1)
+
+    @async_test
+    async def test_schedule_refreshes_not_expiring(self):
+        self.refresher.touch(self._get_install(expires_soon=False))
+
+        tasks = self.refresher.schedule_refreshes()
+
+        self.assertFalse(tasks)
+
+    @patch.object(tokens, 'monotonic', Mock(side_effect=[0, 4000]))
+    @async_test
+    async def test_schedule_refreshes_idle(self):
+        self.refresher.touch(self._get_install())
+
+        tasks = self.refresher.schedule_refreshes()
+
+        self.assertFalse(tasks)
+        self.assertEqual(len(self.refresher), 0)
+
+    @patch.object(tokens.TokenRefresher, 'log', Mock())
+    @async_test
+    async def test_refresh_error(self):
+        install = self._get_install()
+        install.refresh_expiring_token.side_effect = Exception
+
+        await self.refresher._refresh(install)
+
+        self.assertTrue(self.refresher.log.called)
+
+    @async_test
+    async def test_run(self):
+        def schedule():
+            self.refresher.stop()
+
+        self.refresher.schedule_refreshes = Mock(side_effect=schedule)
+
+        await self.refresher.run()
+
+        self.assertTrue(self.refresher.schedule_refreshes.called)
+
+    @patch.object(tokens.TokenRefresher, 'log', Mock())
+    @async_test
+    async def test_run_error(self):
+        def schedule():
+            self.refresher.stop()
+            raise Exception
+
+        self.refresher.schedule_refreshes = Mock(side_effect=schedule)
+
+        await self.refresher.run()
+
+        self.assertTrue(self.refresher.log.called)
+
+    @async_test
+    async def test_wait(self):
+        self.refresher.interval = 0.01
+
+        await self.refresher._wait()
+
+        self.assertFalse(self.refresher._stop.is_set())
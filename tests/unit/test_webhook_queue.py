@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import Mock, AsyncMock, patch
+
+from toxicintegrations import webhook_queue
+from tests import async_test
+
+
+class WebhookDeliveryTest(TestCase):
+
+    @async_test
+    async def tearDown(self):
+        await webhook_queue.WebhookDelivery.drop_collection()
+
+    async def _enqueue(self):
+        request = Mock(uri='/github/webhooks?installation_id=1',
+                       headers={'X-GitHub-Event': 'push'},
+                       body=b'{"some": "thing"}')
+        return await webhook_queue.WebhookDelivery.enqueue(
+            'GithubWebhookReceiver', request)
+
+    @async_test
+    async def test_enqueue(self):
+        delivery = await self._enqueue()
+
+        self.assertTrue(delivery.id)
+        self.assertEqual(delivery.status, 'pending')
+        self.assertTrue(webhook_queue.new_delivery.is_set())
+
+    @async_test
+    async def test_claim(self):
+        await self._enqueue()
+
+        delivery = await webhook_queue.WebhookDelivery.claim()
+
+        self.assertEqual(delivery.status, 'processing')
+        self.assertEqual(delivery.attempts, 1)
+        self.assertIsNone(await webhook_queue.WebhookDelivery.claim())
+
+    @async_test
+    async def test_claim_empty_queue(self):
+        delivery = await webhook_queue.WebhookDelivery.claim()
+
+        self.assertIsNone(delivery)
+
+    @patch.object(webhook_queue, 'settings', Mock(WEBHOOK_QUEUE_LEASE=-10))
+    @async_test
+    async def test_claim_lease_expired(self):
+        await self._enqueue()
+        await webhook_queue.WebhookDelivery.claim()
+
+        delivery = await webhook_queue.WebhookDelivery.claim()
+
+        self.assertEqual(delivery.attempts, 2)
+
+    @async_test
+    async def test_done(self):
+        delivery = await self._enqueue()
+
+        await delivery.done()
+
+        count = await webhook_queue.WebhookDelivery.objects.count()
+        self.assertEqual(count, 0)
+
+    @async_test
+    async def test_fail_retry(self):
+        await self._enqueue()
+        delivery = await webhook_queue.WebhookDelivery.claim()
+
+        await delivery.fail('some error')
+
+        await delivery.reload()
+        self.assertEqual(delivery.status, 'pending')
+        self.assertIsNone(await webhook_queue.WebhookDelivery.claim())
+
+    @patch.object(webhook_queue, 'settings', Mock(
+        WEBHOOK_QUEUE_MAX_ATTEMPTS=1, WEBHOOK_QUEUE_LEASE=300))
+    @async_test
+    async def test_fail_too_many_attempts(self):
+        await self._enqueue()
+        delivery = await webhook_queue.WebhookDelivery.claim()
+
+        await delivery.fail('some error')
+
+        await delivery.reload()
+        self.assertEqual(delivery.status, 'failed')
+        self.assertEqual(delivery.error, 'some error')
+
+
+class WebhookDeliveryIdTest(TestCase):
+
+    def setUp(self):
+        webhook_queue._seen_deliveries.clear()
+
+    @async_test
+    async def tearDown(self):
+        await webhook_queue.WebhookDeliveryId.drop_collection()
+        webhook_queue._seen_deliveries.clear()
+
+    @async_test
+    async def test_register(self):
+        r = await webhook_queue.WebhookDeliveryId.register(
+            'GithubWebhookReceiver', 'some-id')
+
+        self.assertTrue(r)
+
+    @async_test
+    async def test_register_duplicated(self):
+        await webhook_queue.WebhookDeliveryId.register(
+            'GithubWebhookReceiver', 'some-id')
+        r = await webhook_queue.WebhookDeliveryId.register(
+            'GithubWebhookReceiver', 'some-id')
+
+        self.assertFalse(r)
+
+    @async_test
+    async def test_register_duplicated_other_process(self):
+        await webhook_queue.WebhookDeliveryId.register(
+            'GithubWebhookReceiver', 'some-id')
+        webhook_queue._seen_deliveries.clear()
+        r = await webhook_queue.WebhookDeliveryId.register(
+            'GithubWebhookReceiver', 'some-id')
+
+        self.assertFalse(r)
+
+    @patch.object(webhook_queue.WebhookDeliveryId, 'save', AsyncMock(
+        side_effect=Exception))
+    @async_test
+    async def test_register_error(self):
+        with self.assertRaises(Exception):
+            await webhook_queue.WebhookDeliveryId.register(
+                'GithubWebhookReceiver', 'some-id')
+
+        self.assertEqual(len(webhook_queue._seen_deliveries), 0)
+
+    @async_test
+    async def test_unregister(self):
+        await webhook_queue.WebhookDeliveryId.register(
+            'GithubWebhookReceiver', 'some-id')
+        await webhook_queue.WebhookDeliveryId.unregister(
+            'GithubWebhookReceiver', 'some-id')
+        r = await webhook_queue.WebhookDeliveryId.register(
+            'GithubWebhookReceiver', 'some-id')
+
+        self.assertTrue(r)
+
+
+class WebhookWorkerPoolTest(TestCase):
+
+    def setUp(self):
+        self.process_fn = AsyncMock()
+        self.pool = webhook_queue.WebhookWorkerPool(
+            self.process_fn, concurrency=2, poll_interval=0.01)
+
+    @async_test
+    async def tearDown(self):
+        await webhook_queue.WebhookDelivery.drop_collection()
+
+    @async_test
+    async def test_process(self):
+        delivery = Mock(spec=webhook_queue.WebhookDelivery)
+
+        await self.pool._process(delivery)
+
+        self.assertTrue(self.process_fn.called)
+        self.assertTrue(delivery.done.called)
+
+    @patch.object(webhook_queue.WebhookWorkerPool, 'log', Mock())
+    @async_test
+    async def test_process_error(self):
+        self.process_fn.side_effect = Exception
+        delivery = Mock(spec=webhook_queue.WebhookDelivery)
+
+        await self.pool._process(delivery)
+
+        self.assertTrue(delivery.fail.called)
+        self.assertFalse(delivery.done.called)
+
+    @patch.object(webhook_queue.WebhookWorkerPool, 'log', Mock())
+    @async_test
+    async def test_run(self):
+        request = Mock(uri='/github/webhooks', headers={}, body=b'{}')
+        await webhook_queue.WebhookDelivery.enqueue(
+            'GithubWebhookReceiver', request)
+
+        async def process_fn(delivery):
+            self.pool.stop()
+
+        self.pool.process_fn = process_fn
+        await self.pool.run()
+        for t in list(self.pool._tasks):
+            await t
+
+        count = await webhook_queue.WebhookDelivery.objects.count()
+        self.assertEqual(count, 0)
+
+    @patch.object(webhook_queue.WebhookWorkerPool, 'log', Mock())
+    @patch.object(webhook_queue.WebhookDelivery, 'claim', AsyncMock(
+        side_effect=Exception))
+    @async_test
+    async def test_run_claim_error(self):
+        async def wait():
+            self.pool.stop()
+
+        self.pool._wait_new_delivery = wait
+        await self.pool.run()
+
+        self.assertTrue(self.pool.log.called)
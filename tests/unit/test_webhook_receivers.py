@@ -30,9 +30,10 @@ class BaseWebhookReceiverTest(TestCase):
 
     def setUp(self):
         super().setUp()
-        body = webhook_receivers.json.dumps({"some": "thing"})
+        body = json.dumps({"some": "thing"})
         request = Mock()
         request.body = body.encode('utf-8')
+        request.headers = {}
         request.arguments = {}
         application = Mock()
         application.ui_methods = {}
@@ -68,7 +69,7 @@ class BaseWebhookReceiverTest(TestCase):
         self.webhook_receiver._parse_body()
         self.assertEqual(
             self.webhook_receiver.body,
-            webhook_receivers.json.loads(
+            json.loads(
                 self.webhook_receiver.request.body.decode()))
 
     def test_parse_body_no_body(self):
@@ -117,19 +118,179 @@ class BaseWebhookReceiverTest(TestCase):
         self.assertEqual(r, expected)
 
     @patch.object(webhook_receivers.LoggerMixin, 'log', Mock())
+    @patch.object(webhook_receivers.WebhookDelivery, 'enqueue', AsyncMock(
+        spec=webhook_receivers.WebhookDelivery.enqueue))
     @async_test
     async def test_receive_webhook(self):
         self.webhook_receiver.validate_webhook = AsyncMock()
         self.webhook_receiver.check_event_type = Mock(
             return_value='some-event')
 
-        async def some_event():
-            return 'ok'
+        some_event = AsyncMock()
 
         self.webhook_receiver.events = {'some-event': some_event}
         self.webhook_receiver.prepare()
         msg = await self.webhook_receiver.receive_webhook()
+        self.assertEqual(msg['code'], 202)
+        self.assertEqual(self.webhook_receiver.get_status(), 202)
+        self.assertTrue(webhook_receivers.WebhookDelivery.enqueue.called)
+        self.assertFalse(some_event.called)
+
+    @patch.object(webhook_receivers.LoggerMixin, 'log', Mock())
+    @patch.object(webhook_receivers.WebhookDelivery, 'enqueue', AsyncMock(
+        spec=webhook_receivers.WebhookDelivery.enqueue))
+    @patch.object(webhook_receivers.WebhookDeliveryId, 'register',
+                  AsyncMock(return_value=False))
+    @async_test
+    async def test_receive_webhook_duplicated(self):
+        self.webhook_receiver.validate_webhook = AsyncMock()
+        self.webhook_receiver.check_event_type = Mock(
+            return_value='some-event')
+        self.webhook_receiver.get_delivery_id = Mock(return_value='d-id')
+        self.webhook_receiver.events = {'some-event': AsyncMock()}
+        self.webhook_receiver.prepare()
+
+        msg = await self.webhook_receiver.receive_webhook()
+
+        self.assertEqual(msg['code'], 200)
+        self.assertFalse(webhook_receivers.WebhookDelivery.enqueue.called)
+
+    @patch.object(webhook_receivers.LoggerMixin, 'log', Mock())
+    @patch.object(webhook_receivers.WebhookDelivery, 'enqueue', AsyncMock(
+        spec=webhook_receivers.WebhookDelivery.enqueue,
+        side_effect=Exception))
+    @patch.object(webhook_receivers.WebhookDeliveryId, 'register',
+                  AsyncMock(return_value=True))
+    @patch.object(webhook_receivers.WebhookDeliveryId, 'unregister',
+                  AsyncMock())
+    @async_test
+    async def test_receive_webhook_enqueue_error(self):
+        self.webhook_receiver.validate_webhook = AsyncMock()
+        self.webhook_receiver.check_event_type = Mock(
+            return_value='some-event')
+        self.webhook_receiver.get_delivery_id = Mock(return_value='d-id')
+        self.webhook_receiver.events = {'some-event': AsyncMock()}
+        self.webhook_receiver.prepare()
+
+        with self.assertRaises(Exception):
+            await self.webhook_receiver.receive_webhook()
+
+        self.assertTrue(webhook_receivers.WebhookDeliveryId.unregister.called)
+
+    def test_get_delivery_id(self):
+        self.assertIsNone(self.webhook_receiver.get_delivery_id())
+
+    @patch.object(webhook_receivers.LoggerMixin, 'log', Mock())
+    @patch.object(webhook_receivers.WebhookDelivery, 'enqueue', AsyncMock(
+        spec=webhook_receivers.WebhookDelivery.enqueue))
+    @async_test
+    async def test_receive_webhook_ignored(self):
+        self.webhook_receiver.validate_webhook = AsyncMock()
+        self.webhook_receiver.check_event_type = Mock(return_value='push')
+        # a tag push
+        self.webhook_receiver.get_pushed_branches = Mock(return_value={})
+        self.webhook_receiver.prepare()
+
+        msg = await self.webhook_receiver.receive_webhook()
+
         self.assertEqual(msg['code'], 200)
+        self.assertFalse(webhook_receivers.WebhookDelivery.enqueue.called)
+
+    def test_should_handle_push(self):
+        self.webhook_receiver.event_type = 'push'
+        self.webhook_receiver.get_pushed_branches = Mock(
+            return_value={'bug-1': 'sha'})
+
+        self.assertTrue(self.webhook_receiver.should_handle())
+
+    def test_should_handle_push_no_branches(self):
+        self.webhook_receiver.event_type = 'push'
+        self.webhook_receiver.get_pushed_branches = Mock(return_value={})
+
+        self.assertFalse(self.webhook_receiver.should_handle())
+
+    def test_should_handle_other_event(self):
+        self.webhook_receiver.event_type = 'merge_request'
+
+        self.assertTrue(self.webhook_receiver.should_handle())
+
+    @patch.object(webhook_receivers.LoggerMixin, 'log', Mock())
+    @async_test
+    async def test_process_webhook(self):
+        self.webhook_receiver.check_event_type = Mock(
+            return_value='some-event')
+
+        some_event = AsyncMock()
+
+        self.webhook_receiver.events = {'some-event': some_event}
+        self.webhook_receiver.prepare()
+        self.webhook_receiver._load_event()
+        await self.webhook_receiver.process_webhook()
+        self.assertTrue(some_event.called)
+
+    def test_prepare(self):
+        self.webhook_receiver.prepare()
+
+        self.assertIsNone(self.webhook_receiver.body)
+        self.assertIsNone(self.webhook_receiver.event_type)
+        self.assertTrue(
+            self.webhook_receiver.request.connection.set_max_body_size.called)
+
+    @patch.object(webhook_receivers, 'settings', Mock(
+        WEBHOOK_MAX_BODY_SIZE=10))
+    def test_prepare_body_too_large(self):
+        self.webhook_receiver.request.headers = {'Content-Length': '11'}
+
+        with self.assertRaises(webhook_receivers.HTTPError) as ctx:
+            self.webhook_receiver.prepare()
+
+        self.assertEqual(ctx.exception.status_code, 413)
+
+    @async_test
+    async def test_data_received(self):
+        self.webhook_receiver.prepare()
+        await self.webhook_receiver.data_received(b'{"some": ')
+        await self.webhook_receiver.data_received(b'"thing"}')
+
+        self.webhook_receiver._finish_body()
+
+        self.assertEqual(self.webhook_receiver.request.body,
+                         b'{"some": "thing"}')
+
+    @patch.object(webhook_receivers, 'settings', Mock(
+        WEBHOOK_MAX_BODY_SIZE=10))
+    @async_test
+    async def test_data_received_too_large(self):
+        await self.webhook_receiver.data_received(b'{"some": ')
+        await self.webhook_receiver.data_received(b'"thing"}')
+
+        self.assertEqual(self.webhook_receiver._body_chunks, [])
+        with self.assertRaises(webhook_receivers.HTTPError) as ctx:
+            self.webhook_receiver._finish_body()
+
+        self.assertEqual(ctx.exception.status_code, 413)
+
+    @async_test
+    async def test_receive_webhook_bad_signature(self):
+        self.webhook_receiver.validate_webhook = AsyncMock(
+            side_effect=webhook_receivers.HTTPError(403))
+        self.webhook_receiver.prepare()
+
+        with self.assertRaises(webhook_receivers.HTTPError):
+            await self.webhook_receiver.receive_webhook()
+
+        self.assertIsNone(self.webhook_receiver.body)
+
+    @async_test
+    async def test_receive_webhook_bad_json(self):
+        self.webhook_receiver.validate_webhook = AsyncMock()
+        self.webhook_receiver.request.body = b'{bad'
+        self.webhook_receiver.prepare()
+
+        with self.assertRaises(webhook_receivers.HTTPError) as ctx:
+            await self.webhook_receiver.receive_webhook()
+
+        self.assertEqual(ctx.exception.status_code, 400)
 
     @patch.object(webhook_receivers.LoggerMixin, 'log', Mock())
     @async_test
@@ -164,18 +325,162 @@ class BaseWebhookReceiverTest(TestCase):
 
         self.assertTrue(self.webhook_receiver.create_installation.called)
 
+    @patch.object(webhook_receivers, 'settings', Mock())
+    @async_test
+    async def test_setup_too_many_tasks(self):
+        self.webhook_receiver._get_user_from_cookie = AsyncMock(
+            return_value=Mock())
+        self.webhook_receiver.redirect = Mock()
+        self.webhook_receiver.create_installation = Mock(
+            side_effect=webhook_receivers.TooManyTasks)
+
+        with self.assertRaises(webhook_receivers.HTTPError) as ctx:
+            await self.webhook_receiver.setup()
+
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertFalse(self.webhook_receiver.redirect.called)
+
     def test_get_repo_external_id(self):
         with self.assertRaises(NotImplementedError):
             self.webhook_receiver.get_repo_external_id()
 
+    def test_get_trimmed_push_body(self):
+        with self.assertRaises(NotImplementedError):
+            self.webhook_receiver.get_trimmed_push_body()
+
+    def test_trim_body_not_push(self):
+        self.webhook_receiver.event_type = 'merge_request'
+
+        self.assertIsNone(self.webhook_receiver.trim_body())
+
+    @patch.object(webhook_receivers, 'settings', Mock(
+        WEBHOOK_MAX_BODY_SIZE=100, WEBHOOK_MAX_STORED_BODY_SIZE=5))
+    @patch.object(webhook_receivers.LoggerMixin, 'log', Mock())
+    @patch.object(webhook_receivers.WebhookDelivery, 'enqueue', AsyncMock(
+        spec=webhook_receivers.WebhookDelivery.enqueue))
+    @async_test
+    async def test_receive_webhook_trimmed_body(self):
+        self.webhook_receiver.validate_webhook = AsyncMock()
+        self.webhook_receiver.check_event_type = Mock(return_value='push')
+        self.webhook_receiver.get_pushed_branches = Mock(
+            return_value={'master': 'sha'})
+        self.webhook_receiver.get_trimmed_push_body = Mock(
+            return_value={'ref': 'refs/heads/master'})
+        self.webhook_receiver.prepare()
+
+        msg = await self.webhook_receiver.receive_webhook()
+
+        self.assertEqual(msg['code'], 202)
+        self.assertEqual(self.webhook_receiver.request.body,
+                         webhook_receivers.codec.dumps(
+                             {'ref': 'refs/heads/master'}))
+        self.assertTrue(webhook_receivers.WebhookDelivery.enqueue.called)
+
+    @patch.object(webhook_receivers, 'settings', Mock(
+        WEBHOOK_MAX_BODY_SIZE=100, WEBHOOK_MAX_STORED_BODY_SIZE=5))
+    @patch.object(webhook_receivers.LoggerMixin, 'log', Mock())
+    @patch.object(webhook_receivers.WebhookDelivery, 'enqueue', AsyncMock(
+        spec=webhook_receivers.WebhookDelivery.enqueue))
+    @async_test
+    async def test_receive_webhook_too_large_to_store(self):
+        self.webhook_receiver.validate_webhook = AsyncMock()
+        self.webhook_receiver.check_event_type = Mock(
+            return_value='merge_request')
+        self.webhook_receiver.prepare()
+
+        with self.assertRaises(webhook_receivers.HTTPError) as ctx:
+            await self.webhook_receiver.receive_webhook()
+
+        self.assertEqual(ctx.exception.status_code, 413)
+        self.assertFalse(webhook_receivers.WebhookDelivery.enqueue.called)
+
+    def test_get_pushed_branches(self):
+        with self.assertRaises(NotImplementedError):
+            self.webhook_receiver.get_pushed_branches()
+
     @async_test
     async def test_handle_push(self):
         self.webhook_receiver.get_repo_external_id = Mock()
-        self.webhook_receiver.get_install = AsyncMock()
+        self.webhook_receiver.get_pushed_branches = Mock(
+            return_value={'master': 'sha'})
+        install = Mock(schedule_update=AsyncMock(),
+                       get_wanted_branches=AsyncMock(
+                           return_value={'master': 'sha'}))
+        self.webhook_receiver.get_install = AsyncMock(return_value=install)
         await self.webhook_receiver.handle_push()
 
-        install = self.webhook_receiver.get_install.return_value
-        self.assertTrue(install.update_repository.called)
+        called = install.schedule_update.call_args[1]
+        self.assertEqual(called['repo_branches'],
+                         {'master': {'notify_only_latest': True}})
+
+    @async_test
+    async def test_handle_push_unknown_branch(self):
+        self.webhook_receiver.get_repo_external_id = Mock()
+        self.webhook_receiver.get_pushed_branches = Mock(return_value={})
+        install = Mock(schedule_update=AsyncMock())
+        self.webhook_receiver.get_install = AsyncMock(return_value=install)
+        await self.webhook_receiver.handle_push()
+
+        called = install.schedule_update.call_args[1]
+        self.assertIsNone(called['repo_branches'])
+
+    @patch.object(webhook_receivers.LoggerMixin, 'log', Mock())
+    @async_test
+    async def test_handle_push_branch_not_configured(self):
+        self.webhook_receiver.get_repo_external_id = Mock()
+        self.webhook_receiver.get_pushed_branches = Mock(
+            return_value={'other': 'sha'})
+        install = Mock(schedule_update=AsyncMock(),
+                       get_wanted_branches=AsyncMock(return_value={}))
+        self.webhook_receiver.get_install = AsyncMock(return_value=install)
+
+        r = await self.webhook_receiver.handle_push()
+
+        self.assertEqual(r, 'push ignored')
+        self.assertFalse(install.schedule_update.called)
+
+    @async_test
+    async def test_handle_push_update_error(self):
+        self.webhook_receiver.get_repo_external_id = Mock()
+        self.webhook_receiver.get_pushed_branches = Mock(
+            return_value={'master': 'sha'})
+        install = Mock(schedule_update=AsyncMock(side_effect=Exception),
+                       get_wanted_branches=AsyncMock(
+                           return_value={'master': 'sha'}))
+        self.webhook_receiver.get_install = AsyncMock(return_value=install)
+
+        # the error goes to the webhook worker so the delivery is retried.
+        with self.assertRaises(Exception):
+            await self.webhook_receiver.handle_push()
+
+    @async_test
+    async def test_handle_push_cancelled(self):
+        self.webhook_receiver.get_repo_external_id = Mock()
+        self.webhook_receiver.get_pushed_branches = Mock(
+            return_value={'master': 'sha'})
+        update = asyncio.get_event_loop().create_future()
+        install = Mock(schedule_update=Mock(return_value=update),
+                       get_wanted_branches=AsyncMock(
+                           return_value={'master': 'sha'}))
+        self.webhook_receiver.get_install = AsyncMock(return_value=install)
+
+        t = asyncio.ensure_future(self.webhook_receiver.handle_push())
+        await asyncio.sleep(0)
+        t.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await t
+
+        # the update shared with the other pushes is not cancelled.
+        self.assertFalse(update.cancelled())
+        update.set_result(None)
+
+    def test_get_branch_from_ref(self):
+        r = self.webhook_receiver._get_branch_from_ref('refs/heads/feat/x')
+        self.assertEqual(r, 'feat/x')
+
+    def test_get_branch_from_ref_tag(self):
+        r = self.webhook_receiver._get_branch_from_ref('refs/tags/v1.0')
+        self.assertIsNone(r)
 
     def test_get_pull_request_source(self):
         with self.assertRaises(NotImplementedError):
@@ -268,14 +573,43 @@ class BaseWebhookReceiverTest(TestCase):
         self.webhook_receiver.params = {'installation_id': 'asf'}
         self.webhook_receiver.INSTALL_CLS = AsyncMock()
         await self.webhook_receiver.get_install()
-        self.assertTrue(self.webhook_receiver.INSTALL_CLS.objects.get.called)
+        self.assertTrue(self.webhook_receiver.INSTALL_CLS.get_cached.called)
+
+    @patch.object(webhook_receivers, 'settings', Mock(HEALTH_TOKEN='tk'))
+    def test_health(self):
+        self.webhook_receiver.request.headers = {
+            'Authorization': 'Token tk'}
+        r = self.webhook_receiver.health()
+        self.assertIn('hits', r['install_cache'])
+        self.assertIn('hits', r['response_cache'])
+        self.assertIn('oldest_task_age', r['tasks'])
+        self.assertIn('active', r['tokens'])
+        self.assertIn('running', r['clones'])
+        self.assertIn('app', r)
+        self.assertIn('metrics', r)
+
+    @patch.object(webhook_receivers, 'settings', Mock(HEALTH_TOKEN='tk'))
+    def test_health_bad_token(self):
+        self.webhook_receiver.request.headers = {
+            'Authorization': 'Token bad'}
+        r = self.webhook_receiver.health()
+
+        self.assertEqual(r, {'code': 200})
+
+    @patch.object(webhook_receivers, 'settings', Mock(HEALTH_TOKEN=None))
+    def test_health_no_token_configured(self):
+        self.webhook_receiver.request.headers = {
+            'Authorization': 'Token None'}
+        r = self.webhook_receiver.health()
+
+        self.assertEqual(r, {'code': 200})
 
 
 class GithubWebhookReceiverTest(TestCase):
 
     def setUp(self):
         super().setUp()
-        body = webhook_receivers.json.dumps({
+        body = json.dumps({
             "zen": "Speak like a human.",
             "hook_id": 'ZZZZZ',
             "repository": {"id": "some-id"},
@@ -300,13 +634,20 @@ class GithubWebhookReceiverTest(TestCase):
         })
         request = Mock()
         request.body = body.encode('utf-8')
+        request.headers = {}
         request.arguments = {}
         application = Mock()
         application.ui_methods = {}
         self.webhook_receiver = webhook_receivers.GithubWebhookReceiver(
             application, request)
+        webhook_receivers.BaseIntegration.clear_cache()
 
     @patch.object(webhook_receivers, 'settings', Mock())
+    def test_get_app_status(self):
+        status = self.webhook_receiver.get_app_status()
+
+        self.assertIn('checked', status)
+
     def test_create_installation_without_installation_id(self):
         # installation_id is sent as a get param by github
         user = Mock()
@@ -354,8 +695,8 @@ class GithubWebhookReceiverTest(TestCase):
         body = {'installation': {'id': '123'},
                 'repositories_added': [{'full_name': 'my/repo'}]}
         self.webhook_receiver.body = body
-        tasks = await self.webhook_receiver._handle_install_repo_added()
-        await asyncio.gather(*tasks)
+        task = await self.webhook_receiver._handle_install_repo_added()
+        await task
         install = webhook_receivers.GithubIntegration.objects.get.return_value
         self.assertTrue(install.import_repository.called)
 
@@ -366,7 +707,8 @@ class GithubWebhookReceiverTest(TestCase):
         body = {'installation': {'id': '123'},
                 'repositories_removed': [{'id': '4321'}]}
         self.webhook_receiver.body = body
-        await self.webhook_receiver._handle_install_repo_removed()
+        task = await self.webhook_receiver._handle_install_repo_removed()
+        await task
         install = webhook_receivers.GithubIntegration.objects.get.return_value
         self.assertTrue(install.remove_repository.called)
 
@@ -440,6 +782,22 @@ class GithubWebhookReceiverTest(TestCase):
         await self.webhook_receiver.validate_webhook()
         self.assertTrue(app.validate_token.called)
 
+    @patch.object(webhook_receivers.GithubApp, 'get_app', AsyncMock(
+        spec=webhook_receivers.GithubApp.get_app,
+        return_value=Mock()))
+    @async_test
+    async def test_validate_webhook_streamed(self):
+        app = webhook_receivers.GithubApp.get_app.return_value
+        await self.webhook_receiver.data_received(b'{"some": ')
+        await self.webhook_receiver.data_received(b'"thing"}')
+
+        await self.webhook_receiver.validate_webhook()
+
+        digest = app.get_digest.return_value
+        self.assertEqual(len(digest.update.call_args_list), 2)
+        self.assertTrue(app.validate_digest.called)
+        self.assertFalse(app.validate_token.called)
+
     @patch.object(webhook_receivers.GithubApp, 'get_app', AsyncMock(
         spec=webhook_receivers.GithubApp.get_app,
         return_value=Mock()))
@@ -450,19 +808,78 @@ class GithubWebhookReceiverTest(TestCase):
         with self.assertRaises(webhook_receivers.HTTPError):
             await self.webhook_receiver.validate_webhook()
 
+    def test_from_delivery(self):
+        delivery = webhook_receivers.WebhookDelivery(
+            receiver='GithubWebhookReceiver',
+            uri='/github/webhooks',
+            headers={'X-GitHub-Event': 'push'},
+            body=self.webhook_receiver.request.body)
+        application = Mock()
+        application.ui_methods = {}
+        receiver = webhook_receivers.GithubWebhookReceiver.from_delivery(
+            application, delivery)
+
+        self.assertEqual(receiver.event_type, 'push')
+        self.assertEqual(receiver.body['repository']['id'], 'some-id')
+
+    def test_get_delivery_id(self):
+        self.webhook_receiver.request.headers = {
+            'X-GitHub-Delivery': 'the-id'}
+        self.assertEqual(self.webhook_receiver.get_delivery_id(), 'the-id')
+
     def test_get_repo_external_id(self):
         self.webhook_receiver.prepare()
+        self.webhook_receiver._load_event()
         expected = 'some-id'
         r = self.webhook_receiver.get_repo_external_id()
 
         self.assertEqual(r, expected)
 
+    def test_get_pushed_branches(self):
+        self.webhook_receiver.body = {'ref': 'refs/heads/master',
+                                      'after': 'the-sha'}
+        r = self.webhook_receiver.get_pushed_branches()
+
+        self.assertEqual(r, {'master': 'the-sha'})
+
+    def test_get_pushed_branches_tag(self):
+        self.webhook_receiver.body = {'ref': 'refs/tags/v1.0',
+                                      'after': 'the-sha'}
+        r = self.webhook_receiver.get_pushed_branches()
+
+        self.assertEqual(r, {})
+
+    def test_get_pushed_branches_deleted(self):
+        self.webhook_receiver.body = {'ref': 'refs/heads/master',
+                                      'after': '0' * 40,
+                                      'deleted': True}
+        r = self.webhook_receiver.get_pushed_branches()
+
+        self.assertEqual(r, {})
+
+    def test_get_trimmed_push_body(self):
+        self.webhook_receiver.body = {'ref': 'refs/heads/master',
+                                      'after': 'the-sha',
+                                      'deleted': False,
+                                      'commits': [{'id': 'the-sha'}],
+                                      'repository': {'id': 'some-id',
+                                                     'name': 'repo'},
+                                      'installation': {'id': 123}}
+
+        r = self.webhook_receiver.get_trimmed_push_body()
+
+        self.assertEqual(r, {'ref': 'refs/heads/master',
+                             'after': 'the-sha',
+                             'deleted': False,
+                             'repository': {'id': 'some-id'},
+                             'installation': {'id': 123}})
+
 
 class GitlabWebhookReceiverTest(TestCase):
 
     def setUp(self):
         super().setUp()
-        body = webhook_receivers.json.dumps({
+        body = json.dumps({
             "object_kind": "push",
             "before": "95790bf891e76fee5e1747ab589903a6a1f80f22",
             "after": "da1560886d4f094c3e6c9ef40349f7d38b5d27d7",
@@ -532,12 +949,14 @@ class GitlabWebhookReceiverTest(TestCase):
         })
         request = Mock()
         request.body = body.encode('utf-8')
+        request.headers = {}
         request.arguments = {}
         application = Mock()
         application.ui_methods = {}
         self.webhook_receiver = webhook_receivers.GitlabWebhookReceiver(
             application, request)
         self.webhook_receiver.prepare()
+        self.webhook_receiver._load_event()
 
     def test_state_is_valid_no_state(self):
         self.webhook_receiver.params = {}
@@ -589,6 +1008,56 @@ class GitlabWebhookReceiverTest(TestCase):
 
         self.assertEqual(self.webhook_receiver.get_repo_external_id(), 15)
 
+    def test_get_pushed_branches(self):
+        self.webhook_receiver.body = {'ref': 'refs/heads/master',
+                                      'after': 'the-sha'}
+        r = self.webhook_receiver.get_pushed_branches()
+
+        self.assertEqual(r, {'master': 'the-sha'})
+
+    def test_get_pushed_branches_deleted(self):
+        self.webhook_receiver.body = {'ref': 'refs/heads/master',
+                                      'after': '0' * 40}
+        r = self.webhook_receiver.get_pushed_branches()
+
+        self.assertEqual(r, {})
+
+    def test_get_trimmed_push_body(self):
+        r = self.webhook_receiver.get_trimmed_push_body()
+
+        self.assertEqual(r, {
+            'object_kind': 'push',
+            'ref': 'refs/heads/master',
+            'after': 'da1560886d4f094c3e6c9ef40349f7d38b5d27d7',
+            'project': {'id': 15}})
+
+    def test_should_handle_merge_request_open(self):
+        self.webhook_receiver.event_type = 'merge_request'
+        self.webhook_receiver.body = {'object_attributes': {'action': 'open'}}
+
+        self.assertTrue(self.webhook_receiver.should_handle())
+
+    def test_should_handle_merge_request_new_commits(self):
+        self.webhook_receiver.event_type = 'merge_request'
+        self.webhook_receiver.body = {'object_attributes': {
+            'action': 'update', 'oldrev': 'some-sha'}}
+
+        self.assertTrue(self.webhook_receiver.should_handle())
+
+    def test_should_handle_merge_request_edit(self):
+        self.webhook_receiver.event_type = 'merge_request'
+        self.webhook_receiver.body = {'object_attributes': {
+            'action': 'update'}}
+
+        self.assertFalse(self.webhook_receiver.should_handle())
+
+    def test_should_handle_merge_request_close(self):
+        self.webhook_receiver.event_type = 'merge_request'
+        self.webhook_receiver.body = {'object_attributes': {
+            'action': 'close'}}
+
+        self.assertFalse(self.webhook_receiver.should_handle())
+
     @patch.object(
         webhook_receivers.BaseWebhookReceiver, 'validate_webhook',
         AsyncMock(
@@ -720,12 +1189,17 @@ class GitlabWebhookReceiverTest(TestCase):
         r = self.webhook_receiver.get_request_signature()
         self.assertEqual(r, 'token')
 
+    def test_get_delivery_id(self):
+        self.webhook_receiver.request.headers = {
+            'X-Gitlab-Event-UUID': 'the-id'}
+        self.assertEqual(self.webhook_receiver.get_delivery_id(), 'the-id')
+
 
 class BitbucketWebhookReceriverTest(TestCase):
 
     def setUp(self):
         super().setUp()
-        body = webhook_receivers.json.dumps({"some": "thing"})
+        body = json.dumps({"some": "thing"})
         request = Mock()
         request.body = body.encode('utf-8')
         request.headers = {'X-Event-Key': 'repo:push'}
@@ -745,6 +1219,10 @@ class BitbucketWebhookReceriverTest(TestCase):
         self.assertEqual(self.webhook_receriver.get_request_signature(),
                          'bla')
 
+    def test_get_delivery_id(self):
+        self.webhook_receriver.request.headers = {'X-Request-UUID': 'the-id'}
+        self.assertEqual(self.webhook_receriver.get_delivery_id(), 'the-id')
+
     def test_get_external_id(self):
         self.webhook_receriver.body = {
             'repository': {
@@ -754,6 +1232,50 @@ class BitbucketWebhookReceriverTest(TestCase):
 
         self.assertEqual(self.webhook_receriver.get_external_id(),
                          'the-repo-uuid')
+        self.assertEqual(self.webhook_receriver.get_repo_external_id(),
+                         'the-repo-uuid')
+
+    def test_get_pushed_branches(self):
+        self.webhook_receriver.body = {
+            'push': {
+                'changes': [
+                    {'new': {'type': 'branch', 'name': 'master',
+                             'target': {'hash': 'the-sha'}}},
+                    {'new': {'type': 'tag', 'name': 'v1.0',
+                             'target': {'hash': 'other-sha'}}},
+                    {'new': None},
+                ]
+            }
+        }
+
+        self.assertEqual(self.webhook_receriver.get_pushed_branches(),
+                         {'master': 'the-sha'})
+
+    def test_get_trimmed_push_body(self):
+        self.webhook_receriver.body = {
+            'repository': {'uuid': 'the-repo-uuid', 'name': 'repo'},
+            'push': {
+                'changes': [
+                    {'new': {'type': 'branch', 'name': 'master',
+                             'target': {'hash': 'the-sha',
+                                        'message': 'a commit'}},
+                     'commits': [{'hash': 'the-sha'}]},
+                    {'new': None},
+                ]
+            }
+        }
+
+        r = self.webhook_receriver.get_trimmed_push_body()
+
+        self.assertEqual(r, {
+            'repository': {'uuid': 'the-repo-uuid'},
+            'push': {'changes': [
+                {'new': {'type': 'branch', 'name': 'master',
+                         'target': {'hash': 'the-sha'}}},
+                {'new': None}]}})
+
+    def test_events(self):
+        self.assertIn('repo:push', self.webhook_receriver.events)
 
     def test_get_pull_request_source(self):
         self.webhook_receriver.body = {
@@ -784,3 +1306,20 @@ class BitbucketWebhookReceriverTest(TestCase):
         self.assertEqual(
             self.webhook_receriver.get_pull_request_target()['branch'],
             'master')
+
+
+class ProcessDeliveryTest(TestCase):
+
+    @patch.object(webhook_receivers.GithubWebhookReceiver, 'from_delivery',
+                  Mock())
+    @async_test
+    async def test_process_delivery(self):
+        receiver = webhook_receivers.GithubWebhookReceiver.\
+            from_delivery.return_value
+        receiver.process_webhook = AsyncMock()
+        delivery = webhook_receivers.WebhookDelivery(
+            receiver='GithubWebhookReceiver', uri='/github/webhooks')
+
+        await webhook_receivers.process_delivery(delivery)
+
+        self.assertTrue(receiver.process_webhook.called)
@@ -30,6 +30,7 @@ To implement a new integration you must extend the following classes:
 Check the documentation for each class for more information.
 """
 
+from mongoengine.connection import disconnect
 from mongomotor import connect
 from toxiccore.conf import Settings
 
@@ -51,10 +52,22 @@ def create_settings_and_connect():
     dbconn = connect(**dbsettings)
 
 
+def reconnect():
+    """Opens a new connection to the database. Must be called in
+    forked processes because the connection of the parent process
+    can't be shared."""
+    global dbconn
+
+    disconnect()
+    dbconn = connect(**settings.DATABASE)
+
+
 def ensure_indexes():
+    from .base import ExternalInstallationRepository
     from .github import GithubApp, GithubIntegration
     from .gitlab import GitlabApp, GitlabIntegration
     from .bitbucket import BitbucketApp, BitbucketIntegration
+    from .webhook_queue import WebhookDelivery, WebhookDeliveryId
 
     GithubApp.ensure_indexes()
     GithubIntegration.ensure_indexes()
@@ -62,3 +75,6 @@ def ensure_indexes():
     GitlabIntegration.ensure_indexes()
     BitbucketApp.ensure_indexes()
     BitbucketIntegration.ensure_indexes()
+    ExternalInstallationRepository.ensure_indexes()
+    WebhookDelivery.ensure_indexes()
+    WebhookDeliveryId.ensure_indexes()
@@ -16,18 +16,23 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
 
-from asyncio import ensure_future, gather, sleep
+from asyncio import ensure_future, shield, sleep
 from datetime import timedelta
+import fnmatch
 import re
 import traceback
+from urllib.parse import urlparse
+from uuid import uuid4
 
-from mongomotor import Document, EmbeddedDocument
+from mongoengine.queryset.visitor import Q
+from mongomotor import Document
 from mongomotor.fields import (
     StringField,
-    EmbeddedDocumentListField,
+    ReferenceField,
     DynamicField,
     DateTimeField,
 )
+from pymongo import UpdateOne
 from toxiccommon.exceptions import (
     AlreadyExists,
     RepositoryDoesNotExist,
@@ -38,21 +43,81 @@ from toxiccommon.interfaces import (
     UserInterface,
     BaseInterface
 )
-from toxiccore import requests
 from toxiccore.exceptions import ToxicClientException
 from toxiccore.utils import (LoggerMixin, now, utc2localtime,
                              localtime2utc)
 from toxicnotifications.base import Notification
 
-from toxicintegrations import settings
+from toxicintegrations import requests, settings
+from toxicintegrations.cache import TTLCache, ResponseCache
+from toxicintegrations.coalescer import update_coalescer
 from toxicintegrations.exceptions import (
     BadRepository,
     BadRequestToExternalAPI,
     BadSignature
 )
+from toxicintegrations.importer import ImportPipeline, clone_semaphore
+from toxicintegrations.ratelimit import rate_limiter, PRIORITY_NORMAL
+from toxicintegrations.tokens import token_refresher
 
 BaseInterface.settings = settings
 
+# The branches configured for the imported repositories.
+DEFAULT_BRANCHES = [
+    dict(name='master', notify_only_latest=True),
+    dict(name='feature-*', notify_only_latest=True),
+    dict(name='bug-*', notify_only_latest=True)]
+
+
+def match_branches(branches, configured):
+    """Returns the branches that match one of the branches configured
+    for a repository.
+
+    :param branches: A dictionary ``{branch_name: head_sha}``.
+    :param configured: The branches configured for the repository, a list
+      of dictionaries with the ``name`` of the branch that may be a
+      fnmatch pattern.
+    """
+    patterns = [b['name'] for b in configured]
+    return {branch: sha for branch, sha in branches.items()
+            if any(fnmatch.fnmatchcase(branch, p) for p in patterns)}
+
+
+def normalize_external_id(external_id):
+    """Returns the id of a repository in an external service in the
+    form used to compare ids. Github and Gitlab ids are ints (that may
+    come as strings) and Bitbucket ids are uuids (that may come with
+    braces).
+
+    :param external_id: The id of the repository in the external service.
+    """
+    return str(external_id).strip().strip('{}').lower()
+
+
+# The integration apps almost never change so we keep them in memory
+# instead of reading them from the database on every webhook.
+_app_cache = TTLCache(getattr(settings, 'INTEGRATIONS_APP_CACHE_TTL', 60))
+# Installations are looked up on every push and pull request so we keep
+# the most used ones in memory.
+_install_cache = TTLCache(
+    getattr(settings, 'INSTALLATIONS_CACHE_TTL', 60),
+    maxsize=getattr(settings, 'INSTALLATIONS_CACHE_SIZE', 1000))
+# The responses of GET requests to the 3rd party apis are revalidated
+# with conditional requests so unchanged resources are not downloaded
+# again. Github does not count 304 responses against the rate limit.
+_response_cache = ResponseCache(
+    getattr(settings, 'HTTP_RESPONSE_CACHE_SIZE', 1000))
+_CONDITIONAL_HEADERS = ('if-none-match', 'if-modified-since')
+# The repositories are read from the master on every push and pull
+# request so we keep them in memory for a little while. The keys are
+# (installation id, normalized external id).
+_repo_cache = TTLCache(
+    getattr(settings, 'REPOSITORY_CACHE_TTL', 10),
+    maxsize=getattr(settings, 'REPOSITORY_CACHE_SIZE', 1000))
+# The token refreshes running in this process. Concurrent requests for
+# a new token for the same installation wait for the same refresh.
+_token_refreshes = {}
+
 
 class BaseIntegrationApp(LoggerMixin, Document):
     """An integration app is an application registered in a
@@ -93,21 +158,51 @@ class BaseIntegrationApp(LoggerMixin, Document):
 
     @classmethod
     async def get_app(cls):
-        """Returns the app instance. If it does not exist, create it."""
+        """Returns the app instance. If it does not exist, create it.
 
-        app = await cls.objects.first()
+        The app is cached in memory for
+        ``settings.INTEGRATIONS_APP_CACHE_TTL`` seconds."""
+
+        app = _app_cache.get(cls)
         if app:
             return app
 
-        app = await cls.create_app()
+        app = await cls.objects.first()
+        if not app:
+            app = await cls.create_app()
+
+        _app_cache.set(cls, app)
         return app
 
+    @classmethod
+    def invalidate_cache(cls):
+        """Removes the app from the cache so the next call to
+        :meth:`~toxicintegrations.base.BaseIntegrationApp.get_app`
+        reads it from the database."""
 
-class ExternalInstallationRepository(LoggerMixin, EmbeddedDocument):
-    """Information about a repository in an external service."""
+        _app_cache.pop(cls)
 
-    external_id = DynamicField(required=True)
-    """The id of the repository in the external service."""
+    async def save(self, *args, **kwargs):
+        r = await super().save(*args, **kwargs)
+        _app_cache.set(type(self), self)
+        return r
+
+    async def delete(self, *args, **kwargs):
+        r = await super().delete(*args, **kwargs)
+        self.invalidate_cache()
+        return r
+
+
+class ExternalInstallationRepository(LoggerMixin, Document):
+    """Information about a repository in an external service imported
+    by an installation."""
+
+    installation = ReferenceField('BaseIntegration', required=True)
+    """The installation that imported the repository."""
+
+    external_id = StringField(required=True)
+    """The id of the repository in the external service, normalized
+    by :func:`~toxicintegrations.base.normalize_external_id`."""
 
     repository_id = StringField(required=True)
     """The id of the repository in ToxicBuild."""
@@ -115,6 +210,53 @@ class ExternalInstallationRepository(LoggerMixin, EmbeddedDocument):
     full_name = StringField(required=True)
     """Full name of the repository in the external service."""
 
+    meta = {'collection': 'external_installation_repository',
+            'indexes': [{'fields': ['installation', 'external_id'],
+                         'unique': True}]}
+
+    @classmethod
+    async def add(cls, installation, external_id, repository_id, full_name):
+        """Atomically inserts or updates the repository of an installation.
+        Concurrent imports for the same installation only write their own
+        row.
+
+        :param installation: The installation that imported the repository.
+        :param external_id: The id of the repository in the external
+          service.
+        :param repository_id: The id of the repository in ToxicBuild.
+        :param full_name: Full name of the repository in the external
+          service.
+        """
+        qs = cls.objects.filter(installation=installation,
+                                external_id=normalize_external_id(
+                                    external_id))
+        await qs.update_one(upsert=True, set__repository_id=repository_id,
+                            set__full_name=full_name)
+
+    @classmethod
+    async def bulk_add(cls, installation_id, repos):
+        """Inserts or updates many repositories of an installation in
+        only one request to the database.
+
+        :param installation_id: The id of the installation.
+        :param repos: A list of dictionaries with the keys
+          ``external_id``, ``repository_id`` and ``full_name``.
+        """
+        ops = []
+        for repo in repos:
+            ext_id = normalize_external_id(repo['external_id'])
+            ops.append(UpdateOne(
+                {'installation': installation_id, 'external_id': ext_id},
+                {'$set': {'repository_id': repo['repository_id'],
+                          'full_name': repo['full_name']}},
+                upsert=True))
+
+        if not ops:
+            return 0
+
+        await cls._get_collection().bulk_write(ops, ordered=False)
+        return len(ops)
+
 
 class BaseIntegration(LoggerMixin, Document):
     """We have an integration instance per user that allow us
@@ -142,9 +284,6 @@ class BaseIntegration(LoggerMixin, Document):
     external_user_id = DynamicField()
     """The id of the user in a 3rd party service."""
 
-    repositories = EmbeddedDocumentListField(ExternalInstallationRepository)
-    """The repositories imported from the user external service account."""
-
     access_token = StringField()
     """Access token used for authentication on the api."""
 
@@ -155,13 +294,26 @@ class BaseIntegration(LoggerMixin, Document):
     expires = DateTimeField()
     """When the access_token expires. Datetime must be UTC."""
 
+    token_refresh_lock = DateTimeField()
+    """A process is refreshing the access token until this time.
+    Datetime must be UTC."""
+
+    token_refresh_owner = StringField()
+    """An unique value of the lease taken by the process refreshing
+    the access token."""
+
     url_user = None
     """Used as username in a url that has authentication like user:pass@host.
     """
 
     notif_name = None
 
+    # Not strict because the installations created before the
+    # repositories were moved to their own collection still have the
+    # repositories field until they are migrated.
+    # See BaseIntegration.migrate_repositories
     meta = {'allow_inheritance': True,
+            'strict': False,
             'collection': 'base_integration_installation'}
 
     async def list_repos(self):
@@ -221,12 +373,24 @@ class BaseIntegration(LoggerMixin, Document):
     @property
     def token_is_expired(self):
         """Informs if the installation auth token is expired."""
+        if self.expires is None:
+            return False
         n = now()
         print(utc2localtime(self.expires))
         if n > utc2localtime(self.expires):
             return True
         return False
 
+    def token_expires_in(self, seconds):
+        """Informs if the installation auth token expires in the next
+        ``seconds`` seconds.
+
+        :param seconds: A number of seconds."""
+        if self.expires is None:
+            return False
+        n = now() + timedelta(seconds=seconds)
+        return n > utc2localtime(self.expires)
+
     async def get_user_id(self):
         self.external_user_id = await self.request_user_id()
         await self.save()
@@ -241,8 +405,7 @@ class BaseIntegration(LoggerMixin, Document):
             raise BadRequestToExternalAPI(
                 'You need to set an url_user in your integration class')
 
-        if not self.access_token:
-            await self.create_access_token()
+        await self.ensure_token()
 
         p = re.compile(r'(\w+)://(.*)')
         protocol, url = p.match(url).groups()
@@ -256,11 +419,118 @@ class BaseIntegration(LoggerMixin, Document):
         refresh the token.
         """
 
+        await self.ensure_token()
+        return self.access_token
+
+    async def ensure_token(self):
+        """Makes sure the installation has a valid access token. If the
+        token does not exist creates a new one. If the token is expired
+        refresh the token.
+
+        Only one refresh per installation runs at a time. Concurrent
+        calls in the same process wait for the same refresh and
+        the processes take a lease in the database before refreshing.
+
+        The installation is registered in the
+        :class:`~toxicintegrations.tokens.TokenRefresher` so its token
+        is refreshed before it expires.
+        """
+        if self.id is not None:
+            token_refresher.touch(self)
+
+        await self._ensure_token()
+
+    async def refresh_expiring_token(self, margin):
+        """Refreshes the access token if it expires in the next ``margin``
+        seconds.
+
+        :param margin: A number of seconds."""
+        await self._ensure_token(margin)
+
+    async def _ensure_token(self, margin=0):
+        if self._has_valid_token(margin):
+            return
+
+        if self.id is None:
+            await self._request_token()
+            return
+
+        key = str(self.id)
+        task = _token_refreshes.get(key)
+        if task is None:
+            task = ensure_future(self._refresh_token(margin))
+            _token_refreshes[key] = task
+            task.add_done_callback(lambda t: _token_refreshes.pop(key, None))
+
+        install = await shield(task)
+        if install is not self:
+            self.access_token = install.access_token
+            self.refresh_token = install.refresh_token
+            self.expires = install.expires
+
+    def _has_valid_token(self, margin=0):
+        if not self.access_token or self.token_is_expired:
+            return False
+        return not margin or not self.token_expires_in(margin)
+
+    async def _refresh_token(self, margin=0):
+        lease = getattr(settings, 'TOKEN_REFRESH_LEASE', 30)
+        interval = getattr(settings, 'TOKEN_REFRESH_POLL_INTERVAL', 0.5)
+        owner = uuid4().hex
+        while True:
+            install = await self._acquire_token_lease(lease, owner)
+            if install is not None:
+                break
+
+            # Other process is refreshing the token. We use its token
+            # when it is done.
+            await sleep(interval)
+            install = await type(self).objects.get(id=self.id)
+            if install._has_valid_token(margin):
+                return install
+
+        # The token request may wait for the rate limit longer than
+        # the lease so the lease is renewed until the refresh is done.
+        renew = ensure_future(self._renew_token_lease(lease, owner))
+        try:
+            # The token may have been refreshed by other process
+            # before we took the lease.
+            if install._has_valid_token(margin):
+                return install
+
+            await self._request_token()
+        finally:
+            renew.cancel()
+            # Only our lease is released. If it expired other process
+            # may hold the lock now.
+            await type(self).objects.filter(
+                id=self.id, token_refresh_owner=owner).update_one(
+                    set__token_refresh_lock=None,
+                    set__token_refresh_owner=None)
+        return self
+
+    async def _acquire_token_lease(self, lease, owner):
+        n = localtime2utc(now())
+        qs = type(self).objects.filter(
+            Q(id=self.id, token_refresh_lock=None) |
+            Q(id=self.id, token_refresh_lock__lt=n))
+        return await qs.modify(
+            new=True, set__token_refresh_lock=n + timedelta(seconds=lease),
+            set__token_refresh_owner=owner)
+
+    async def _renew_token_lease(self, lease, owner):
+        while True:
+            await sleep(lease / 3)
+            n = localtime2utc(now())
+            await type(self).objects.filter(
+                id=self.id, token_refresh_owner=owner).update_one(
+                    set__token_refresh_lock=n + timedelta(seconds=lease))
+
+    async def _request_token(self):
         if not self.access_token:
             await self.create_access_token()
-        elif self.token_is_expired:
+        else:
             await self.refresh_access_token()
-        return self.access_token
 
     async def get_headers(self):
         """Returns the header used for authenticated access to the api.
@@ -301,17 +571,47 @@ class BaseIntegration(LoggerMixin, Document):
           - name
           - full_name
           - clone_url
+        :param clone: Indicates if the repository is cloned after it
+          is imported.
+        """
+
+        repo = await self.add_repository(repo_info)
+        if not repo:
+            return False
+
+        try:
+            await self.enable_notification(repo)
+        except Exception:
+            msg = traceback.format_exc()
+            self.log('Error enabling notification: {}'.format(msg),
+                     level='error')
+
+        if clone:
+            # The clones of the single imports are also limited by the
+            # clones of the whole process.
+            async with clone_semaphore.acquire():
+                await self.clone_repository(repo)
+
+        await self.post_import_hooks(repo_info)
+        return repo
+
+    async def add_repository(self, repo_info, slaves_names=None):
+        """Adds a repository from an external service to ToxicBuild.
+        Returns the new repository or False if it already exists.
+
+        :param repo_info: A dictionary with the repository information.
+          The same used by ``import_repository``.
+        :param slaves_names: The names of the slaves used by the
+          repository. If None all the slaves of the user are used.
         """
 
         msg = 'Importing repo {}'.format(repo_info['clone_url'])
         self.log(msg)
 
-        branches = [
-            dict(name='master', notify_only_latest=True),
-            dict(name='feature-*', notify_only_latest=True),
-            dict(name='bug-*', notify_only_latest=True)]
-        slaves = await SlaveInterface.list(self.user)
-        slaves_names = [s.name for s in slaves]
+        branches = [dict(b) for b in DEFAULT_BRANCHES]
+        if slaves_names is None:
+            slaves = await SlaveInterface.list(self.user)
+            slaves_names = [s.name for s in slaves]
         user = self.user
         fetch_url = await self.get_auth_url(repo_info['clone_url'])
         external_id = repo_info['id']
@@ -335,54 +635,71 @@ class BaseIntegration(LoggerMixin, Document):
             self.log(msg, level='error')
             return False
 
-        ext_repo = ExternalInstallationRepository(
-            external_id=external_id,
-            repository_id=str(repo.id),
-            full_name=external_full_name)
-        self.repositories.append(ext_repo)
-        await self.save()
-        try:
-            await self.enable_notification(repo)
-        except Exception:
-            msg = traceback.format_exc()
-            self.log('Error enabling notification: {}'.format(msg),
-                     level='error')
+        await ExternalInstallationRepository.add(
+            self, external_id, str(repo.id), external_full_name)
+        return repo
 
-        if clone:
-            await repo.request_code_update()
+    async def clone_repository(self, repo):
+        """Requests the clone of a repository and waits until it is done.
 
-        await self.post_import_hooks(repo_info)
-        return repo
+        :param repo: A repository instance."""
+
+        await repo.request_code_update()
+        await self._wait_clone(repo)
 
     async def import_repositories(self):
-        """Imports all repositories available to the installation."""
+        """Imports all repositories available to the installation.
+        Returns an :class:`~toxicintegrations.importer.ImportReport`."""
 
         user = self.user
         msg = 'Importing repos for {}'.format(user.id)
         self.log(msg, level='debug')
-        repos = []
-        for repo_info in await self.list_repos():
-            try:
-                repo = await self.import_repository(repo_info, clone=False)
-            except Exception:
-                msg = traceback.format_exc()
-                self.log('Error importing repository {}: {}'.format(
-                    repo_info['name'], msg), level='error')
-                continue
+        pipeline = ImportPipeline(self)
+        return await pipeline.run()
+
+    @classmethod
+    async def get_cached(cls, **lookup):
+        """Returns an installation using the installations cache. If the
+        installation is not in the cache it is read from the database.
 
-            if repo:  # pragma no branch
-                repos.append(repo)
+        :param lookup: A single named argument used to lookup the
+          installation, i.e. ``id=install_id``.
+        """
+        key = cls._get_cache_key(**lookup)
+        install = _install_cache.get(key)
+        if install is None:
+            install = await cls.objects.get(**lookup)
+            _install_cache.set(key, install)
+        return install
 
-        for chunk in self._get_import_chunks(repos):
-            tasks = []
-            for repo in chunk:
-                await repo.request_code_update()
-                t = ensure_future(self._wait_clone(repo))
-                tasks.append(t)
+    @classmethod
+    def clear_cache(cls):
+        """Removes all installations from the installations cache and
+        all repositories from the repositories cache."""
+        _install_cache.clear()
+        _repo_cache.clear()
 
-            await gather(*tasks)
+    @classmethod
+    def get_cache_stats(cls):
+        """Returns the size and the hit/miss counters of the
+        installations cache."""
+        return _install_cache.stats()
 
-        return repos
+    @classmethod
+    def _get_cache_key(cls, **lookup):
+        (name, value), = lookup.items()
+        return (cls.__name__, name, str(value))
+
+    def _get_cache_keys(self):
+        """Returns the keys used to store the installation in the
+        installations cache."""
+        return [self._get_cache_key(id=self.id)]
+
+    async def save(self, *args, **kwargs):
+        r = await super().save(*args, **kwargs)
+        for key in self._get_cache_keys():
+            _install_cache.set(key, self)
+        return r
 
     @classmethod
     async def create(cls, user, **kwargs):
@@ -426,6 +743,38 @@ class BaseIntegration(LoggerMixin, Document):
         await repo.request_code_update(
             repo_branches=repo_branches, external=external)
 
+    async def get_wanted_branches(self, external_repo_id, branches):
+        """Returns the branches that match the branches configured for
+        the repository in ToxicBuild. If the repository has no branches
+        configured all the branches are returned.
+
+        :param external_repo_id: The id of the repository in the external
+          service.
+        :param branches: A dictionary ``{branch_name: head_sha}``.
+        """
+        repo = await self._get_repo_by_external_id(external_repo_id)
+        configured = getattr(repo, 'branches', None)
+        if not configured:
+            return branches
+        return match_branches(branches, configured)
+
+    def schedule_update(self, external_repo_id, repo_branches=None):
+        """Schedules a code update for a repository. The updates
+        scheduled for the same repository in
+        ``settings.PUSH_DEBOUNCE_SECONDS`` are merged in only one call to
+        :meth:`~toxicintegrations.base.BaseIntegration.update_repository`
+        with all the branches. Returns a future that is done when the
+        merged update is done. If the update fails the future raises the
+        error.
+
+        :param external_repo_id: The id of the repository in the external
+          service.
+        :param repo_branches: The branches to update. If None all branches
+          are updated.
+        """
+        return update_coalescer.request_update(
+            self, external_repo_id, repo_branches=repo_branches)
+
     async def repo_request_build(self, external_repo_id, branch, named_tree):
         """Requests a new build.
 
@@ -440,7 +789,8 @@ class BaseIntegration(LoggerMixin, Document):
     async def delete(self, requester, *args, **kwargs):
         """Deletes the installation from the system"""
 
-        for install_repo in self.repositories:
+        for install_repo in await self.get_repositories():
+            _repo_cache.pop((str(self.id), install_repo.external_id))
             try:
                 repo = await RepositoryInterface.get(
                     requester, id=install_repo.repository_id)
@@ -448,6 +798,12 @@ class BaseIntegration(LoggerMixin, Document):
                 continue
             await repo.delete()
 
+        await ExternalInstallationRepository.objects.filter(
+            installation=self).delete()
+
+        for key in self._get_cache_keys():
+            _install_cache.pop(key)
+
         r = await super().delete(*args, **kwargs)
         return r
 
@@ -456,6 +812,7 @@ class BaseIntegration(LoggerMixin, Document):
 
         :param github_repo_id: The id of the repository in github."""
 
+        install_repo = await self._get_install_repo(github_repo_id)
         repo = await self._get_repo_by_external_id(github_repo_id)
         try:
             await repo.delete()
@@ -464,27 +821,137 @@ class BaseIntegration(LoggerMixin, Document):
                 'Repository {} does not exist here'.format(github_repo_id),
                 level='debug')
 
-        self.repositories = [r for r in self.repositories
-                             if r.external_id != github_repo_id]
-        await self.save()
+        _repo_cache.pop((str(self.id), install_repo.external_id))
+        await install_repo.delete()
+
+    async def get_repositories(self):
+        """Returns a list of the
+        :class:`~toxicintegrations.base.ExternalInstallationRepository`
+        imported by the installation."""
+
+        return await ExternalInstallationRepository.objects.filter(
+            installation=self).to_list()
 
-    async def request2api(self, method, *args, statuses=None, **kwargs):
+    @classmethod
+    async def migrate_repositories(cls):
+        """Moves the repositories embedded in the installation documents
+        to the ExternalInstallationRepository collection. Returns how
+        many repositories were moved."""
+
+        collection = cls._get_collection()
+        cursor = collection.find({'repositories': {'$exists': True}})
+        count = 0
+        async for doc in cursor:
+            count += await ExternalInstallationRepository.bulk_add(
+                doc['_id'], doc['repositories'])
+            await collection.update_one({'_id': doc['_id']},
+                                        {'$unset': {'repositories': ''}})
+        return count
+
+    async def request2api(self, method, url, *args, statuses=None,
+                          priority=PRIORITY_NORMAL, limit=None, **kwargs):
         """Does a request to a 3rd party service. Returns a response object.
 
+        The requests respect the rate limit of the installation. When the
+        rate limit is low the requests wait for it to reset and the
+        requests refused because of the rate limit are retried after the
+        reset.
+
+        GET requests are conditional. If the previous response sent an
+        ``ETag`` or ``Last-Modified`` header and the resource did not
+        change the cached response is returned. A 304 response without
+        a cached response is requested again without the conditional
+        headers.
+
         :param method: Request method.
+        :param url: The requested url.
         :param args: Args passed to the request.
         :param statuses: A list of statuses that does not raise exception.
           If None status 200 does not raise exception.
+        :param priority: The priority of the request. One of
+          ``toxicintegrations.ratelimit.PRIORITY_*``.
+        :param limit: An optional semaphore held only while the request
+          is sent, not while it waits for the rate limit.
         :param kwargs: Named arguments passed to the request.
         """
         statuses = [200] if statuses is None else statuses
         fn = getattr(requests, method)
-        r = await fn(*args, **kwargs)
+        key = (str(self.id), urlparse(url).netloc)
+        cache_key = None
+        cached = None
+        if method == 'get':
+            # The cached response is taken with its validators so a
+            # concurrent request that replaces it doesn't change the
+            # response returned for a 304.
+            cache_key = self._get_response_cache_key(url, kwargs)
+            cached, conditional = _response_cache.get_conditional(cache_key)
+            if conditional:
+                kwargs['headers'] = {**(kwargs.get('headers') or {}),
+                                     **conditional}
+
+        r = await self._send_request(fn, url, key, priority, limit,
+                                     *args, **kwargs)
+
+        if cache_key is not None:
+            if r.status == 304 and cached is None:
+                self.log('Not modified response for {} without a cached '
+                         'response. Requesting it again.'.format(url),
+                         level='warning')
+                kwargs['headers'] = {
+                    k: v for k, v in (kwargs.get('headers') or {}).items()
+                    if k.lower() not in _CONDITIONAL_HEADERS}
+                r = await self._send_request(fn, url, key, priority, limit,
+                                             *args, **kwargs)
+            r = self._handle_cached_response(cache_key, cached, r)
+
         if r.status not in statuses:
             raise BadRequestToExternalAPI(r.status, r.text)
 
         return r
 
+    @classmethod
+    def get_response_cache_stats(cls):
+        """Returns the size and the hit/miss counters of the
+        cache of responses of the 3rd party apis."""
+        return _response_cache.stats()
+
+    async def _send_request(self, fn, url, key, priority, limit, *args,
+                            **kwargs):
+        retries = getattr(settings, 'RATE_LIMIT_MAX_RETRIES', 3)
+        for attempt in range(retries + 1):
+            await rate_limiter.wait(key, priority)
+            if limit is None:
+                r = await fn(url, *args, **kwargs)
+            else:
+                async with limit:
+                    r = await fn(url, *args, **kwargs)
+            rate_limiter.update(key, r.headers)
+            delay = rate_limiter.get_retry_delay(r)
+            if delay is None or attempt == retries or \
+               delay > rate_limiter.max_wait:
+                break
+
+            self.log('Rate limited by {}. Retrying in {:.1f}s'.format(
+                key[1], delay), level='warning')
+            await sleep(delay)
+
+        return r
+
+    def _get_response_cache_key(self, url, kwargs):
+        params = kwargs.get('params') or {}
+        return (str(self.id), url, tuple(sorted(
+            (str(k), str(v)) for k, v in params.items())))
+
+    def _handle_cached_response(self, cache_key, cached, r):
+        if r.status == 304 and cached is not None:
+            _response_cache.record(hit=True)
+            return cached
+
+        _response_cache.record(hit=False)
+        if r.status == 200:
+            _response_cache.set(cache_key, r)
+        return r
+
     async def post_import_hooks(self, repo_info):
         """Execute actions after a repository is imported. Be default
         executes ``self.create_webhook``.
@@ -503,30 +970,25 @@ class BaseIntegration(LoggerMixin, Document):
 
         return localtime2utc(now()) + timedelta(seconds=secs - 10)
 
-    def _get_import_chunks(self, repos):
-
-        try:
-            parallel_imports = settings.PARALLEL_IMPORTS
-        except AttributeError:
-            parallel_imports = None
-
-        if not parallel_imports:
-            yield repos
-            return
-
-        for i in range(0, len(repos), parallel_imports):
-            yield repos[i:i + parallel_imports]
-
     async def _get_repo_by_external_id(self, external_repo_id):
-        for repo in self.repositories:
-            if repo.external_id == external_repo_id:  # pragma no branch
-                repo_inst = await RepositoryInterface.get(
-                    self.user, id=repo.repository_id)
-                return repo_inst
-
-        raise BadRepository(
-            'External repository {} does not exist here.'.format(
-                external_repo_id))
+        key = (str(self.id), normalize_external_id(external_repo_id))
+        repo = _repo_cache.get(key)
+        if repo is None:
+            install_repo = await self._get_install_repo(external_repo_id)
+            repo = await RepositoryInterface.get(
+                self.user, id=install_repo.repository_id)
+            _repo_cache.set(key, repo)
+        return repo
+
+    async def _get_install_repo(self, external_repo_id):
+        ext_id = normalize_external_id(external_repo_id)
+        install_repo = await ExternalInstallationRepository.objects.filter(
+            installation=self, external_id=ext_id).first()
+        if install_repo is None:
+            raise BadRepository(
+                'External repository {} does not exist here.'.format(
+                    external_repo_id))
+        return install_repo
 
     async def _wait_clone(self, repo):
         repo = await RepositoryInterface.get(self.user, id=repo.id)
@@ -21,6 +21,7 @@ import re
 
 from toxicintegrations import settings
 from toxicintegrations.base import BaseIntegration, BaseIntegrationApp
+from toxicintegrations.ratelimit import PRIORITY_HIGH, PRIORITY_LOW
 
 
 class BitbucketApp(BaseIntegrationApp):
@@ -82,7 +83,8 @@ class BitbucketIntegration(BaseIntegration):
         params = {'refresh_token': self.refresh_token,
                   'grant_type': 'refresh_token'}
 
-        r = await self.request2api('post', url, sesskw=sesskw, data=params)
+        r = await self.request2api('post', url, sesskw=sesskw, data=params,
+                                   priority=PRIORITY_HIGH)
         r = r.json()
         self.access_token = r['access_token']
         # expires_in = r['expires_in']
@@ -104,7 +106,8 @@ class BitbucketIntegration(BaseIntegration):
         headers = await self.get_headers()
         repos = []
         while url:
-            r = (await self.request2api('get', url, headers=headers)).json()
+            r = (await self.request2api('get', url, headers=headers,
+                                        priority=PRIORITY_LOW)).json()
             for repo in r['values']:
                 if repo['scm'] != 'git':
                     self.log(
@@ -147,7 +150,7 @@ class BitbucketIntegration(BaseIntegration):
         self.log('API url: {}'.format(url))
         await self.request2api('post', url,
                                statuses=[200, 201], json=body,
-                               headers=headers)
+                               headers=headers, priority=PRIORITY_LOW)
         return True
 
     def _get_repo_dict(self, repo_info):
@@ -168,6 +171,8 @@ class BitbucketIntegration(BaseIntegration):
             'name': repo_info['name'],
             'full_name': repo_info['full_name'],
             'slug': repo_info['slug'],
-            'clone_url': url
+            'clone_url': url,
+            'pushed_at': repo_info.get('updated_on'),
+            'size': repo_info.get('size'),
         }
         return d
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from collections.abc import Mapping
+from time import monotonic
+
+
+class TTLCache:
+    """An in-process cache where the entries expire after ``ttl``
+    seconds. If ``maxsize`` is set the least recently used entries
+    are evicted when the cache is full.
+    """
+
+    def __init__(self, ttl, maxsize=None):
+        """:param ttl: How many seconds an entry is valid.
+        :param maxsize: The max number of entries in the cache. If None
+          the size is not bounded.
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __contains__(self, key):
+        try:
+            expires, _ = self._data[key]
+        except KeyError:
+            return False
+        return expires > monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Returns the value for ``key`` if it is in the cache and
+        not expired, otherwise returns ``default``."""
+
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        if expires <= monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Puts ``value`` in the cache under ``key``."""
+
+        self._data[key] = (monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if self.maxsize and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        """Removes ``key`` from the cache."""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        self._data.clear()
+
+    def stats(self):
+        """Returns a dictionary with the size of the cache and the
+        hits and misses counters."""
+
+        return {'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses}
+
+
+class ResponseCache:
+    """A cache for the responses of GET requests that may be revalidated
+    with conditional requests. Only responses with ``ETag`` or
+    ``Last-Modified`` headers are stored. When the cache is full the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, maxsize):
+        """:param maxsize: The max number of responses in the cache."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_conditional(self, key):
+        """Returns a tuple ``(response, headers)`` with the cached response
+        for ``key`` and the headers for a conditional request for it. The
+        response is the one to be used if the server answers the
+        conditional request with 304. If there is no response in the cache
+        returns ``(None, {})``."""
+
+        response = self._data.get(key)
+        if response is None:
+            return None, {}
+
+        self._data.move_to_end(key)
+        headers = {}
+        etag = response.headers.get('ETag')
+        if etag:
+            headers['If-None-Match'] = etag
+        last_modified = response.headers.get('Last-Modified')
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return response, headers
+
+    def record(self, hit):
+        """Counts a request in the hit/miss counters.
+
+        :param hit: True if the response was served from the cache,
+          i.e. the server answered the conditional request with 304.
+        """
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def set(self, key, response):
+        """Puts ``response`` in the cache under ``key`` if it may be
+        revalidated later."""
+
+        headers = response.headers
+        if not isinstance(headers, Mapping) or not (
+                headers.get('ETag') or headers.get('Last-Modified')):
+            self._data.pop(key, None)
+            return
+
+        self._data[key] = response
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        """Removes all responses from the cache."""
+        self._data.clear()
+
+    def stats(self):
+        """Returns a dictionary with the size of the cache and the
+        hits and misses counters."""
+
+        return {'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses}
@@ -27,12 +27,15 @@ import sys
 from toxiccore.cmd import command, main
 from toxiccore.utils import changedir, MonkeyPatcher
 
-from toxicintegrations import ensure_indexes, create_settings_and_connect
+from toxicintegrations import (ensure_indexes, create_settings_and_connect,
+                               reconnect)
 
 
 PIDFILE = 'toxicintegrations.pid'
 LOGFILE = './toxicintegrations.log'
 
+ROLES = ('all', 'web', 'notifications')
+
 
 class SettingsPatcher(MonkeyPatcher):
     """Patches the settings from pyrocumulus to use the same settings
@@ -84,7 +87,8 @@ def create(root_dir, access_token='', output_token='', root_user_id='',
 
 @command
 def start(workdir, daemonize=False, stdout=LOGFILE, stderr=LOGFILE,
-          conffile=None, loglevel='info', pidfile=PIDFILE):
+          conffile=None, loglevel='info', pidfile=PIDFILE, workers=1,
+          role='all'):
     """ Starts toxicmaster integrations.
 
     :param workdir: Work directory for server.
@@ -97,12 +101,22 @@ def start(workdir, daemonize=False, stdout=LOGFILE, stderr=LOGFILE,
     :param --loglevel: Level for logging messages. Defaults to `info`.
     :param --pidfile: Name of the file to use as pidfile.  Defaults to
       ``toxicintegrations.pid``
+    :param --workers: Number of worker processes. All of them listen on
+      the same port. Defaults to 1.
+    :param --role: What the server does. ``web`` receives and processes
+      the webhooks, ``notifications`` sends the notifications to the 3rd
+      party services and ``all`` does both. Defaults to `all`.
     """
 
     if not os.path.exists(workdir):
         print('Workdir `{}` does not exist'.format(workdir))
         sys.exit(1)
 
+    if role not in ROLES:
+        print('Invalid role `{}`. Valid roles are: {}'.format(
+            role, ', '.join(ROLES)))
+        sys.exit(1)
+
     workdir = os.path.abspath(workdir)
     with changedir(workdir):
         sys.path.append(workdir)
@@ -133,22 +147,54 @@ def start(workdir, daemonize=False, stdout=LOGFILE, stderr=LOGFILE,
 
         SettingsPatcher().patch_pyro_settings(settings)
 
+        workers = int(workers)
+
         def setup_fn():
+            if workers > 1:
+                # each worker process needs its own connection
+                reconnect()
 
             from toxiccommon import common_setup
 
             loop = asyncio.get_event_loop()
             loop.run_until_complete(common_setup(settings))
 
-            from toxicintegrations.server import (
-                IntegrationsOutputMessageHandler
-            )
-            handler = IntegrationsOutputMessageHandler()
-            asyncio.ensure_future(handler.run())
+            if role in ('all', 'notifications'):
+                from toxicintegrations.server import (
+                    IntegrationsOutputMessageHandler
+                )
+                handler = IntegrationsOutputMessageHandler()
+                asyncio.ensure_future(handler.run())
+
+            if role in ('all', 'web'):
+                from toxicintegrations.webhook_queue import WebhookWorkerPool
+                from toxicintegrations.webhook_receivers import (
+                    process_delivery
+                )
+                webhook_workers = WebhookWorkerPool(process_delivery)
+                asyncio.ensure_future(webhook_workers.run())
+
+            from toxicintegrations.tokens import token_refresher
+            asyncio.ensure_future(token_refresher.run())
+
+            if getattr(settings, 'GITHUB_APP_ID', None) and getattr(
+                    settings, 'GITHUB_APP_CHECK', True):
+                from toxicintegrations.github import GithubApp
+                asyncio.ensure_future(GithubApp.run_identity_check())
 
             ensure_indexes()
 
-        print('Starting integrations on port {}'.format(settings.TORNADO_PORT))
+        async def shutdown_fn():
+            from toxicintegrations import requests
+            from toxicintegrations.tokens import token_refresher
+            token_refresher.stop()
+            await requests.close()
+
+        if role == 'notifications':
+            print('Starting integrations notifications')
+        else:
+            print('Starting integrations on port {}'.format(
+                settings.TORNADO_PORT))
 
         sys.argv = ['pyromanager.py', '']
 
@@ -163,6 +209,8 @@ def start(workdir, daemonize=False, stdout=LOGFILE, stderr=LOGFILE,
         from toxicintegrations.monkey import run
         command.kill = False
         user_msg = 'Starting ToxicIntegrations. Listening on port {}'
+        if role == 'notifications':
+            user_msg = 'Starting ToxicIntegrations notifications'
         command.user_message = user_msg
         command.daemonize = daemonize
         command.stderr = stderr
@@ -173,6 +221,9 @@ def start(workdir, daemonize=False, stdout=LOGFILE, stderr=LOGFILE,
         command.port = settings.TORNADO_PORT
         command.pidfile = pidfile
         command.setup_fn = setup_fn
+        command.shutdown_fn = shutdown_fn
+        command.workers = workers
+        command.listen = role != 'notifications'
         run(command)
 
 
@@ -221,17 +272,56 @@ def stop(workdir, pidfile=PIDFILE):
 
 
 @command
-def restart(workdir, pidfile=PIDFILE, loglevel='info'):
+def restart(workdir, pidfile=PIDFILE, loglevel='info', workers=1,
+            role='all'):
     """Restarts toxicmaster integrations
 
     The instance of toxicintegrations in ``workdir`` will be restarted.
     :param workdir: Workdir for instance to be killed.
     :param --pidfile: Name of the file to use as pidfile.
     :param --loglevel: Level for logging messages.
+    :param --workers: Number of worker processes.
+    :param --role: What the server does: web, notifications or all.
     """
 
     stop(workdir, pidfile=pidfile)
-    start(workdir, pidfile=pidfile, daemonize=True, loglevel=loglevel)
+    start(workdir, pidfile=pidfile, daemonize=True, loglevel=loglevel,
+          workers=workers, role=role)
+
+
+@command
+def migrate_repositories(workdir, conffile=None):
+    """Moves the repositories imported by the installations to their
+    own collection. Must be executed once when upgrading from versions
+    that kept the repositories inside the installations.
+
+    :param workdir: Work directory for server.
+    :param -c, --conffile: path to config file. Defaults to None.
+      If not conffile, will look for a file called ``toxicintegrations.conf``
+      inside ``workdir``
+    """
+
+    if not os.path.exists(workdir):
+        print('Workdir `{}` does not exist'.format(workdir))
+        sys.exit(1)
+
+    workdir = os.path.abspath(workdir)
+    with changedir(workdir):
+        sys.path.append(workdir)
+
+        conffile = conffile or 'toxicintegrations.conf'
+        os.environ['TOXICINTEGRATION_SETTINGS'] = os.path.join(
+            workdir, conffile)
+
+        create_settings_and_connect()
+        from toxicintegrations.base import (BaseIntegration,
+                                            ExternalInstallationRepository)
+
+        loop = asyncio.get_event_loop()
+        ExternalInstallationRepository.ensure_indexes()
+        count = loop.run_until_complete(
+            BaseIntegration.migrate_repositories())
+        print('{} repositories migrated'.format(count))
 
 
 def _check_conffile(workdir, conffile):
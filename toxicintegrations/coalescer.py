@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from asyncio import ensure_future, get_event_loop, sleep
+import traceback
+
+from toxiccore.utils import LoggerMixin
+
+from toxicintegrations import settings
+
+
+class PendingUpdate:
+    """A code update waiting to be requested for a repository."""
+
+    def __init__(self, install, external_repo_id):
+        self.install = install
+        self.external_repo_id = external_repo_id
+        self.all_branches = False
+        self.repo_branches = {}
+        # Resolved when the update is done, so everyone that requested
+        # it knows if the update worked.
+        self.future = get_event_loop().create_future()
+
+    def merge(self, repo_branches):
+        """Merges the branches of a new update request into this
+        update.
+
+        :param repo_branches: The branches to update. If None all
+          branches are updated.
+        """
+        if repo_branches is None:
+            self.all_branches = True
+        else:
+            self.repo_branches.update(repo_branches)
+
+    def get_repo_branches(self):
+        """Returns the ``repo_branches`` param for
+        :meth:`~toxicintegrations.base.BaseIntegration.update_repository`.
+        """
+        if self.all_branches:
+            return None
+        return self.repo_branches
+
+
+class UpdateCoalescer(LoggerMixin):
+    """Merges the code updates requested for the same repository in a
+    short period of time into only one update. At most one update per
+    repository is in flight at any time. The updates requested while an
+    update is running are merged and requested after it finishes.
+
+    Who requests an update should wait for it, so the webhook delivery
+    is only removed from the queue after the update is done, and so the
+    updates are limited by the webhook workers.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._tasks = {}
+
+    def request_update(self, install, external_repo_id, repo_branches=None):
+        """Requests a code update for a repository. Returns a future
+        for the merged update this request joined. If the update fails the
+        error is raised to everyone waiting for the future.
+
+        :param install: The installation that owns the repository.
+        :param external_repo_id: The id of the repository in the external
+          service.
+        :param repo_branches: The branches to update. If None all
+          branches are updated.
+        """
+        key = (str(install.id), str(external_repo_id))
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = PendingUpdate(install, external_repo_id)
+            self._pending[key] = pending
+
+        pending.install = install
+        pending.merge(repo_branches)
+
+        if key not in self._tasks:
+            self._tasks[key] = ensure_future(self._run(key))
+        return pending.future
+
+    async def _run(self, key):
+        try:
+            while key in self._pending:
+                await sleep(getattr(settings, 'PUSH_DEBOUNCE_SECONDS', 1))
+                pending = self._pending.pop(key)
+                try:
+                    await pending.install.update_repository(
+                        pending.external_repo_id,
+                        repo_branches=pending.get_repo_branches())
+                except Exception as e:
+                    msg = traceback.format_exc()
+                    self.log('Error updating repository {}: {}'.format(
+                        pending.external_repo_id, msg), level='error')
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                else:
+                    if not pending.future.done():
+                        pending.future.set_result(None)
+        finally:
+            del self._tasks[key]
+
+
+update_coalescer = UpdateCoalescer()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma no cover
+    orjson = None
+
+__doc__ = """Json encoding and decoding. Uses `orjson
+<https://github.com/ijl/orjson>`_ when it is installed and the
+standard library otherwise.
+"""
+
+
+def loads(data):
+    """Decodes a json document.
+
+    :param data: The json document. May be bytes or str. Bytes are decoded
+      directly, without converting them to str first.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Encodes an object to a json document. Returns bytes.
+
+    :param obj: The object to encode.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
@@ -36,3 +36,7 @@ class BadRepository(Exception):
 
 class BadSignature(Exception):
     pass
+
+
+class TooManyTasks(Exception):
+    pass
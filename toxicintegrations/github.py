@@ -17,19 +17,23 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
 
+from asyncio import Lock, get_running_loop, sleep
 from datetime import timedelta
+from functools import lru_cache
 import hashlib
 import hmac
+import traceback
+
+from cryptography.hazmat.primitives import serialization
 import jwt
 from mongomotor.fields import StringField, DateTimeField, IntField
-from toxiccore import requests
 from toxiccore.utils import (string2datetime, now, localtime2utc,
-                                   utc2localtime)
-from toxicintegrations import settings
+                                   utc2localtime, datetime2string)
+from toxicintegrations import requests, settings
 from toxicintegrations.base import (BaseIntegrationApp,
                                           BaseIntegration)
-from toxicintegrations.exceptions import (BadRequestToExternalAPI,
-                                                BadSignature)
+from toxicintegrations.ratelimit import PRIORITY_HIGH, PRIORITY_LOW
+from toxicintegrations.exceptions import BadSignature
 
 __doc__ = """This module implements the integration with Github. It is
 a `GithubApp <https://developer.github.com/apps/>`_  that reacts to events
@@ -57,6 +61,26 @@ For information on how to setup the integration, see
 :ref:`github-integration-config`"""
 
 
+# Only one jwt is created at a time. The concurrent requests for a jwt
+# wait for it.
+_jwt_lock = Lock()
+
+# The result of the last check of the app credentials. See
+# GithubApp.check_identity
+_identity_status = {'checked': False}
+
+
+@lru_cache(maxsize=4)
+def _load_private_key(pem):
+    # parsing the key is expensive, so we do it only once.
+    return serialization.load_pem_private_key(pem.encode(), password=None)
+
+
+def _sign_jwt(payload, pem):
+    key = _load_private_key(pem)
+    return jwt.encode(payload, key, "RS256")
+
+
 class GithubApp(BaseIntegrationApp):
     """A GitHub App. Only one app per ToxicBuild installation."""
 
@@ -83,8 +107,24 @@ class GithubApp(BaseIntegrationApp):
     def validate_token(self, signature, data):
         """Validates the incomming data in the webhook, sent by github."""
 
-        sig = 'sha1=' + hmac.new(self.webhook_token.encode(), data,
-                                 digestmod=hashlib.sha1).hexdigest()
+        digest = self.get_digest()
+        digest.update(data)
+        return self.validate_digest(signature, digest)
+
+    def get_digest(self):
+        """Returns a hmac object used to compute the signature of a
+        webhook incrementally, as the body arrives."""
+        return hmac.new(self.webhook_token.encode(), digestmod=hashlib.sha1)
+
+    def validate_digest(self, signature, digest):
+        """Validates the signature sent by github against a digest
+        returned by :meth:`~toxicintegrations.github.GithubApp.get_digest`
+        fed with the webhook body.
+
+        :param signature: The value of the X-Hub-Signature header.
+        :param digest: The hmac object with the body of the webhook.
+        """
+        sig = 'sha1=' + digest.hexdigest()
         sig = sig.encode()
         if isinstance(signature, str):
             signature = signature.encode()
@@ -95,29 +135,26 @@ class GithubApp(BaseIntegrationApp):
         return True
 
     async def is_expired(self):
-        """Informs if the jwt token is expired."""
+        """Informs if the jwt token is expired or about to expire."""
 
-        if self.jwt_expires and utc2localtime(self.jwt_expires) < now():
+        margin = getattr(settings, 'GITHUB_JWT_EXPIRE_MARGIN', 60)
+        n = now() + timedelta(seconds=margin)
+        if self.jwt_expires and utc2localtime(self.jwt_expires) < n:
             return True
         return False
 
     async def get_jwt_token(self):
-        """Returns the jwt token for authentication on the github api."""
+        """Returns the jwt token for authentication on the github api.
+        The token is kept in memory until it is about to expire."""
 
         if self.jwt_token and not await self.is_expired():
             return self.jwt_token
-        return await self.create_token()
-
-    async def set_jwt_token(self, jwt_token):
-        """Sets the jwt auth token."""
-
-        self.jwt_token = jwt_token
-        await self.save()
 
-    async def set_expire_time(self, exp_time):
-        """Sets the expire time for the jwt token"""
-        self.jwt_expires = exp_time
-        await self.save()
+        async with _jwt_lock:
+            # other request may have created the token while we waited
+            if self.jwt_token and not await self.is_expired():
+                return self.jwt_token
+            return await self.create_token()
 
     def get_api_url(self):
         """Returns the url for the github app api."""
@@ -136,19 +173,75 @@ class GithubApp(BaseIntegrationApp):
 
         self.log('creating jwt_token with payload {}'.format(payload),
                  level='debug')
-        jwt_token = jwt.encode(payload, self.private_key, "RS256")
-        await self.set_expire_time(dt_expires)
-        await self.set_jwt_token(jwt_token)
+        # signing is cpu bound, so we don't block the ioloop.
+        loop = get_running_loop()
+        jwt_token = await loop.run_in_executor(
+            None, _sign_jwt, payload, self.private_key)
+        self.jwt_expires = dt_expires
+        self.jwt_token = jwt_token
+        await self.save()
         return jwt_token
 
     async def create_token(self):
         """Creates a new token for the github api."""
 
-        myjwt = await self._create_jwt()
+        return await self._create_jwt()
+
+    async def check_identity(self):
+        """Checks the app credentials requesting the app information to
+        the github api. The result is kept in memory and is returned by
+        :meth:`~toxicintegrations.github.GithubApp.get_identity_status`.
+        """
+
+        myjwt = await self.get_jwt_token()
         header = {'Authorization': 'Bearer {}'.format(myjwt),
                   'Accept': 'application/vnd.github.machine-man-preview+json'}
-        await requests.post(self.get_api_url(), headers=header)
-        return myjwt
+        r = await requests.get(self.get_api_url(), headers=header)
+        status = {'checked': True,
+                  'ok': r.status == 200,
+                  'status': r.status,
+                  'checked_at': datetime2string(now())}
+        if status['ok']:
+            status['slug'] = r.json().get('slug')
+        else:
+            self.log('Bad github app credentials: {}'.format(r.text),
+                     level='error')
+
+        _identity_status.clear()
+        _identity_status.update(status)
+        return self.get_identity_status()
+
+    @classmethod
+    def get_identity_status(cls):
+        """Returns the result of the last check of the app credentials."""
+        return dict(_identity_status)
+
+    @classmethod
+    async def run_identity_check(cls):
+        """Checks the app credentials. If
+        ``settings.GITHUB_APP_CHECK_INTERVAL`` is set the credentials are
+        checked again every ``GITHUB_APP_CHECK_INTERVAL`` seconds."""
+
+        interval = getattr(settings, 'GITHUB_APP_CHECK_INTERVAL', 0)
+        while True:
+            try:
+                app = await cls.get_app()
+                await app.check_identity()
+            except Exception as e:
+                msg = traceback.format_exc()
+                cls.log_cls('Error checking github app: {}'.format(msg),
+                            level='error')
+                # Only the type of the error. The message may have
+                # details that should not go to the health check.
+                _identity_status.clear()
+                _identity_status.update(
+                    {'checked': True, 'ok': False,
+                     'error': type(e).__name__,
+                     'checked_at': datetime2string(now())})
+
+            if not interval:
+                break
+            await sleep(interval)
 
     @classmethod
     async def create_installation_token(cls, installation):
@@ -166,11 +259,9 @@ class GithubApp(BaseIntegrationApp):
         header = {'Authorization': 'Bearer {}'.format(myjwt),
                   'Accept': 'application/vnd.github.machine-man-preview+json'}
 
-        ret = await requests.post(installation.access_token_url,
-                                  headers=header)
-
-        if ret.status != 201:
-            raise BadRequestToExternalAPI(ret.status, ret.text)
+        ret = await installation.request2api(
+            'post', installation.access_token_url, headers=header,
+            statuses=[201], priority=PRIORITY_HIGH)
 
         ret = ret.json()
         installation.access_token = ret['token']
@@ -202,35 +293,36 @@ class GithubIntegration(BaseIntegration):
         return url + 'app/installations/{}/access_tokens'.format(
             self.github_id)
 
+    def _get_cache_keys(self):
+        keys = super()._get_cache_keys()
+        keys.append(self._get_cache_key(github_id=self.github_id))
+        return keys
+
     async def get_header(
             self, accept='application/vnd.github.machine-man-preview+json'):
 
-        if not self.access_token or self.token_is_expired:
-            await self.app.create_installation_token(self)
+        await self.ensure_token()
 
         header = {'Authorization': 'token {}'.format(self.access_token),
                   'Accept': accept}
         return header
 
-    async def get_auth_url(self, url):
-        if self.token_is_expired:
-            self.access_token = None
-
-        r = await super().get_auth_url(url)
-        return r
-
     async def create_access_token(self):
         await self.app.create_installation_token(self)
 
+    async def refresh_access_token(self):
+        # installation tokens are not refreshed, we simply create
+        # a new one.
+        await self.app.create_installation_token(self)
+
     async def list_repos(self):
         """Lists all respositories available to an installation.
         Returns a list of dictionaries with repositories' information"""
 
         header = await self.get_header()
         url = settings.GITHUB_API_URL + 'installation/repositories'
-        ret = await requests.get(url, headers=header)
-        if ret.status != 200:
-            raise BadRequestToExternalAPI(ret.status, ret.text, url)
+        ret = await self.request2api('get', url, headers=header,
+                                     priority=PRIORITY_LOW)
         ret = ret.json()
         return ret['repositories']
 
@@ -242,9 +334,8 @@ class GithubIntegration(BaseIntegration):
 
         header = await self.get_header()
         url = settings.GITHUB_API_URL + 'repos/{}'.format(repo_full_name)
-        ret = await requests.get(url, headers=header)
-        if ret.status != 200:
-            raise BadRequestToExternalAPI(ret.status, ret.text, url)
+        ret = await self.request2api('get', url, headers=header,
+                                     priority=PRIORITY_LOW)
         return ret.json()
 
     async def get_user_id(self):  # pragma no cover
@@ -19,6 +19,7 @@
 
 from toxicintegrations.base import BaseIntegration, BaseIntegrationApp
 from toxicintegrations import settings
+from toxicintegrations.ratelimit import PRIORITY_HIGH, PRIORITY_LOW
 
 __doc__ = """This module implements integration with gitlab. Imports
 repositories from GitLab and reacts to messages sent by gitlab to
@@ -67,7 +68,8 @@ class GitlabIntegration(BaseIntegration):
                   'grant_type': 'authorization_code',
                   'redirect_uri': self.REDIRECT_URI}
 
-        r = await self.request2api('post', url, params=params)
+        r = await self.request2api('post', url, params=params,
+                                   priority=PRIORITY_HIGH)
         r = r.json()
         # gitlab token never expires
         r['expires'] = None
@@ -81,7 +83,8 @@ class GitlabIntegration(BaseIntegration):
             return {'name': r['name'],
                     'id': r['id'],
                     'full_name': r['path_with_namespace'],
-                    'clone_url': r['http_url_to_repo']}
+                    'clone_url': r['http_url_to_repo'],
+                    'pushed_at': r.get('last_activity_at')}
 
         header = await self.get_headers()
         p = 1
@@ -91,7 +94,8 @@ class GitlabIntegration(BaseIntegration):
             url = settings.GITLAB_API_URL + 'users/{}/projects?page={}'.format(
                 self.external_user_id, p)
 
-            ret = await self.request2api('get', url, headers=header)
+            ret = await self.request2api('get', url, headers=header,
+                                         priority=PRIORITY_LOW)
             p += 1
             repos += [get_repo_dict(r) for r in ret.json()]
 
@@ -120,7 +124,7 @@ class GitlabIntegration(BaseIntegration):
         url = settings.GITLAB_API_URL + 'projects/{}/hooks'.format(
             repo_external_id)
         await self.request2api('post', url, statuses=[200, 201], data=body,
-                               headers=header)
+                               headers=header, priority=PRIORITY_LOW)
         return True
 
     @property
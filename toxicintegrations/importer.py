@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from asyncio import CancelledError, gather, get_event_loop
+from contextlib import asynccontextmanager, contextmanager
+from heapq import heappop, heappush
+from itertools import count
+from time import monotonic
+import traceback
+
+from toxiccommon.interfaces import SlaveInterface
+from toxiccore.utils import LoggerMixin
+
+from toxicintegrations import settings
+
+__doc__ = """Imports all the repositories of an installation.
+
+The import of each repository goes through the stages ``create``
+(the repository is added to ToxicBuild), ``webhook`` and ``notification``
+(both at the same time) and ``clone``. Each stage has its own concurrency
+limit so, for example, many repositories may be created while only a few
+are cloned. The ``list`` stage lists the repositories available to the
+installation and runs only once.
+
+The repositories pushed recently and the bigger ones go first. The clones
+of all the installations in the process are also limited by
+``clone_semaphore`` so many imports at the same time don't overload the
+slaves. Its slots are given in the order the clones arrive, so an
+installation can't starve the others.
+"""
+
+STAGES = ('list', 'create', 'webhook', 'notification', 'clone')
+
+
+def get_import_order(repos_info):
+    """Returns the repositories sorted in the order they should be
+    imported: the ones pushed on the most recent days first and, among
+    the ones pushed on the same day, the bigger ones first. The
+    repositories without this information go last.
+
+    :param repos_info: A list of dictionaries with the information
+      of the repositories. The optional keys ``pushed_at`` (a iso
+      formatted datetime string) and ``size`` are used.
+    """
+    def key(repo_info):
+        # only the date so the size matters for the repositories
+        # pushed on the same day, not only the ones pushed on the
+        # same second.
+        pushed_at = repo_info.get('pushed_at') or ''
+        return (pushed_at[:10], repo_info.get('size') or 0)
+
+    return sorted(repos_info, key=key, reverse=True)
+
+
+class PrioritySemaphore:
+    """A semaphore where the free slots go to the waiter with the lowest
+    priority value. Waiters with the same priority are served in the order
+    they arrived."""
+
+    def __init__(self, limit):
+        """:param limit: How many slots the semaphore has."""
+        self.limit = limit
+        self._running = 0
+        self._waiters = []
+        self._counter = count()
+
+    @asynccontextmanager
+    async def acquire(self, priority=0):
+        """Waits for a free slot and holds it while in the context.
+
+        :param priority: The priority of the waiter. Lower values go
+          first.
+        """
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self):
+        """Returns how many slots are in use and how many are waiting
+        for a slot."""
+        return {'limit': self.limit,
+                'running': self._running,
+                'waiting': len(
+                    [w for w in self._waiters if not w[2].done()])}
+
+    async def _acquire(self, priority):
+        if self._running < self.limit and not self._waiters:
+            self._running += 1
+            return
+
+        fut = get_event_loop().create_future()
+        heappush(self._waiters, (priority, next(self._counter), fut))
+        try:
+            await fut
+        except CancelledError:
+            # The slot was handed to us right before the cancellation.
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        # The slot is handed directly to the next waiter so no one
+        # that arrives later may take it.
+        while self._waiters:
+            fut = heappop(self._waiters)[2]
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._running -= 1
+
+
+clone_semaphore = PrioritySemaphore(
+    getattr(settings, 'CLONE_CONCURRENCY', 10))
+
+
+class ImportReport:
+    """The result of the import of the repositories of an installation."""
+
+    def __init__(self):
+        self.repos = []
+        """The repositories imported."""
+
+        self.skipped = []
+        """The names of the repositories that already exist."""
+
+        self.failed = []
+        """The names of the repositories that could not be imported."""
+
+        self.stages = {}
+        """How many times each stage ran and how long it took."""
+
+        self.elapsed = 0
+        """How many seconds the whole import took."""
+
+    def add_timing(self, stage, elapsed):
+        """Records the time spent by one execution of a stage.
+
+        :param stage: The name of the stage.
+        :param elapsed: How many seconds the stage took.
+        """
+        timing = self.stages.setdefault(
+            stage, {'count': 0, 'total': 0.0, 'max': 0.0})
+        timing['count'] += 1
+        timing['total'] += elapsed
+        timing['max'] = max(timing['max'], elapsed)
+
+    def as_dict(self):
+        """Returns a dictionary with a summary of the import."""
+
+        return {'imported': len(self.repos),
+                'skipped': len(self.skipped),
+                'failed': len(self.failed),
+                'elapsed': self.elapsed,
+                'stages': self.stages}
+
+
+class ImportPipeline(LoggerMixin):
+    """Imports the repositories of an installation running the stages
+    of the import of many repositories at the same time. A failure
+    importing a repository does not stop the import of the others."""
+
+    def __init__(self, install, concurrency=None):
+        """:param install: The installation that imports the repositories.
+        :param concurrency: A dictionary with the concurrency limit for
+          the stages. The stages not in it use
+          ``settings.IMPORT_CREATE_CONCURRENCY``,
+          ``settings.IMPORT_WEBHOOK_CONCURRENCY``,
+          ``settings.IMPORT_NOTIFICATION_CONCURRENCY`` and
+          ``settings.PARALLEL_IMPORTS``. When ``PARALLEL_IMPORTS`` is not
+          set all the repositories are cloned at the same time.
+        """
+        self.install = install
+        self.concurrency = {
+            'list': 1,
+            'create': getattr(settings, 'IMPORT_CREATE_CONCURRENCY', 10),
+            'webhook': getattr(settings, 'IMPORT_WEBHOOK_CONCURRENCY', 10),
+            'notification': getattr(
+                settings, 'IMPORT_NOTIFICATION_CONCURRENCY', 10),
+            'clone': getattr(settings, 'PARALLEL_IMPORTS', None)}
+        self.concurrency.update(concurrency or {})
+        self.report = ImportReport()
+        self._sems = {}
+
+    async def run(self):
+        """Imports the repositories. Returns an
+        :class:`~toxicintegrations.importer.ImportReport`."""
+
+        start = monotonic()
+        self._sems['list'] = PrioritySemaphore(1)
+        async with self._stage('list'):
+            repos_info = await self.install.list_repos()
+            slaves = await SlaveInterface.list(self.install.user)
+
+        slaves_names = [s.name for s in slaves]
+        for stage in STAGES[1:]:
+            limit = self.concurrency[stage] or len(repos_info) or 1
+            self._sems[stage] = PrioritySemaphore(limit)
+
+        repos_info = get_import_order(repos_info)
+        await gather(*[self._import(repo_info, slaves_names, priority)
+                       for priority, repo_info in enumerate(repos_info)])
+
+        self.report.elapsed = monotonic() - start
+        self.log('Import for {} done: {}'.format(
+            self.install.id, self.report.as_dict()))
+        return self.report
+
+    @asynccontextmanager
+    async def _stage(self, name, priority=0):
+        async with self._sems[name].acquire(priority):
+            with self._timing(name):
+                yield
+
+    @contextmanager
+    def _timing(self, name):
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.report.add_timing(name, monotonic() - start)
+
+    async def _import(self, repo_info, slaves_names, priority):
+        name = repo_info['name']
+        try:
+            async with self._stage('create', priority):
+                repo = await self.install.add_repository(
+                    repo_info, slaves_names=slaves_names)
+
+            if not repo:
+                self.report.skipped.append(name)
+                return
+
+            r = await gather(self._create_webhook(repo_info, priority),
+                             self._enable_notification(repo, priority),
+                             return_exceptions=True)
+            for exc in r:
+                if isinstance(exc, Exception):
+                    raise exc
+
+            await self._clone(repo, priority)
+        except Exception:
+            msg = traceback.format_exc()
+            self.log('Error importing repository {}: {}'.format(name, msg),
+                     level='error')
+            self.report.failed.append(name)
+        else:
+            self.report.repos.append(repo)
+
+    async def _create_webhook(self, repo_info, priority):
+        async with self._stage('webhook', priority):
+            await self.install.post_import_hooks(repo_info)
+
+    async def _enable_notification(self, repo, priority):
+        # A repository without notifications still works so the
+        # error is only logged, like in import_repository.
+        async with self._stage('notification', priority):
+            try:
+                await self.install.enable_notification(repo)
+            except Exception:
+                msg = traceback.format_exc()
+                self.log('Error enabling notification: {}'.format(msg),
+                         level='error')
+
+    async def _clone(self, repo, priority):
+        # The slot of the installation is taken first so the imports
+        # waiting here don't hold the slots of the process. The priority
+        # is only meaningful inside this import, so the slots of the
+        # process are taken in the order of arrival.
+        async with self._sems['clone'].acquire(priority):
+            async with clone_semaphore.acquire():
+                with self._timing('clone'):
+                    await self.install.clone_repository(repo)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from collections import Counter
+
+__doc__ = """Simple in-process counters. The counters are reported by the
+health check of the webhook receivers.
+"""
+
+_counters = Counter()
+
+
+def incr(name, value=1):
+    """Increments a counter.
+
+    :param name: The name of the counter.
+    :param value: How much to increment.
+    """
+    _counters[name] += value
+
+
+def get_counters():
+    """Returns a dictionary with the values of all counters."""
+    return dict(_counters)
+
+
+def reset():
+    """Sets all counters to zero."""
+    _counters.clear()
@@ -18,11 +18,15 @@
 
 import logging
 import os
+import signal
 
 from tornado import ioloop
 from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
 from pyrocumulus.utils import get_value_from_settings
 
+from toxicintegrations.supervisor import ProcessSupervisor
+
 
 # patches pyrocumulus.run to allow a setup function after daemonization
 # and before server start
@@ -39,16 +43,48 @@ def run(self):
         self.redirect_stdout_stderr()
         self._write_to_file(self.pidfile, str(os.getpid()))
 
-    # AsyncIOMainLoop().install()
-    ioloop_inst = ioloop.IOLoop.instance()
-    self.application = self.get_application()
-
     self._set_log_level()
     logger = logging.getLogger()
     msg = self.user_message.format(self.port)
     logger.log(logging.INFO, msg)
+
+    # With many workers the socket is bound before the fork so all
+    # workers accept connections in the same port. The ioloop must be
+    # created only after the fork.
+    workers = getattr(self, 'workers', 1)
+    # processes that only send notifications don't listen for http.
+    listen = getattr(self, 'listen', True)
+    sockets = None
+    if workers > 1:
+        if listen:
+            sockets = bind_sockets(self.port)
+        ProcessSupervisor(workers).start()
+
+    # AsyncIOMainLoop().install()
+    ioloop_inst = ioloop.IOLoop.instance()
+    self.application = self.get_application()
+
     self.setup_fn()
-    tornado_opts = get_value_from_settings('HTTP_SERVER_OPTS', {})
-    server = HTTPServer(self.application, **tornado_opts)
-    server.listen(self.port)
+    if listen:
+        tornado_opts = get_value_from_settings('HTTP_SERVER_OPTS', {})
+        server = HTTPServer(self.application, **tornado_opts)
+        if sockets:
+            server.add_sockets(sockets)
+        else:
+            server.listen(self.port)
+
+    async def shutdown():
+        try:
+            shutdown_fn = getattr(self, 'shutdown_fn', None)
+            if shutdown_fn:
+                await shutdown_fn()
+        finally:
+            ioloop_inst.stop()
+
+    def handle_stop_signal(signum, frame):
+        logger.log(logging.INFO, 'Got signal {}. Stopping'.format(signum))
+        ioloop_inst.add_callback_from_signal(shutdown)
+
+    signal.signal(signal.SIGTERM, handle_stop_signal)
+    signal.signal(signal.SIGINT, handle_stop_signal)
     ioloop_inst.start()
@@ -1 +1,9 @@
 # -*- coding: utf-8 -*-
+
+from asyncio import Semaphore
+
+from .. import settings
+
+# How many notifications are sent to the 3rd party services at the same
+# time so a burst of notifications doesn't hold the whole process.
+send_limit = Semaphore(getattr(settings, 'NOTIFICATIONS_CONCURRENCY', 20))
@@ -17,11 +17,13 @@
 # along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
 
 from mongomotor.fields import ReferenceField
-from toxiccore import requests
 from toxicnotifications.base import Notification
 
 from .. import settings
 from .. bitbucket import BitbucketIntegration
+from .. exceptions import BadRequestToExternalAPI
+from .. ratelimit import PRIORITY_HIGH
+from . import send_limit
 
 
 class BitbucketCommitStatusNotification(Notification):
@@ -67,5 +69,13 @@ class BitbucketCommitStatusNotification(Notification):
         }
 
         headers = await installation.get_headers()
-        await requests.post(url, json=data, headers=headers)
+        try:
+            await installation.request2api(
+                'post', url, json=data, headers=headers,
+                statuses=[200, 201], priority=PRIORITY_HIGH,
+                limit=send_limit)
+        except BadRequestToExternalAPI as e:
+            self.log('Error sending build status: {}'.format(e),
+                     level='error')
+            return False
         return True
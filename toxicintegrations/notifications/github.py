@@ -20,12 +20,14 @@ from collections import defaultdict
 
 from mongomotor.fields import ReferenceField
 
-from toxiccore import requests
 from toxiccore.utils import string2datetime, datetime2string
 from toxicnotifications.base import Notification
 
 from .. import settings
+from .. exceptions import BadRequestToExternalAPI
 from .. github import GithubIntegration
+from .. ratelimit import PRIORITY_HIGH
+from . import send_limit
 
 
 class GithubCheckRunNotification(Notification):
@@ -115,7 +117,15 @@ class GithubCheckRunNotification(Notification):
 
         header = await install.get_header(
             accept='application/vnd.github.antiope-preview+json')
-        r = await requests.post(url, headers=header, json=payload)
+        try:
+            r = await install.request2api(
+                'post', url, headers=header, json=payload,
+                statuses=[200, 201], priority=PRIORITY_HIGH,
+                limit=send_limit)
+        except BadRequestToExternalAPI as e:
+            self.log('Error sending check for buildset {}: {}'.format(
+                buildset_info['id'], e), level='error')
+            return
 
         self.log('response from check for buildset {} - status: {}'.format(
             buildset_info['id'], r.status), level='debug')
@@ -19,11 +19,13 @@
 import urllib
 from mongomotor.fields import ReferenceField
 
-from toxiccore import requests
 from toxicnotifications.base import Notification
 
 from .. import settings
+from .. exceptions import BadRequestToExternalAPI
 from .. gitlab import GitlabIntegration
+from .. ratelimit import PRIORITY_HIGH
+from . import send_limit
 
 
 class GitlabCommitStatusNotification(Notification):
@@ -81,7 +83,15 @@ class GitlabCommitStatusNotification(Notification):
         install = await self.installation
         header = await install.get_headers()
 
-        r = await requests.post(url, headers=header, params=params)
+        try:
+            r = await install.request2api(
+                'post', url, headers=header, params=params,
+                statuses=[200, 201], priority=PRIORITY_HIGH,
+                limit=send_limit)
+        except BadRequestToExternalAPI as e:
+            self.log('Error sending status for buildset {}: {}'.format(
+                buildset_info['id'], e), level='error')
+            return
 
         self.log('response from check for buildset {} - status: {}'.format(
             buildset_info['id'], r.status), level='debug')
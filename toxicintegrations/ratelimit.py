@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from asyncio import ensure_future, get_event_loop, sleep
+from collections.abc import Mapping
+from email.utils import parsedate_to_datetime
+from heapq import heappop, heappush
+from itertools import count
+from time import time
+
+from toxiccore.utils import LoggerMixin
+
+from toxicintegrations import settings
+
+__doc__ = """Keeps track of the rate limits of the 3rd party apis. The
+budget of each installation is read from the rate limit headers sent by
+the apis and the requests wait for the limit to reset when the budget is
+low. The requests with higher priority may use more of the budget and the
+waiting requests are released in priority order.
+"""
+
+PRIORITY_HIGH = 0
+"""Requests that must go out as soon as possible, i.e. notifications."""
+
+PRIORITY_NORMAL = 1
+
+PRIORITY_LOW = 2
+"""Bulk requests, i.e. the ones made when importing repositories."""
+
+REMAINING_HEADERS = ('X-RateLimit-Remaining', 'RateLimit-Remaining')
+RESET_HEADERS = ('X-RateLimit-Reset', 'RateLimit-Reset')
+
+# Reset values bigger than this are timestamps, smaller are seconds.
+_EPOCH_THRESHOLD = 10 ** 9
+
+
+def _get_header(headers, names):
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def _parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        pass
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(dt.timestamp() - time(), 0)
+
+
+class RateLimitBudget:
+    """How many requests are left until the rate limit resets."""
+
+    def __init__(self, remaining, reset_at):
+        self.remaining = remaining
+        self.reset_at = reset_at
+
+
+class RateLimiter(LoggerMixin):
+    """Tracks the rate limit budgets. The budgets are identified by
+    a key, i.e. ``(installation_id, host)``."""
+
+    def __init__(self, reserve=None, max_wait=None):
+        """:param reserve: How many requests are kept for the requests
+          with higher priority. Defaults to ``settings.RATE_LIMIT_RESERVE``
+        :param max_wait: The max number of seconds a request waits for the
+          rate limit to reset. Defaults to ``settings.RATE_LIMIT_MAX_WAIT``
+        """
+        self.reserve = reserve if reserve is not None else getattr(
+            settings, 'RATE_LIMIT_RESERVE', 100)
+        self.max_wait = max_wait if max_wait is not None else getattr(
+            settings, 'RATE_LIMIT_MAX_WAIT', 300)
+        self._budgets = {}
+        # key -> heap of (priority, arrival, future)
+        self._waiters = {}
+        # key -> task that releases the waiters
+        self._wakers = {}
+        self._counter = count()
+
+    def update(self, key, headers):
+        """Updates a budget with the rate limit headers of a response.
+
+        :param key: The key of the budget.
+        :param headers: The headers of the response.
+        """
+        if not isinstance(headers, Mapping):
+            return
+
+        remaining = _get_header(headers, REMAINING_HEADERS)
+        if remaining is None:
+            return
+
+        reset_at = self._get_reset_at(headers) or time() + 60
+        self._budgets[key] = RateLimitBudget(remaining, reset_at)
+        self._release(key)
+
+    def get_retry_delay(self, response):
+        """Returns how many seconds to wait before retrying a request
+        refused because of the rate limit. Returns None if the request was
+        not refused because of the rate limit.
+
+        :param response: The response of the request.
+        """
+        if response.status not in (403, 429):
+            return None
+
+        headers = response.headers
+        if not isinstance(headers, Mapping):
+            return None
+
+        retry_after = _parse_retry_after(headers.get('Retry-After'))
+        if retry_after is not None:
+            return retry_after
+
+        remaining = _get_header(headers, REMAINING_HEADERS)
+        # a 403 with budget left is a real forbidden.
+        if response.status == 403 and remaining != 0:
+            return None
+
+        reset_at = self._get_reset_at(headers)
+        if reset_at is None:
+            return 60
+        return max(reset_at - time(), 0)
+
+    async def wait(self, key, priority=PRIORITY_NORMAL):
+        """Waits until a request may be done without exhausting
+        the budget.
+
+        :param key: The key of the budget.
+        :param priority: The priority of the request. Requests with
+          lower priority wait while the budget is low, until it resets or
+          is above the threshold of their priority.
+        """
+        waiters = self._waiters.get(key)
+        # who is already waiting with the same or higher priority
+        # goes first.
+        if not (waiters and waiters[0][0] <= priority) and \
+           self._take(key, priority):
+            return
+
+        fut = get_event_loop().create_future()
+        heappush(self._waiters.setdefault(key, []),
+                 (priority, next(self._counter), fut))
+        if key not in self._wakers:
+            self._wakers[key] = ensure_future(self._wake(key))
+        await fut
+
+    def _take(self, key, priority):
+        # Takes one request from the budget if a request with this
+        # priority may be done now.
+        budget = self._budgets.get(key)
+        if budget is None:
+            return True
+
+        if budget.reset_at <= time():
+            del self._budgets[key]
+            return True
+
+        if budget.remaining > self._get_threshold(priority):
+            budget.remaining -= 1
+            return True
+        return False
+
+    def _release(self, key):
+        # Releases the waiters, in priority order, while the budget
+        # allows it. Returns True if there are waiters left.
+        waiters = self._waiters.get(key, [])
+        while waiters:
+            priority, _, fut = waiters[0]
+            if fut.done():
+                heappop(waiters)
+                continue
+
+            if not self._take(key, priority):
+                return True
+
+            heappop(waiters)
+            fut.set_result(None)
+
+        self._waiters.pop(key, None)
+        return False
+
+    async def _wake(self, key):
+        try:
+            while self._release(key):
+                budget = self._budgets[key]
+                delay = min(budget.reset_at - time(), self.max_wait)
+                self.log('Rate limit low for {}. Waiting {:.1f}s'.format(
+                    key, delay), level='warning')
+                await sleep(delay)
+        finally:
+            del self._wakers[key]
+
+    def _get_threshold(self, priority):
+        return self.reserve * priority
+
+    def _get_reset_at(self, headers):
+        reset = _get_header(headers, RESET_HEADERS)
+        if reset is None:
+            return None
+
+        if reset < _EPOCH_THRESHOLD:
+            reset += time()
+        return reset
+
+
+rate_limiter = RateLimiter()
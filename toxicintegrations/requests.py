@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from asyncio import get_running_loop
+
+import aiohttp
+from toxiccore.utils import LoggerMixin
+
+from toxicintegrations import codec, settings
+
+__doc__ = """An http client for the 3rd party services apis. All requests
+in a process share the same connection pool so the connections are
+kept alive between requests.
+
+It has the same interface of ``toxiccore.requests``.
+"""
+
+
+class Response:
+    """The response of a request."""
+
+    def __init__(self, status, body, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', errors='replace')
+
+    def json(self):
+        return codec.loads(self.body)
+
+
+def _json_serialize(obj):
+    return codec.dumps(obj).decode()
+
+
+class ClientManager(LoggerMixin):
+    """Keeps one :class:`aiohttp.ClientSession` per process. The
+    connections to a host are reused between the requests."""
+
+    def __init__(self):
+        self._session = None
+        self._loop = None
+
+    def get_session(self):
+        """Returns the client session. The session is created in the
+        first call."""
+
+        loop = get_running_loop()
+        if self._session is None or self._session.closed or \
+           self._loop is not loop:
+            self._session = self._create_session()
+            self._loop = loop
+        return self._session
+
+    async def request(self, method, url, sesskw=None, **kwargs):
+        """Does a request. Returns a
+        :class:`~toxicintegrations.requests.Response`.
+
+        :param method: The http method.
+        :param url: The requested url.
+        :param sesskw: Named arguments for the session, i.e. ``auth``.
+          As the session is shared they are sent with the request.
+        :param kwargs: Named arguments passed to the request.
+        """
+        kwargs.update(sesskw or {})
+        session = self.get_session()
+        async with session.request(method, url, **kwargs) as response:
+            body = await response.read()
+            return Response(response.status, body, response.headers)
+
+    async def close(self):
+        """Closes the session and all its connections."""
+        if self._session is not None and not self._session.closed:
+            self.log('Closing http client', level='debug')
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    def _create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=getattr(settings, 'HTTP_CLIENT_POOL_SIZE', 100),
+            limit_per_host=getattr(
+                settings, 'HTTP_CLIENT_POOL_SIZE_PER_HOST', 20),
+            ttl_dns_cache=getattr(settings, 'HTTP_CLIENT_DNS_CACHE_TTL', 300),
+            keepalive_timeout=getattr(
+                settings, 'HTTP_CLIENT_KEEPALIVE_TIMEOUT', 30))
+        timeout = aiohttp.ClientTimeout(
+            total=getattr(settings, 'HTTP_CLIENT_TIMEOUT', 60))
+        return aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     json_serialize=_json_serialize)
+
+
+client_manager = ClientManager()
+
+
+async def get(url, **kwargs):
+    return await client_manager.request('get', url, **kwargs)
+
+
+async def post(url, **kwargs):
+    return await client_manager.request('post', url, **kwargs)
+
+
+async def put(url, **kwargs):
+    return await client_manager.request('put', url, **kwargs)
+
+
+async def delete(url, **kwargs):
+    return await client_manager.request('delete', url, **kwargs)
+
+
+async def close():
+    """Closes the connections of the http client."""
+    await client_manager.close()
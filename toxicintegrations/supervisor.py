@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import signal
+import sys
+
+from toxiccore.utils import LoggerMixin
+
+__doc__ = """Runs the server in many processes. The listening socket is
+bound before forking so all the worker processes accept connections on
+the same port.
+"""
+
+
+class ProcessSupervisor(LoggerMixin):
+    """Forks worker processes and restarts the ones that crash. The
+    shutdown signals received by the supervisor are sent to all
+    workers."""
+
+    STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+    def __init__(self, num_workers, max_restarts=100):
+        """:param num_workers: How many worker processes.
+        :param max_restarts: How many times the crashed workers are
+          restarted before the supervisor gives up.
+        """
+        self.num_workers = num_workers
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self._stopping = False
+        # pid -> worker id
+        self._children = {}
+
+    def start(self):
+        """Forks the workers. Returns the id of the worker in the
+        worker processes. In the supervisor process waits for the workers
+        to finish and exits."""
+
+        for worker_id in range(self.num_workers):
+            if self._spawn(worker_id):
+                return worker_id
+
+        for signum in self.STOP_SIGNALS:
+            signal.signal(signum, self._handle_stop_signal)
+
+        worker_id = self._supervise()
+        if worker_id is not None:
+            return worker_id
+
+        self.log('All workers finished. Leaving.')
+        sys.exit(0)
+
+    def stop(self, signum=signal.SIGTERM):
+        """Sends ``signum`` to all workers.
+
+        :param signum: The signal sent to the workers.
+        """
+        self._stopping = True
+        for pid in self._children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:  # pragma no cover
+                pass
+
+    def _spawn(self, worker_id):
+        # Returns True in the child process.
+        pid = os.fork()
+        if pid == 0:
+            for signum in self.STOP_SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            self._children = {}
+            return True
+
+        self.log('Worker {} started with pid {}'.format(worker_id, pid))
+        self._children[pid] = worker_id
+        return False
+
+    def _supervise(self):
+        # Returns the worker id in a restarted worker process.
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+
+            worker_id = self._children.pop(pid, None)
+            if worker_id is None:  # pragma no cover
+                continue
+
+            code = os.waitstatus_to_exitcode(status)
+            if self._stopping or code == 0:
+                self.log('Worker {} exited with {}'.format(worker_id, code))
+                continue
+
+            self.log('Worker {} crashed with {}'.format(worker_id, code),
+                     level='error')
+            if self.restarts >= self.max_restarts:
+                self.log('Too many restarts. Giving up.', level='error')
+                self.stop()
+                continue
+
+            self.restarts += 1
+            if self._spawn(worker_id):
+                return worker_id
+
+        return None
+
+    def _handle_stop_signal(self, signum, frame):
+        self.log('Got signal {}. Stopping workers'.format(signum))
+        self.stop(signum)
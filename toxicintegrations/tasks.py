@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from asyncio import Semaphore, ensure_future, gather
+from time import monotonic
+import traceback
+
+from toxiccore.utils import LoggerMixin
+
+from toxicintegrations import settings
+from toxicintegrations.exceptions import TooManyTasks
+
+
+class TaskSupervisor(LoggerMixin):
+    """Runs background tasks with bounded concurrency. At most
+    ``concurrency`` tasks run at the same time and at most ``max_queue``
+    tasks wait for a free slot. When the queue is full new tasks are
+    refused with :class:`~toxicintegrations.exceptions.TooManyTasks`.
+    """
+
+    def __init__(self, concurrency=None, max_queue=None):
+        """:param concurrency: How many tasks run at the same time.
+          Defaults to ``settings.BACKGROUND_TASKS_CONCURRENCY``.
+        :param max_queue: How many tasks may wait for a free slot.
+          Defaults to ``settings.BACKGROUND_TASKS_QUEUE_SIZE``.
+        """
+        self.concurrency = concurrency or getattr(
+            settings, 'BACKGROUND_TASKS_CONCURRENCY', 20)
+        self.max_queue = max_queue if max_queue is not None else getattr(
+            settings, 'BACKGROUND_TASKS_QUEUE_SIZE', 100)
+        self._sem = Semaphore(self.concurrency)
+        # task -> when it was submitted
+        self._tasks = {}
+        self._running = 0
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def is_full(self):
+        """Returns True if no more tasks are accepted."""
+        return len(self._tasks) >= self.concurrency + self.max_queue
+
+    def submit(self, coro):
+        """Schedules a coroutine to run in background. Returns the task
+        that runs the coroutine.
+
+        :param coro: A coroutine.
+        :raises TooManyTasks: If the queue is full.
+        """
+        if self.is_full():
+            coro.close()
+            raise TooManyTasks('{} tasks already scheduled'.format(
+                len(self._tasks)))
+
+        task = ensure_future(self._run(coro))
+        self._tasks[task] = monotonic()
+        task.add_done_callback(self._task_done)
+        return task
+
+    def submit_batch(self, coros, concurrency=None):
+        """Schedules many coroutines to run in background as only one
+        task, so a batch takes only one slot of the queue no matter its
+        size. Either all the coroutines are scheduled or none is, so a
+        refused batch may be retried without running some of the
+        coroutines twice. An error in a coroutine is logged and doesn't
+        stop the others. Returns the task that runs the coroutines.
+
+        :param coros: A list of coroutines.
+        :param concurrency: How many coroutines of the batch run at the
+          same time. Defaults to the concurrency of the supervisor.
+        :raises TooManyTasks: If the queue is full.
+        """
+        if self.is_full():
+            for coro in coros:
+                coro.close()
+            raise TooManyTasks('{} tasks already scheduled'.format(
+                len(self._tasks)))
+
+        return self.submit(self._run_batch(
+            coros, concurrency or self.concurrency))
+
+    def stats(self):
+        """Returns a dictionary with the number of running and queued
+        tasks and the age of the oldest task in seconds."""
+
+        oldest = min(self._tasks.values(), default=None)
+        age = round(monotonic() - oldest, 3) if oldest is not None else 0
+        return {'running': self._running,
+                'queued': len(self._tasks) - self._running,
+                'max_queue': self.max_queue,
+                'concurrency': self.concurrency,
+                'oldest_task_age': age}
+
+    async def _run(self, coro):
+        async with self._sem:
+            self._running += 1
+            try:
+                return await coro
+            except Exception:
+                msg = traceback.format_exc()
+                self.log('Error running task: {}'.format(msg),
+                         level='error')
+            finally:
+                self._running -= 1
+
+    async def _run_batch(self, coros, concurrency):
+        sem = Semaphore(concurrency)
+
+        async def run(coro):
+            async with sem:
+                try:
+                    return await coro
+                except Exception:
+                    msg = traceback.format_exc()
+                    self.log('Error running batch task: {}'.format(msg),
+                             level='error')
+
+        return await gather(*[run(coro) for coro in coros])
+
+    def _task_done(self, task):
+        self._tasks.pop(task, None)
+
+
+task_supervisor = TaskSupervisor()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from asyncio import Event, TimeoutError, ensure_future, sleep, wait_for
+from random import uniform
+from time import monotonic
+import traceback
+
+from toxiccore.utils import LoggerMixin
+
+from toxicintegrations import settings
+
+__doc__ = """Refreshes the access tokens of the installations before they
+expire so the webhooks and notifications don't have to wait for a new
+token.
+
+Only the installations used recently by this process are refreshed.
+The installations are registered by
+:meth:`~toxicintegrations.base.BaseIntegration.ensure_token`.
+"""
+
+
+class TokenRefresher(LoggerMixin):
+    """Periodically refreshes the tokens of the active installations
+    that expire soon."""
+
+    def __init__(self, margin=None, interval=None, idle_time=None,
+                 jitter=None):
+        """:param margin: Tokens that expire in the next ``margin``
+          seconds are refreshed. Defaults to
+          ``settings.TOKEN_REFRESH_MARGIN``.
+        :param interval: Seconds between the checks for expiring tokens.
+          Defaults to ``settings.TOKEN_REFRESH_INTERVAL``.
+        :param idle_time: Installations not used for this many seconds
+          are not refreshed anymore. Defaults to
+          ``settings.TOKEN_REFRESH_IDLE_TIME``.
+        :param jitter: The refreshes are delayed by a random number of
+          seconds up to ``jitter`` so they don't happen at the same time.
+          Defaults to ``settings.TOKEN_REFRESH_JITTER``.
+        """
+        self.margin = margin or getattr(
+            settings, 'TOKEN_REFRESH_MARGIN', 300)
+        self.interval = interval or getattr(
+            settings, 'TOKEN_REFRESH_INTERVAL', 60)
+        self.idle_time = idle_time or getattr(
+            settings, 'TOKEN_REFRESH_IDLE_TIME', 3600)
+        self.jitter = jitter if jitter is not None else getattr(
+            settings, 'TOKEN_REFRESH_JITTER', 60)
+        self._active = {}
+        self._scheduled = {}
+        self._running = False
+        self._stop = Event()
+
+    def __len__(self):
+        return len(self._active)
+
+    def touch(self, install):
+        """Registers an installation as active.
+
+        :param install: An installation with a saved token.
+        """
+        self._active[str(install.id)] = (install, monotonic())
+
+    async def run(self):
+        """Refreshes the expiring tokens until ``stop`` is called."""
+
+        self._running = True
+        self._stop.clear()
+        while self._running:
+            try:
+                self.schedule_refreshes()
+            except Exception:
+                msg = traceback.format_exc()
+                self.log('Error scheduling token refreshes: {}'.format(msg),
+                         level='error')
+            await self._wait()
+
+    def stop(self):
+        """Stops refreshing tokens."""
+        self._running = False
+        self._stop.set()
+
+    def schedule_refreshes(self):
+        """Schedules the refresh of the tokens of the active installations
+        that expire soon and forgets the idle installations. Returns
+        the scheduled tasks."""
+
+        n = monotonic()
+        tasks = []
+        for key, (install, last_used) in list(self._active.items()):
+            if n - last_used > self.idle_time:
+                del self._active[key]
+                continue
+
+            if key in self._scheduled:
+                continue
+
+            # Tokens that would expire before the next check are
+            # refreshed now.
+            if not install.token_expires_in(self.margin + self.interval):
+                continue
+
+            task = ensure_future(self._refresh(install))
+            self._scheduled[key] = task
+            task.add_done_callback(
+                lambda t, key=key: self._scheduled.pop(key, None))
+            tasks.append(task)
+        return tasks
+
+    def stats(self):
+        """Returns how many installations are active and how many
+        refreshes are scheduled."""
+        return {'active': len(self._active),
+                'scheduled': len(self._scheduled)}
+
+    async def _refresh(self, install):
+        await sleep(uniform(0, self.jitter))
+        try:
+            await install.refresh_expiring_token(self.margin + self.interval)
+        except Exception:
+            msg = traceback.format_exc()
+            self.log('Error refreshing token for {}: {}'.format(
+                install.id, msg), level='error')
+
+    async def _wait(self):
+        try:
+            await wait_for(self._stop.wait(), self.interval)
+        except TimeoutError:
+            pass
+
+
+token_refresher = TokenRefresher()
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of toxicbuild.
+
+# toxicbuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# toxicbuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
+
+from asyncio import Event, Semaphore, TimeoutError, ensure_future, wait_for
+from datetime import timedelta
+import traceback
+
+from mongoengine.errors import NotUniqueError
+from mongoengine.queryset.visitor import Q
+from mongomotor import Document
+from mongomotor.fields import (
+    StringField,
+    DictField,
+    BinaryField,
+    IntField,
+    DateTimeField,
+)
+from toxiccore.utils import LoggerMixin, now, localtime2utc
+
+from toxicintegrations import settings
+from toxicintegrations.cache import TTLCache
+
+__doc__ = """A durable queue for the webhook deliveries sent by the 3rd
+party services. The webhook receivers only validate and store the raw
+delivery (headers and body) so the request can be acknowledged right away.
+A :class:`~toxicintegrations.webhook_queue.WebhookWorkerPool` drains the
+queue with bounded concurrency.
+
+Deliveries are only removed from the queue after they are successfully
+processed, so unfinished deliveries are resumed after a restart.
+
+The 3rd party services retry deliveries they think that failed, so
+the ids of the deliveries already received are kept in
+:class:`~toxicintegrations.webhook_queue.WebhookDeliveryId` and
+the retried deliveries are dropped.
+"""
+
+# Set when a new delivery is enqueued so idle workers in this process
+# don't have to wait for the next poll.
+new_delivery = Event()
+
+DEDUP_TTL = getattr(settings, 'WEBHOOK_DEDUP_TTL', 86400)
+
+# The most recent delivery ids seen by this process, so most of the
+# retried deliveries are dropped without touching the database.
+_seen_deliveries = TTLCache(
+    DEDUP_TTL, maxsize=getattr(settings, 'WEBHOOK_DEDUP_CACHE_SIZE', 10000))
+
+
+def _utcnow():
+    return localtime2utc(now())
+
+
+class WebhookDelivery(LoggerMixin, Document):
+    """A webhook delivery waiting to be processed."""
+
+    receiver = StringField(required=True)
+    """The name of the webhook receiver class that handles the delivery."""
+
+    uri = StringField(required=True)
+    """The uri requested by the 3rd party service, query string included."""
+
+    headers = DictField()
+    """The headers of the request."""
+
+    body = BinaryField()
+    """The raw body of the request."""
+
+    status = StringField(default='pending',
+                         choices=('pending', 'processing', 'failed'))
+    """Status of the delivery. When the processing of a delivery
+    fails too many times its status is ``failed`` and it stays in the
+    collection for inspection."""
+
+    attempts = IntField(default=0)
+    """How many times we tried to process the delivery."""
+
+    created = DateTimeField(default=_utcnow)
+    """When the delivery was received. Datetime must be UTC."""
+
+    locked_until = DateTimeField()
+    """A worker owns a delivery being processed until this time. After
+    that the delivery may be claimed again. Datetime must be UTC."""
+
+    error = StringField()
+    """The last error processing the delivery."""
+
+    meta = {'collection': 'webhook_delivery',
+            'indexes': [('status', 'created')]}
+
+    @classmethod
+    async def enqueue(cls, receiver, request):
+        """Stores a new delivery in the queue.
+
+        :param receiver: The name of the receiver class.
+        :param request: The http request sent by the 3rd party service.
+        """
+        delivery = cls(receiver=receiver, uri=request.uri,
+                       headers=dict(request.headers),
+                       body=request.body or b'')
+        await delivery.save()
+        new_delivery.set()
+        return delivery
+
+    @classmethod
+    async def claim(cls):
+        """Atomically takes the oldest delivery available in the queue.
+        Returns None if there is no delivery to process."""
+
+        lease = getattr(settings, 'WEBHOOK_QUEUE_LEASE', 300)
+        n = _utcnow()
+        qs = cls.objects.filter(
+            Q(status='pending', locked_until=None) |
+            Q(status='pending', locked_until__lt=n) |
+            Q(status='processing', locked_until__lt=n)).order_by('created')
+        delivery = await qs.modify(
+            new=True, set__status='processing',
+            set__locked_until=n + timedelta(seconds=lease),
+            inc__attempts=1)
+        return delivery
+
+    async def done(self):
+        """Removes the delivery from the queue."""
+        await self.delete()
+
+    async def fail(self, error):
+        """Records an error processing the delivery. If it may be retried
+        the delivery returns to the queue after some time, otherwise it is
+        marked as failed.
+
+        :param error: The error message.
+        """
+        max_attempts = getattr(settings, 'WEBHOOK_QUEUE_MAX_ATTEMPTS', 5)
+        self.error = error
+        if self.attempts >= max_attempts:
+            self.status = 'failed'
+        else:
+            self.status = 'pending'
+            backoff = 2 ** self.attempts
+            self.locked_until = _utcnow() + timedelta(seconds=backoff)
+
+        await self.save()
+
+
+class WebhookDeliveryId(Document):
+    """The id of a delivery already received. The ids are removed
+    by mongodb after ``settings.WEBHOOK_DEDUP_TTL`` seconds."""
+
+    delivery_id = StringField(required=True, unique=True)
+    """The id sent by the 3rd party service prefixed by the name of the
+    receiver."""
+
+    created = DateTimeField(default=_utcnow)
+    """When the delivery was received. Datetime must be UTC."""
+
+    meta = {'collection': 'webhook_delivery_id',
+            'indexes': [{'fields': ['created'],
+                         'expireAfterSeconds': DEDUP_TTL}]}
+
+    @classmethod
+    async def register(cls, receiver, delivery_id):
+        """Registers the id of a delivery. Returns False if the
+        delivery was already received, True otherwise.
+
+        :param receiver: The name of the receiver class.
+        :param delivery_id: The id of the delivery sent by the 3rd party
+          service.
+        """
+        delivery_id = '{}:{}'.format(receiver, delivery_id)
+        if delivery_id in _seen_deliveries:
+            return False
+
+        _seen_deliveries.set(delivery_id, True)
+        try:
+            await cls(delivery_id=delivery_id).save(force_insert=True)
+        except NotUniqueError:
+            return False
+        except Exception:
+            _seen_deliveries.pop(delivery_id)
+            raise
+        return True
+
+    @classmethod
+    async def unregister(cls, receiver, delivery_id):
+        """Removes the id of a delivery so it is accepted again
+        if the 3rd party service retries it.
+
+        :param receiver: The name of the receiver class.
+        :param delivery_id: The id of the delivery sent by the 3rd party
+          service.
+        """
+        delivery_id = '{}:{}'.format(receiver, delivery_id)
+        _seen_deliveries.pop(delivery_id)
+        await cls.objects.filter(delivery_id=delivery_id).delete()
+
+
+class WebhookWorkerPool(LoggerMixin):
+    """Drains the webhook queue, processing at most ``concurrency``
+    deliveries at the same time."""
+
+    def __init__(self, process_fn, concurrency=None, poll_interval=None):
+        """:param process_fn: A coroutine function that receives a
+          :class:`~toxicintegrations.webhook_queue.WebhookDelivery` and
+          processes it.
+        :param concurrency: How many deliveries are processed at the
+          same time. Defaults to ``settings.WEBHOOK_WORKERS``.
+        :param poll_interval: Seconds to wait for new deliveries when the
+          queue is empty. Defaults to
+          ``settings.WEBHOOK_QUEUE_POLL_INTERVAL``.
+        """
+        self.process_fn = process_fn
+        self.concurrency = concurrency or getattr(
+            settings, 'WEBHOOK_WORKERS', 10)
+        self.poll_interval = poll_interval or getattr(
+            settings, 'WEBHOOK_QUEUE_POLL_INTERVAL', 1)
+        self._running = False
+        self._sem = Semaphore(self.concurrency)
+        self._tasks = set()
+
+    async def run(self):
+        """Processes deliveries until ``stop`` is called."""
+
+        pending = await WebhookDelivery.objects.filter(
+            status__in=['pending', 'processing']).count()
+        self.log('Starting webhook workers. {} deliveries in queue'.format(
+            pending))
+        self._running = True
+        while self._running:
+            await self._sem.acquire()
+            new_delivery.clear()
+            try:
+                delivery = await WebhookDelivery.claim()
+            except Exception:
+                self._sem.release()
+                msg = traceback.format_exc()
+                self.log('Error claiming delivery: {}'.format(msg),
+                         level='error')
+                await self._wait_new_delivery()
+                continue
+
+            if not delivery:
+                self._sem.release()
+                await self._wait_new_delivery()
+                continue
+
+            t = ensure_future(self._process(delivery))
+            self._tasks.add(t)
+            t.add_done_callback(self._task_done)
+
+    def stop(self):
+        """Stops taking new deliveries from the queue."""
+        self._running = False
+        new_delivery.set()
+
+    async def _process(self, delivery):
+        try:
+            await self.process_fn(delivery)
+        except Exception:
+            msg = traceback.format_exc()
+            self.log('Error processing delivery {}: {}'.format(
+                delivery.id, msg), level='error')
+            await delivery.fail(msg)
+        else:
+            await delivery.done()
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        self._sem.release()
+
+    async def _wait_new_delivery(self):
+        try:
+            await wait_for(new_delivery.wait(), self.poll_interval)
+        except TimeoutError:
+            pass
@@ -17,35 +17,67 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with toxicbuild. If not, see <http://www.gnu.org/licenses/>.
 
-from asyncio import ensure_future
+from asyncio import shield
 import base64
-import json
+import hmac
 from pyrocumulus.web.applications import PyroApplication
 from pyrocumulus.web.decorators import post, get
 from pyrocumulus.web.handlers import BasePyroHandler, PyroRequest
 from pyrocumulus.web.urlmappers import URLSpec
-from tornado.web import HTTPError
+from tornado.httputil import HTTPHeaders, HTTPServerRequest
+from tornado.web import HTTPError, stream_request_body
 from toxiccommon.interfaces import UserInterface
 from toxiccore.utils import LoggerMixin, validate_string
-from toxicintegrations import settings
+from toxicintegrations import codec, metrics, settings
+from toxicintegrations.base import BaseIntegration
 from toxicintegrations.bitbucket import (BitbucketIntegration,
                                          BitbucketApp)
+from toxicintegrations.exceptions import TooManyTasks
 from toxicintegrations.github import (GithubIntegration, GithubApp,
                                       BadSignature)
 from toxicintegrations.gitlab import GitlabIntegration, GitlabApp
+from toxicintegrations.importer import clone_semaphore
+from toxicintegrations.tasks import task_supervisor
+from toxicintegrations.tokens import token_refresher
+from toxicintegrations.webhook_queue import (WebhookDelivery,
+                                             WebhookDeliveryId)
 
 
+class _DeliveryConnection:
+    """Stands for the http connection of a delivery processed
+    outside the request cycle."""
+
+    def set_close_callback(self, callback):
+        pass
+
+    def set_max_body_size(self, max_body_size):
+        pass
+
+
+def _get_max_body_size():
+    return getattr(settings, 'WEBHOOK_MAX_BODY_SIZE', 25 * 1024 * 1024)
+
+
+def _get_max_stored_body_size():
+    return getattr(settings, 'WEBHOOK_MAX_STORED_BODY_SIZE',
+                   15 * 1024 * 1024)
+
+
+@stream_request_body
 class BaseWebhookReceiver(LoggerMixin, BasePyroHandler):
 
     APP_CLS = None
     INSTALL_CLS = None
-    _tasks = set()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.event_type = None
         self.params = None
         self.body = None
+        # The body is streamed so it never goes beyond
+        # settings.WEBHOOK_MAX_BODY_SIZE
+        self._body_chunks = []
+        self._body_size = 0
         self.events = {'push': self.handle_push,
                        'merge_request': self.handle_pull_request}
 
@@ -55,6 +87,11 @@ class BaseWebhookReceiver(LoggerMixin, BasePyroHandler):
     def get_repo_external_id(self):
         raise NotImplementedError
 
+    def get_pushed_branches(self):
+        """Returns a dictionary ``{branch_name: head_sha}`` with the
+        branches changed by a push."""
+        raise NotImplementedError
+
     def get_pull_request_source(self):
         raise NotImplementedError
 
@@ -64,6 +101,34 @@ class BaseWebhookReceiver(LoggerMixin, BasePyroHandler):
     def get_request_signature(self):
         raise NotImplementedError
 
+    def get_delivery_id(self):
+        """Returns the id of the delivery sent by the 3rd party service
+        or None if the service does not send one."""
+        return None
+
+    def get_trimmed_push_body(self):
+        """Returns a body for a push event with only the fields used by
+        :meth:`~toxicintegrations.webhook_receivers.BaseWebhookReceiver.handle_push`.
+        """
+        raise NotImplementedError
+
+    def trim_body(self):
+        """Returns the body with only the fields needed to handle the
+        event. Used for the bodies too big to be stored in the webhook
+        queue. Returns None if the body of the event can't be trimmed."""
+        if self.events[self.event_type] != self.handle_push:
+            return None
+        return self.get_trimmed_push_body()
+
+    def should_handle(self):
+        """Returns False for the events that don't change anything
+        for us, i.e. tag pushes and deleted branches. The pushed branches
+        are checked against the branches configured for the repository
+        when the push is handled."""
+        if self.events[self.event_type] == self.handle_push:
+            return bool(self.get_pushed_branches())
+        return True
+
     async def validate_webhook(self):
         token = self.get_request_signature()
         app = await self.APP_CLS.get_app()
@@ -74,48 +139,174 @@ class BaseWebhookReceiver(LoggerMixin, BasePyroHandler):
         return True
 
     def prepare(self):
+        # The body is only parsed after the webhook is validated
+        # so forged requests don't cost us a json parse.
         self.params = PyroRequest(self.request.arguments)
-        self._parse_body()
-        self.event_type = self.check_event_type()
+        max_size = _get_max_body_size()
+        length = self.request.headers.get('Content-Length')
+        if length and int(length) > max_size:
+            raise HTTPError(413)
+        self.request.connection.set_max_body_size(max_size)
+
+    async def data_received(self, chunk):
+        self._body_size += len(chunk)
+        if self._body_size > _get_max_body_size():
+            self._body_chunks = []
+            return
+
+        self._body_chunks.append(chunk)
+        await self.digest_chunk(chunk)
+
+    async def digest_chunk(self, chunk):
+        """Receives the chunks of the body as they arrive. Receivers
+        that check a signature of the body compute it here."""
+        pass
 
     @get('hello')
     def hello(self):
         return {'code': 200, 'msg': 'Hi there!'}
 
+    @get('health')
+    def health(self):
+        # The health check is served in the public webhook routes so
+        # the stats are only returned to who knows the health token.
+        if not self.is_health_authorized():
+            return {'code': 200}
+
+        return {'code': 200,
+                'install_cache': BaseIntegration.get_cache_stats(),
+                'response_cache': BaseIntegration.get_response_cache_stats(),
+                'tasks': task_supervisor.stats(),
+                'tokens': token_refresher.stats(),
+                'clones': clone_semaphore.stats(),
+                'app': self.get_app_status(),
+                'metrics': metrics.get_counters()}
+
+    def is_health_authorized(self):
+        """Returns True if the request has the header
+        ``Authorization: Token <settings.HEALTH_TOKEN>``. If
+        ``HEALTH_TOKEN`` is not set returns False."""
+        token = getattr(settings, 'HEALTH_TOKEN', None)
+        if not token:
+            return False
+
+        header = self.request.headers.get('Authorization', '')
+        expected = 'Token {}'.format(token)
+        return hmac.compare_digest(header.encode(), expected.encode())
+
+    def get_app_status(self):
+        """Returns information about the integration app for the
+        health check. The receivers that check their apps return the
+        result of the last check here."""
+        return None
+
     def create_installation(self, user):
         code = self.params.get('code')
         if not code:
             raise HTTPError(400)
 
-        return ensure_future(self.INSTALL_CLS.create(user, code=code))
+        return task_supervisor.submit(self.INSTALL_CLS.create(user, code=code))
 
     async def get_install(self):
         install_id = self.params.get('installation_id')
-        install = await self.INSTALL_CLS.objects.get(id=install_id)
+        install = await self.INSTALL_CLS.get_cached(id=install_id)
         return install
 
+    @classmethod
+    def from_delivery(cls, application, delivery):
+        """Returns a receiver for a delivery taken from the webhook
+        queue.
+
+        :param application: The web application.
+        :param delivery: A
+          :class:`~toxicintegrations.webhook_queue.WebhookDelivery`.
+        """
+        request = HTTPServerRequest(
+            method='POST', uri=delivery.uri,
+            headers=HTTPHeaders(delivery.headers), body=delivery.body,
+            connection=_DeliveryConnection())
+        receiver = cls(application, request)
+        receiver.prepare()
+        receiver._load_event()
+        return receiver
+
     @post('webhooks')
     async def receive_webhook(self):
+        """Validates the incomming webhook and puts it in the
+        webhook queue. The delivery is processed later by
+        :meth:`~toxicintegrations.webhook_receivers.BaseWebhookReceiver.process_webhook`.
+        """
 
+        self._finish_body()
         await self.validate_webhook()
+        self._load_event()
 
-        async def default_call():
+        if self.event_type not in self.events:
             raise HTTPError(400, 'What was that? {}'.format(self.event_type))
 
-        call = self.events.get(self.event_type, default_call)
+        if not self.should_handle():
+            self.log('Ignoring event_type {}'.format(self.event_type),
+                     level='debug')
+            metrics.incr('webhooks_ignored')
+            return {'code': 200, 'msg': '{} ignored'.format(self.event_type)}
+
+        receiver = type(self).__name__
+        delivery_id = self.get_delivery_id()
+        if delivery_id and not await WebhookDeliveryId.register(
+                receiver, delivery_id):
+            self.log('Dropping duplicated delivery {}'.format(delivery_id),
+                     level='debug')
+            metrics.incr('webhooks_duplicated')
+            return {'code': 200, 'msg': 'duplicated delivery'}
+
         self.log('event_type {} received'.format(self.event_type))
+        try:
+            self._trim_stored_body()
+            await WebhookDelivery.enqueue(receiver, self.request)
+        except Exception:
+            # so the delivery is not dropped when the service retries it.
+            if delivery_id:
+                await WebhookDeliveryId.unregister(receiver, delivery_id)
+            raise
+        metrics.incr('webhooks_queued')
+        self.set_status(202)
+        msg = '{} queued'.format(self.event_type)
+        return {'code': 202, 'msg': msg}
+
+    async def process_webhook(self):
+        """Handles a delivery according to its event type."""
+
+        call = self.events[self.event_type]
+        self.log('handling event_type {}'.format(self.event_type),
+                 level='debug')
         await call()
         msg = '{} handled successfully'.format(self.event_type)
-        return {'code': 200, 'msg': msg}
+        return msg
 
     async def handle_push(self):
         external_id = self.get_repo_external_id()
         install = await self.get_install()
-        t = ensure_future(install.update_repository(external_id))
-        type(self)._tasks.add(t)
-        t.add_done_callback(  # pragma no cover
-            lambda t: type(self)._tasks.remove(t))
-        return 'updating repo'
+        pushed = self.get_pushed_branches()
+        # if we can't tell which branches were pushed we update all them.
+        repo_branches = None
+        if pushed:
+            pushed = await install.get_wanted_branches(external_id, pushed)
+            if not pushed:
+                self.log(f'Push to {external_id} to branches not configured',
+                         level='debug')
+                metrics.incr('pushes_ignored')
+                return 'push ignored'
+
+            self.log(f'Push to {external_id}: {pushed}', level='debug')
+            repo_branches = {branch: {'notify_only_latest': True}
+                             for branch in pushed}
+        # Waits for the merged update so the delivery stays in the queue
+        # (and is retried) until the update is done. The future is shared
+        # with the other pushes merged in the update, so it is shielded
+        # and a cancelled delivery doesn't cancel the others.
+        await shield(install.schedule_update(external_id,
+                                             repo_branches=repo_branches))
+        return 'repository updated'
 
     async def handle_pull_request(self):
         install = await self.get_install()
@@ -149,7 +340,11 @@ class BaseWebhookReceiver(LoggerMixin, BasePyroHandler):
             url = '{}?redirect={}'.format(
                 settings.TOXICUI_LOGIN_URL, self.request.full_url())
         else:
-            self.create_installation(user)
+            try:
+                self.create_installation(user)
+            except TooManyTasks:
+                metrics.incr('tasks_refused')
+                raise HTTPError(503, 'Too many tasks. Try again later.')
             url = settings.TOXICUI_URL
 
         return self.redirect(url)
@@ -160,13 +355,55 @@ class BaseWebhookReceiver(LoggerMixin, BasePyroHandler):
             self.log('No cookie found.', level='debug')
             return
 
-        user_dict = json.loads(base64.decodebytes(cookie).decode('utf-8'))
+        user_dict = codec.loads(base64.decodebytes(cookie))
         user = await UserInterface.get(id=user_dict['id'])
         return user
 
+    def _finish_body(self):
+        if self._body_size > _get_max_body_size():
+            raise HTTPError(413)
+
+        if self._body_chunks:
+            self.request.body = b''.join(self._body_chunks)
+            self._body_chunks = []
+
+    def _trim_stored_body(self):
+        # The deliveries are stored in mongodb so the big bodies are
+        # stored only with the fields we need.
+        if len(self.request.body or b'') <= _get_max_stored_body_size():
+            return
+
+        body = self.trim_body()
+        if body is None:
+            self.log('Body of {} too large to be stored'.format(
+                self.event_type), level='error')
+            raise HTTPError(413)
+
+        self.log('Storing trimmed body for {}'.format(self.event_type),
+                 level='debug')
+        self.request.body = codec.dumps(body)
+
     def _parse_body(self):
         if self.request.body:
-            self.body = json.loads(self.request.body.decode())
+            self.body = codec.loads(self.request.body)
+
+    def _load_event(self):
+        try:
+            self._parse_body()
+        except ValueError:
+            raise HTTPError(400, 'Bad json body')
+        self.event_type = self.check_event_type()
+
+    def _get_branch_from_ref(self, ref):
+        # Only pushes to branches. Tags are refs/tags/<name>
+        prefix = 'refs/heads/'
+        if not ref or not ref.startswith(prefix):
+            return None
+        return ref[len(prefix):]
+
+    def _is_deleted_sha(self, sha):
+        # When a branch is deleted the new sha is all zeros.
+        return not sha or not sha.strip('0')
 
 
 class BitbucketWebhookReceiver(BaseWebhookReceiver):
@@ -174,15 +411,46 @@ class BitbucketWebhookReceiver(BaseWebhookReceiver):
     APP_CLS = BitbucketApp
     INSTALL_CLS = BitbucketIntegration
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events = {'repo:push': self.handle_push}
+
     def check_event_type(self):
         return self.request.headers.get('X-Event-Key')
 
     def get_request_signature(self):
         return self.params.get('token')
 
+    def get_delivery_id(self):
+        return self.request.headers.get('X-Request-UUID')
+
     def get_external_id(self):
         return self.body['repository']['uuid']
 
+    def get_repo_external_id(self):
+        return self.get_external_id()
+
+    def get_pushed_branches(self):
+        pushed = {}
+        for change in self.body['push']['changes']:
+            # new is null when a branch is deleted
+            new = change.get('new')
+            if not new or new['type'] != 'branch':
+                continue
+            pushed[new['name']] = new['target']['hash']
+        return pushed
+
+    def get_trimmed_push_body(self):
+        changes = []
+        for change in self.body['push']['changes']:
+            new = change.get('new')
+            if new:
+                new = {'type': new['type'], 'name': new['name'],
+                       'target': {'hash': new['target']['hash']}}
+            changes.append({'new': new})
+        return {'repository': {'uuid': self.get_external_id()},
+                'push': {'changes': changes}}
+
     def get_pull_request_source(self):
         attrs = self.body['source']
         return {'name': attrs['repository']['name'],
@@ -232,9 +500,37 @@ class GitlabWebhookReceiver(BaseWebhookReceiver):
     def get_repo_external_id(self):
         return self.body['project']['id']
 
+    def get_pushed_branches(self):
+        branch = self._get_branch_from_ref(self.body.get('ref'))
+        sha = self.body.get('after')
+        if not branch or self._is_deleted_sha(sha):
+            return {}
+        return {branch: sha}
+
+    def get_trimmed_push_body(self):
+        return {'object_kind': self.body['object_kind'],
+                'ref': self.body.get('ref'),
+                'after': self.body.get('after'),
+                'project': {'id': self.get_repo_external_id()}}
+
+    def should_handle(self):
+        if self.event_type != 'merge_request':
+            return super().should_handle()
+
+        # merge requests are updated when the title, labels and so on
+        # change. We only want new merge requests and new commits.
+        attrs = self.body['object_attributes']
+        action = attrs.get('action')
+        if action in ('open', 'reopen'):
+            return True
+        return action == 'update' and 'oldrev' in attrs
+
     def get_request_signature(self):
         return self.request.headers.get('X-Gitlab-Token')
 
+    def get_delivery_id(self):
+        return self.request.headers.get('X-Gitlab-Event-UUID')
+
     def get_pull_request_source(self):
         attrs = self.body['object_attributes']
         return {'name': attrs['source']['name'],
@@ -256,6 +552,7 @@ class GithubWebhookReceiver(BaseWebhookReceiver):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self._digest = None
         handle_repo_removed = self._handle_install_repo_removed
         handle_repo_added = self._handle_install_repo_added
         self.events = {
@@ -274,7 +571,7 @@ class GithubWebhookReceiver(BaseWebhookReceiver):
         if not githubapp_id:
             raise HTTPError(400)
 
-        ensure_future(GithubIntegration.create(
+        return task_supervisor.submit(GithubIntegration.create(
             user, github_id=githubapp_id))
 
     async def _handle_ping(self):  # pragma no cover
@@ -285,22 +582,39 @@ class GithubWebhookReceiver(BaseWebhookReceiver):
 
     async def get_install(self):
         install_id = self.body['installation']['id']
-        install = await GithubIntegration.objects.get(github_id=install_id)
+        install = await GithubIntegration.get_cached(github_id=install_id)
         return install
 
     def get_repo_external_id(self):
         repo_github_id = self.body['repository']['id']
         return repo_github_id
 
+    def get_pushed_branches(self):
+        branch = self._get_branch_from_ref(self.body.get('ref'))
+        sha = self.body.get('after')
+        if not branch or self.body.get('deleted') or \
+           self._is_deleted_sha(sha):
+            return {}
+        return {branch: sha}
+
+    def get_trimmed_push_body(self):
+        return {'ref': self.body.get('ref'),
+                'after': self.body.get('after'),
+                'deleted': self.body.get('deleted'),
+                'repository': {'id': self.get_repo_external_id()},
+                'installation': {'id': self.body['installation']['id']}}
+
+    def get_delivery_id(self):
+        return self.request.headers.get('X-GitHub-Delivery')
+
     async def _handle_install_repo_added(self):
         install = await self.get_install()
-        tasks = []
-        for repo_info in self.body['repositories_added']:
-            t = ensure_future(self._get_and_import_repo(
-                install, repo_info['full_name']))
-            tasks.append(t)
-
-        return tasks
+        # only one task for all the repositories, so a retried delivery
+        # does not import again the repositories already submitted and
+        # a big batch is not refused by the queue.
+        return task_supervisor.submit_batch([
+            self._get_and_import_repo(install, repo_info['full_name'])
+            for repo_info in self.body['repositories_added']])
 
     async def _get_and_import_repo(self, install, repo_full_name):
         repo_full_info = await install.get_repo(repo_full_name)
@@ -308,8 +622,9 @@ class GithubWebhookReceiver(BaseWebhookReceiver):
 
     async def _handle_install_repo_removed(self):
         install = await self.get_install()
-        for repo_info in self.body['repositories_removed']:
-            ensure_future(install.remove_repository(repo_info['id']))
+        return task_supervisor.submit_batch([
+            install.remove_repository(repo_info['id'])
+            for repo_info in self.body['repositories_removed']])
 
     def get_pull_request_source(self):
         head = self.body['pull_request']['head']
@@ -331,19 +646,32 @@ class GithubWebhookReceiver(BaseWebhookReceiver):
         repo_id = self.body['repository']['id']
         branch = check_suite['head_branch']
         named_tree = check_suite['head_sha']
-        ensure_future(install.repo_request_build(repo_id, branch, named_tree))
+        task_supervisor.submit(
+            install.repo_request_build(repo_id, branch, named_tree))
 
     async def _handle_install_deleted(self):
         install = await self.get_install()
         user = UserInterface(None, {'id': install.user_id})
         await install.delete(user)
 
+    def get_app_status(self):
+        return GithubApp.get_identity_status()
+
+    async def digest_chunk(self, chunk):
+        if self._digest is None:
+            app = await GithubApp.get_app()
+            self._digest = app.get_digest()
+        self._digest.update(chunk)
+
     async def validate_webhook(self):
         signature = self.request.headers.get('X-Hub-Signature')
         app = await GithubApp.get_app()
 
         try:
-            app.validate_token(signature, self.request.body)
+            if self._digest is not None:
+                app.validate_digest(signature, self._digest)
+            else:
+                app.validate_token(signature, self.request.body)
         except BadSignature:
             raise HTTPError(403, 'Bad signature')
 
@@ -360,6 +688,23 @@ class GithubWebhookReceiver(BaseWebhookReceiver):
         return event_type
 
 
+RECEIVERS = {cls.__name__: cls for cls in (GithubWebhookReceiver,
+                                            GitlabWebhookReceiver,
+                                            BitbucketWebhookReceiver)}
+
+
+async def process_delivery(delivery):
+    """Processes a delivery from the webhook queue using the receiver
+    that accepted it.
+
+    :param delivery: A
+      :class:`~toxicintegrations.webhook_queue.WebhookDelivery`.
+    """
+    receiver_cls = RECEIVERS[delivery.receiver]
+    receiver = receiver_cls.from_delivery(app, delivery)
+    await receiver.process_webhook()
+
+
 gh_url = URLSpec('/github/(.*)', GithubWebhookReceiver)
 gl_url = URLSpec('/gitlab/(.*)', GitlabWebhookReceiver)
 bb_url = URLSpec('/bitbucket/(.*)', BitbucketWebhookReceiver)